@@ -0,0 +1,428 @@
+# app/agent/appointments.py
+import os
+import sqlite3
+from datetime import datetime
+
+import pandas as pd
+
+from agent.availability import to_unit, units_for
+
+DB_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "appointments.db")
+LEGACY_XLSX_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "appointments.xlsx")
+
+# Columns in the order they appear in the Excel export
+COLUMNS = [
+    "first_name", "last_name", "dob", "email", "phone",
+    "insurance_company", "member_id", "group_number",
+    "date", "time", "doctor", "duration",
+    "form_sent", "form_filled", "status", "notes",
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS appointments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    first_name TEXT, last_name TEXT, dob TEXT,
+    email TEXT, phone TEXT, insurance_company TEXT,
+    member_id TEXT, group_number TEXT,
+    date TEXT NOT NULL, time TEXT NOT NULL, doctor TEXT NOT NULL,
+    duration INTEGER,
+    form_sent INTEGER DEFAULT 0, form_filled INTEGER DEFAULT 0,
+    status TEXT DEFAULT 'Scheduled', notes TEXT,
+    created_at TEXT, updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_appt_date ON appointments(date, time);
+CREATE INDEX IF NOT EXISTS idx_appt_doctor ON appointments(doctor, date);
+CREATE INDEX IF NOT EXISTS idx_appt_patient ON appointments(last_name, first_name, dob);
+CREATE INDEX IF NOT EXISTS idx_appt_status ON appointments(status, date, time);
+
+-- One row per booked 5-minute unit; the primary key makes claiming a range
+-- an atomic compare-and-swap across every process sharing the file.
+CREATE TABLE IF NOT EXISTS slot_claims (
+    doctor TEXT NOT NULL, date TEXT NOT NULL, unit INTEGER NOT NULL,
+    appointment_id INTEGER NOT NULL,
+    PRIMARY KEY (doctor, date, unit)
+);
+CREATE INDEX IF NOT EXISTS idx_claims_appt ON slot_claims(appointment_id);
+
+-- Change log so other processes can refresh just the doctor-days that moved
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    doctor TEXT NOT NULL, date TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_changes_day ON changes(doctor, date);
+CREATE INDEX IF NOT EXISTS idx_changes_date ON changes(date);
+"""
+
+DEFAULT_DURATION = 30  # minutes claimed by rows without one until a schedule sets its slot length
+
+# Admin view sort orders: name -> key columns (the last one is always unique)
+SORT_KEYS = {
+    "date": ["date", "time", "id"],
+    "doctor": ["doctor", "date", "time", "id"],
+    "patient": ["COALESCE(last_name, '')", "COALESCE(first_name, '')", "id"],
+    "created": ["COALESCE(created_at, '')", "id"],
+    "id": ["id"],
+}
+STATUS_FILTERS = ["Scheduled", "Cancelled", "Blocked"]
+
+
+class SlotConflict(Exception):
+    """Raised when part of the requested range is already claimed."""
+
+    def __init__(self, doctor, date, time, holders=()):
+        self.doctor, self.date, self.time = doctor, date, time
+        self.holders = sorted(set(holders))  # appointment ids that hold the range
+        super().__init__(f"{doctor} {date} {time} overlaps appointment(s) {self.holders}")
+
+
+def _claim_units(time, duration):
+    start = to_unit(time)
+    return range(start, start + units_for(duration or DEFAULT_DURATION))
+
+
+def _now():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def _clean(value):
+    # pandas NaN / numpy scalars -> plain python values sqlite understands
+    if value is None:
+        return None
+    try:
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    return value.item() if hasattr(value, "item") else value
+
+
+class AppointmentRepository:
+    """
+    SQLite-backed appointment store.
+    Bookings and cancellations are single-row transactions; Excel is only
+    produced on demand through export_excel().
+    """
+
+    def __init__(self, path: str = DB_PATH, legacy_xlsx: str = LEGACY_XLSX_PATH):
+        self.path = path
+        self.default_duration = None  # the schedule's slot length once known, see use_slot_length()
+        is_new = not os.path.exists(self.path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executescript(SCHEMA)
+                if conn.execute("SELECT 1 FROM slot_claims LIMIT 1").fetchone() is None:
+                    self._claim_existing(conn)  # databases created before slot claims existed
+        finally:
+            conn.close()
+        # One-time migration of the old workbook
+        if is_new and legacy_xlsx and os.path.exists(legacy_xlsx):
+            self.import_excel(legacy_xlsx)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _query(self, sql, params=()):
+        conn = self._connect()
+        try:
+            return [dict(r) for r in conn.execute(sql, params).fetchall()]
+        finally:
+            conn.close()
+
+    # ---------- writes ----------
+    def add(self, record: dict) -> int:
+        """
+        Claim the record's time range and insert it in one transaction.
+        Returns the new id; raises SlotConflict if any unit is already taken.
+        """
+        values = {c: _clean(record.get(c)) for c in COLUMNS}
+        if values["status"] is None:
+            values["status"] = "Scheduled"
+        values["duration"] = values["duration"] or self.default_duration
+        now = _now()
+        cols = COLUMNS + ["created_at", "updated_at"]
+        params = [values[c] for c in COLUMNS] + [now, now]
+        doctor, date, time = values["doctor"], values["date"], values["time"]
+        conn = self._connect()
+        try:
+            with conn:
+                cur = conn.execute(
+                    f"INSERT INTO appointments ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+                    params,
+                )
+                appt_id = cur.lastrowid
+                units = _claim_units(time, values["duration"])
+                try:
+                    conn.executemany(
+                        "INSERT INTO slot_claims (doctor, date, unit, appointment_id) VALUES (?, ?, ?, ?)",
+                        [(doctor, date, u, appt_id) for u in units],
+                    )
+                except sqlite3.IntegrityError:
+                    holders = [r[0] for r in conn.execute(
+                        "SELECT appointment_id FROM slot_claims WHERE doctor = ? AND date = ? "
+                        "AND unit BETWEEN ? AND ? AND appointment_id != ?",
+                        (doctor, date, units[0], units[-1], appt_id)
+                    )]
+                    raise SlotConflict(doctor, date, time, holders)
+                conn.execute("INSERT INTO changes (doctor, date) VALUES (?, ?)", (doctor, date))
+            return appt_id
+        finally:
+            conn.close()
+
+    def cancel(self, appt_id: int, reason: str = None):
+        """Mark an appointment cancelled and release its claims. Returns the updated row, or None if not found."""
+        status = f"Cancelled by Doctor - {reason or 'No reason provided'}"
+        conn = self._connect()
+        try:
+            with conn:
+                cur = conn.execute(
+                    "UPDATE appointments SET status = ?, updated_at = ? WHERE id = ?",
+                    (status, _now(), int(appt_id)),
+                )
+                if cur.rowcount == 0:
+                    return None
+                freed = conn.execute("DELETE FROM slot_claims WHERE appointment_id = ?", (int(appt_id),))
+                if freed.rowcount:
+                    conn.execute(
+                        "INSERT INTO changes (doctor, date) SELECT doctor, date FROM appointments WHERE id = ?",
+                        (int(appt_id),),
+                    )
+        finally:
+            conn.close()
+        return self.get(appt_id)
+
+    def import_excel(self, path: str) -> int:
+        """Bulk-load rows from an appointments workbook. Returns rows imported."""
+        df = pd.read_excel(path)
+        return self.import_records(df.to_dict(orient="records"))
+
+    def import_records(self, records) -> int:
+        """Bulk-load appointment dicts in one transaction (claims are created for active ones)."""
+        now = _now()
+        cols = COLUMNS + ["created_at", "updated_at"]
+        rows = [[_clean(r.get(c)) for c in COLUMNS] + [now, now] for r in records]
+        at = COLUMNS.index("duration")
+        for row in rows:
+            row[at] = row[at] or self.default_duration
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    f"INSERT INTO appointments ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+                    rows,
+                )
+                self._claim_existing(conn)
+        finally:
+            conn.close()
+        return len(rows)
+
+    def _claim_existing(self, conn):
+        """Create claims for active appointments that have none (migrations, imports)."""
+        active = conn.execute(
+            "SELECT id, doctor, date, time, duration FROM appointments a "
+            "WHERE status NOT LIKE 'Cancelled%' "
+            "AND NOT EXISTS (SELECT 1 FROM slot_claims c WHERE c.appointment_id = a.id) ORDER BY id"
+        ).fetchall()
+        # Legacy workbooks may hold double bookings; the first one keeps the claim
+        conn.executemany(
+            "INSERT OR IGNORE INTO slot_claims (doctor, date, unit, appointment_id) VALUES (?, ?, ?, ?)",
+            [(r["doctor"], r["date"], u, r["id"])
+             for r in active for u in _claim_units(r["time"], r["duration"])],
+        )
+
+    def use_slot_length(self, minutes: int) -> int:
+        """
+        Make the schedule's slot length the visit length of rows without one:
+        new rows store it explicitly, and active rows stored without a duration
+        (legacy workbooks, imports) get it too, claiming the rest of their slot.
+        Returns the number of rows updated.
+        """
+        self.default_duration = minutes
+        conn = self._connect()
+        try:
+            with conn:
+                rows = conn.execute(
+                    "SELECT id, doctor, date, time FROM appointments "
+                    "WHERE duration IS NULL AND status NOT LIKE 'Cancelled%'"
+                ).fetchall()
+                if not rows:
+                    return 0
+                conn.execute(
+                    "UPDATE appointments SET duration = ? WHERE duration IS NULL AND status NOT LIKE 'Cancelled%'",
+                    (minutes,),
+                )
+                # as in _claim_existing: a range already held by another row stays with it
+                conn.executemany(
+                    "INSERT OR IGNORE INTO slot_claims (doctor, date, unit, appointment_id) VALUES (?, ?, ?, ?)",
+                    [(r["doctor"], r["date"], u, r["id"]) for r in rows for u in _claim_units(r["time"], minutes)],
+                )
+                conn.executemany("INSERT INTO changes (doctor, date) VALUES (?, ?)",
+                                 sorted({(r["doctor"], r["date"]) for r in rows}))
+            return len(rows)
+        finally:
+            conn.close()
+
+    # ---------- reads ----------
+    def get(self, appt_id: int):
+        rows = self._query("SELECT * FROM appointments WHERE id = ?", (int(appt_id),))
+        return rows[0] if rows else None
+
+    def by_date(self, date: str):
+        return self._query("SELECT * FROM appointments WHERE date = ? ORDER BY time", (date,))
+
+    def by_doctor(self, doctor: str, date: str = None):
+        if date:
+            return self._query(
+                "SELECT * FROM appointments WHERE doctor = ? AND date = ? ORDER BY time", (doctor, date)
+            )
+        return self._query("SELECT * FROM appointments WHERE doctor = ? ORDER BY date, time", (doctor,))
+
+    def by_patient(self, first_name: str, last_name: str, dob: str = None):
+        sql = ("SELECT * FROM appointments WHERE last_name = ? COLLATE NOCASE "
+               "AND first_name = ? COLLATE NOCASE")
+        params = [last_name.strip(), first_name.strip()]
+        if dob:
+            sql += " AND dob = ?"
+            params.append(dob)
+        return self._query(sql + " ORDER BY date, time", params)
+
+    def booked_keys(self):
+        """(date, time, doctor) of every appointment that is not cancelled."""
+        rows = self._query(
+            "SELECT date, time, doctor FROM appointments WHERE status NOT LIKE 'Cancelled%'"
+        )
+        return {(r["date"], r["time"], r["doctor"]) for r in rows}
+
+    def booked_ranges(self):
+        """(date, time, doctor, duration) of every appointment that is not cancelled."""
+        rows = self._query(
+            "SELECT date, time, doctor, duration FROM appointments WHERE status NOT LIKE 'Cancelled%'"
+        )
+        return [(r["date"], r["time"], r["doctor"], r["duration"]) for r in rows]
+
+    def claimed_units(self, doctor: str, date: str):
+        """Units of one doctor-day currently held by appointments."""
+        rows = self._query("SELECT unit FROM slot_claims WHERE doctor = ? AND date = ?", (doctor, date))
+        return [r["unit"] for r in rows]
+
+    def last_change(self) -> int:
+        rows = self._query("SELECT COALESCE(MAX(seq), 0) AS seq FROM changes")
+        return rows[0]["seq"]
+
+    def changes_since(self, seq: int):
+        """Return (latest seq, {(doctor, date), ...}) changed after `seq`."""
+        rows = self._query("SELECT seq, doctor, date FROM changes WHERE seq > ? ORDER BY seq", (seq,))
+        if not rows:
+            return seq, set()
+        return rows[-1]["seq"], {(r["doctor"], r["date"]) for r in rows}
+
+    def _feed_filter(self, doctor=None, date=None):
+        clauses, params = [], []
+        if doctor:
+            clauses.append("doctor = ?")
+            params.append(doctor)
+        if date:
+            clauses.append("date = ?")
+            params.append(date)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def iter_appointments(self, doctor: str = None, date: str = None, batch_size: int = 500):
+        """Stream appointments (optionally one doctor and/or day) without loading them all."""
+        where, params = self._feed_filter(doctor, date)
+        conn = self._connect()
+        try:
+            cur = conn.execute(f"SELECT * FROM appointments{where} ORDER BY date, time, id", params)
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                for r in rows:
+                    yield dict(r)
+        finally:
+            conn.close()
+
+    def feed_version(self, doctor: str = None, date: str = None):
+        """(row count, last update, last change seq) for a feed; changes whenever the feed would."""
+        where, params = self._feed_filter(doctor, date)
+        stats = self._query(f"SELECT COUNT(*) AS n, MAX(updated_at) AS updated FROM appointments{where}", params)[0]
+        seq = self._query(f"SELECT MAX(seq) AS seq FROM changes{where}", params)[0]["seq"]
+        return stats["n"], stats["updated"], seq
+
+    def _query_filter(self, date_from=None, date_to=None, doctor=None, status=None, patient=None):
+        clauses, params = [], []
+        if date_from:
+            clauses.append("date >= ?")
+            params.append(date_from)
+        if date_to:
+            clauses.append("date <= ?")
+            params.append(date_to)
+        if doctor:
+            clauses.append("doctor = ?")
+            params.append(doctor)
+        if status == "Cancelled":
+            clauses.append("status LIKE 'Cancelled%'")  # carries the reason after a dash
+        elif status:
+            clauses.append("status = ?")
+            params.append(status)
+        terms = (patient or "").split()
+        if terms:
+            # "smi" matches either name; "john smi" matches first + last prefixes
+            if len(terms) >= 2:
+                clauses.append("first_name LIKE ? AND last_name LIKE ?")
+                params += [terms[0] + "%", " ".join(terms[1:]) + "%"]
+            else:
+                clauses.append("(last_name LIKE ? OR first_name LIKE ?)")
+                params += [terms[0] + "%"] * 2
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def query(self, date_from: str = None, date_to: str = None, doctor: str = None,
+              status: str = None, patient: str = None, sort: str = "date",
+              descending: bool = False, after=None, limit: int = 50, with_sort_keys: bool = False):
+        """
+        One page of appointments, filtered and ordered in SQLite.
+        Keyset pagination: pass the returned cursor as `after` to get the next
+        page; cost stays proportional to the page, not to the history.
+        Returns (rows, next_cursor); next_cursor is None on the last page.
+        with_sort_keys leaves each row's sort key in "_sort_key" (for merging pages).
+        """
+        keys = SORT_KEYS[sort]
+        where, params = self._query_filter(date_from, date_to, doctor, status, patient)
+        if after is not None:
+            op = "<" if descending else ">"
+            seek = f"({', '.join(keys)}) {op} ({', '.join('?' * len(keys))})"
+            where += (" AND " if where else " WHERE ") + seek
+            params = params + list(after)
+        direction = " DESC" if descending else ""
+        order = ", ".join(k + direction for k in keys)
+        cols = ", ".join(f"{k} AS _k{i}" for i, k in enumerate(keys))
+        rows = self._query(
+            f"SELECT *, {cols} FROM appointments{where} ORDER BY {order} LIMIT ?",
+            params + [limit + 1],
+        )
+        more = len(rows) > limit
+        rows = rows[:limit]
+        cursor = tuple(rows[-1][f"_k{i}"] for i in range(len(keys))) if more else None
+        for r in rows:
+            key = tuple(r.pop(f"_k{i}") for i in range(len(keys)))
+            if with_sort_keys:
+                r["_sort_key"] = key
+        return rows, cursor
+
+    def count(self, date_from: str = None, date_to: str = None, doctor: str = None,
+              status: str = None, patient: str = None) -> int:
+        where, params = self._query_filter(date_from, date_to, doctor, status, patient)
+        return self._query(f"SELECT COUNT(*) AS n FROM appointments{where}", params)[0]["n"]
+
+    def to_dataframe(self):
+        rows = self._query("SELECT * FROM appointments ORDER BY id")
+        return pd.DataFrame(rows, columns=["id"] + COLUMNS + ["created_at", "updated_at"])
+
+    def export_excel(self, target):
+        """Write all appointments to an .xlsx path or binary buffer."""
+        df = self.to_dataframe()
+        df.to_excel(target, index=False, engine="openpyxl")
+        return target
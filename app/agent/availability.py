@@ -0,0 +1,301 @@
+import itertools
+from collections import defaultdict
+
+UNIT_MINUTES = 5                 # bitmap granularity
+DEFAULT_SLOT_MINUTES = 30        # used when the schedule has a single slot per day
+
+_index_ids = itertools.count(1)
+
+
+def to_unit(time_str: str) -> int:
+    """"HH:MM" -> index of the 5-minute unit it starts."""
+    h, m = str(time_str).split(":")[:2]
+    return (int(h) * 60 + int(m)) // UNIT_MINUTES
+
+
+def to_time(unit: int) -> str:
+    minutes = unit * UNIT_MINUTES
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def units_for(minutes: int) -> int:
+    return max(1, -(-int(minutes) // UNIT_MINUTES))  # ceil
+
+
+def range_mask(start: int, n_units: int) -> int:
+    return ((1 << n_units) - 1) << start
+
+
+def run_starts_mask(bits: int, n_units: int) -> int:
+    """
+    Bit i of the result is set iff bits i .. i+n_units-1 are all set.
+    Uses O(log n) shift-and passes over the whole day instead of a per-unit scan.
+    """
+    m = bits
+    have = 1
+    while have < n_units:
+        step = min(have, n_units - have)
+        m &= m >> step
+        have += step
+    return m
+
+
+class DayBitmap:
+    """One doctor-day: bit i <-> the 5-minute unit starting at i * UNIT_MINUTES."""
+
+    __slots__ = ("open_bits", "free_bits", "starts")
+
+    def __init__(self):
+        self.open_bits = 0   # units the schedule makes available
+        self.free_bits = 0   # open units that are not booked
+        self.starts = []     # sorted units at which the schedule offers a slot
+
+    def free_starts(self, n_units: int):
+        runs = run_starts_mask(self.free_bits, n_units)
+        return [u for u in self.starts if (runs >> u) & 1]
+
+    def is_free(self, start: int, n_units: int) -> bool:
+        mask = range_mask(start, n_units)
+        return self.free_bits & mask == mask
+
+    def book(self, start: int, n_units: int) -> bool:
+        """Clear a whole range, or nothing if any unit is taken."""
+        mask = range_mask(start, n_units)
+        if self.free_bits & mask != mask:
+            return False
+        self.free_bits &= ~mask
+        return True
+
+    def release(self, start: int, n_units: int) -> bool:
+        mask = range_mask(start, n_units) & self.open_bits
+        if not mask or self.free_bits & mask == mask:
+            return False
+        self.free_bits |= mask
+        return True
+
+    def reset(self, taken_units):
+        """Recompute free time from the full set of taken units."""
+        taken = 0
+        for u in taken_units:
+            taken |= 1 << u
+        self.free_bits = self.open_bits & ~taken
+
+
+class AvailabilityIndex:
+    """
+    In-memory availability keyed by (doctor, date), one DayBitmap per key.
+    Built once from the doctor schedule and the booked appointments, then kept
+    in sync through book() / release() so slot queries never touch the files.
+    """
+
+    def __init__(self, slot_minutes: int = DEFAULT_SLOT_MINUTES):
+        self.slot_minutes = slot_minutes
+        self.uid = next(_index_ids)          # (uid, version) names one state of one index
+        self.version = 0                     # bumped on every change to free/offered time
+        self._days = {}                      # (doctor, date) -> DayBitmap
+        self._by_date = defaultdict(list)    # date -> doctors with a schedule that day
+        self._by_doctor = defaultdict(list)  # doctor -> dates with a schedule for that doctor
+
+    @classmethod
+    def build(cls, schedule_rows, booked=()):
+        """
+        schedule_rows: iterable of (doctor, date, time, available)
+        booked: iterable of (date, time, doctor) or (date, time, doctor, duration)
+        """
+        rows = [(doctor, date, to_unit(time), available) for doctor, date, time, available in schedule_rows]
+        return cls._from_units(rows, booked)
+
+    @classmethod
+    def build_from_store(cls, store, booked=()):
+        """Same as build(), reading a ScheduleStore's columns (minutes, not "HH:MM" strings)."""
+        rows = [(doctor, date, minute // UNIT_MINUTES, available)
+                for doctor, date, minute, available in store.iter_rows()]
+        return cls._from_units(rows, booked)
+
+    @classmethod
+    def _from_units(cls, rows, booked):
+        index = cls(slot_minutes=cls._infer_slot_minutes(rows))
+        slot_units = units_for(index.slot_minutes)
+        for doctor, date, start, available in rows:
+            day = index._day(doctor, date, create=True)
+            if available:
+                mask = range_mask(start, slot_units)
+                day.open_bits |= mask
+                day.free_bits |= mask
+                day.starts.append(start)
+        for day in index._days.values():
+            day.starts = sorted(set(day.starts))
+        for key in booked:
+            date, time, doctor = key[:3]
+            duration = key[3] if len(key) > 3 and key[3] else index.slot_minutes
+            day = index._days.get((doctor, date))
+            if day is not None:
+                day.free_bits &= ~range_mask(to_unit(time), units_for(duration))
+        return index
+
+    @staticmethod
+    def _infer_slot_minutes(rows):
+        """Smallest gap between consecutive slot starts on any doctor-day."""
+        per_day = defaultdict(set)
+        for doctor, date, start, _ in rows:
+            per_day[(doctor, date)].add(start)
+        gap = None
+        for starts in per_day.values():
+            s = sorted(starts)
+            for a, b in zip(s, s[1:]):
+                gap = b - a if gap is None else min(gap, b - a)
+        return gap * UNIT_MINUTES if gap else DEFAULT_SLOT_MINUTES
+
+    def _day(self, doctor, date, create=False):
+        day = self._days.get((doctor, date))
+        if day is None and create:
+            day = self._days[(doctor, date)] = DayBitmap()
+            self._by_date[date].append(doctor)
+            self._by_doctor[doctor].append(date)
+        return day
+
+    def _lookup(self, doctor, date):
+        return self._days.get((doctor, date))
+
+    def _keys(self, date=None, doctor=None):
+        if date is not None and doctor is not None:
+            return [(doctor, date)] if (doctor, date) in self._days else []
+        if date is not None:
+            return [(d, date) for d in self._by_date.get(date, [])]
+        if doctor is not None:
+            return [(doctor, dt) for dt in self._by_doctor.get(doctor, [])]
+        return list(self._days.keys())
+
+    def slots(self, date=None, doctor=None, minutes=None):
+        """
+        Return slot starts that have `minutes` (default: one slot) of contiguous
+        free time, optionally restricted to a date and/or doctor.
+        """
+        n_units = units_for(minutes or self.slot_minutes)
+        out = []
+        for doc, day_str in self._keys(date, doctor):
+            for u in self._lookup(doc, day_str).free_starts(n_units):
+                out.append({"doctor": doc, "date": day_str, "time": to_time(u), "available": True})
+        return out
+
+    def free_runs(self, date, doctor, minutes):
+        """Every 5-minute-aligned start with `minutes` of contiguous free time."""
+        day = self._lookup(doctor, date)
+        if day is None:
+            return []
+        runs = run_starts_mask(day.free_bits, units_for(minutes))
+        out = []
+        while runs:
+            low = runs & -runs
+            out.append(to_time(low.bit_length() - 1))
+            runs ^= low
+        return out
+
+    def reset_day(self, date, doctor, taken_units):
+        """Replace one doctor-day's booked units (e.g. with another process's view)."""
+        day = self._days.get((doctor, date))
+        if day is not None:
+            day.reset(taken_units)
+        # even when the day isn't cached: results computed before it was evicted are stale too
+        self.version += 1
+
+    def set_offered(self, date, time, doctor, offered: bool, taken_units=()):
+        """
+        Add or withdraw one schedule slot, then recompute the day's free time
+        from `taken_units` (the doctor-day's booked units).
+        """
+        day = self._day(doctor, date, create=offered)
+        if day is None:
+            return
+        start = to_unit(time)
+        mask = range_mask(start, units_for(self.slot_minutes))
+        if offered:
+            day.open_bits |= mask
+            if start not in day.starts:
+                day.starts = sorted(day.starts + [start])
+        else:
+            day.open_bits &= ~mask
+            day.starts = [u for u in day.starts if u != start]
+        day.reset(taken_units)
+        self.version += 1
+
+    def free_bits(self, date, doctor) -> int:
+        """The doctor-day's free-unit bitmap (0 when unscheduled); a plain int, safe to copy."""
+        day = self._lookup(doctor, date)
+        return day.free_bits if day is not None else 0
+
+    def offers(self, date, time, doctor) -> bool:
+        """Is `time` one of the slot starts the schedule offers for the doctor-day?"""
+        day = self._lookup(doctor, date)
+        if day is None:
+            return False
+        h, m = str(time).split(":")[:2]
+        minute = int(h) * 60 + int(m)
+        return minute % UNIT_MINUTES == 0 and minute // UNIT_MINUTES in day.starts
+
+    def is_free(self, date, time, doctor, minutes=None):
+        day = self._lookup(doctor, date)
+        return day is not None and day.is_free(to_unit(time), units_for(minutes or self.slot_minutes))
+
+    def book(self, date, time, doctor, minutes=None):
+        """Atomically take `minutes` starting at `time`. Returns False if any part is taken."""
+        day = self._lookup(doctor, date)
+        if day is None:
+            return False
+        self.version += 1
+        return day.book(to_unit(time), units_for(minutes or self.slot_minutes))
+
+    def release(self, date, time, doctor, minutes=None):
+        """Give a booked range back (e.g. after a cancellation)."""
+        day = self._lookup(doctor, date)
+        if day is None:
+            return False
+        self.version += 1
+        return day.release(to_unit(time), units_for(minutes or self.slot_minutes))
+
+
+class LazyAvailabilityIndex(AvailabilityIndex):
+    """
+    AvailabilityIndex over a recurring schedule (see availability_templates):
+    a doctor-day's bitmap is expanded from the source the first time it is
+    queried, with its booked units from `claimed(doctor, date)`, and dropped
+    again once MAX_CACHED_DAYS newer ones have been built. Open queries
+    (no date) cover the source's window() only.
+    """
+
+    MAX_CACHED_DAYS = 20_000
+
+    def __init__(self, source, claimed):
+        super().__init__(slot_minutes=source.slot_minutes)
+        self.source = source
+        self.claimed = claimed
+
+    def _lookup(self, doctor, date):
+        day = self._days.get((doctor, date))
+        if day is None:
+            starts = self.source.day_starts(doctor, date)
+            if not starts:
+                return None
+            day = DayBitmap()
+            for minute, slot_minutes in starts:
+                start = minute // UNIT_MINUTES
+                day.open_bits |= range_mask(start, units_for(slot_minutes))
+                day.starts.append(start)
+            day.reset(self.claimed(doctor, date))
+            if len(self._days) >= self.MAX_CACHED_DAYS:
+                self._days.pop(next(iter(self._days)))  # oldest first; rebuilt on demand
+            self._days[(doctor, date)] = day
+        return day
+
+    def _keys(self, date=None, doctor=None):
+        dates = [date] if date is not None else self.source.window()
+        doctors = [doctor] if doctor is not None else self.source.doctors()
+        return [(doc, d) for d in dates for doc in doctors if self._lookup(doc, d) is not None]
+
+    def invalidate(self, doctor=None, date_from=None, date_to=None):
+        """Forget cached days (of one doctor and/or a date range) after the source changed."""
+        for key in [k for k in self._days
+                    if (doctor is None or k[0] == doctor)
+                    and (date_from is None or k[1] >= date_from) and (date_to is None or k[1] <= date_to)]:
+            del self._days[key]
+        self.version += 1
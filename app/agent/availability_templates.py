@@ -0,0 +1,237 @@
+# app/agent/availability_templates.py
+"""
+Recurring doctor availability: weekly templates plus blocked ranges (leave,
+holidays, one-off blocks), stored in app/data/availability.json and expanded
+one doctor-day at a time when the slot index asks for it. Nothing is
+materialized per day, so memory and load time follow the number of
+templates and blocks rather than days x doctors x slots.
+
+    {"horizon_days": 14,
+     "templates": [{"doctor": "Smith", "weekdays": [0, 1, 2, 3, 4],
+                    "start": "09:00", "end": "17:00", "slot_minutes": 60,
+                    "valid_from": null, "valid_to": null}],
+     "blocks": [{"doctor": "*", "from": "2025-12-25 00:00", "to": "2025-12-26 00:00",
+                 "reason": "Holiday"}]}
+
+weekdays: 0 = Monday. Blocks are half-open [from, to); doctor "*" blocks everyone.
+"""
+import json
+import os
+import tempfile
+from bisect import bisect_left, bisect_right
+from datetime import date as date_cls, datetime, timedelta
+
+from agent.schedule_store import day_number, day_string, minute_number
+
+ALL_DOCTORS = "*"
+DEFAULT_HORIZON_DAYS = 14
+DAY_MINUTES = 1440
+
+
+def templates_path_for(xlsx_path: str) -> str:
+    """The template file that sits next to a schedule workbook (app/data/availability.json by default)."""
+    return os.path.join(os.path.dirname(xlsx_path), "availability.json")
+
+
+def to_abs_minute(stamp: str) -> int:
+    """"YYYY-MM-DD" or "YYYY-MM-DD HH:MM" -> minutes since 1970-01-01."""
+    day, _, time = str(stamp).strip().partition(" ")
+    return day_number(day) * DAY_MINUTES + (minute_number(time) if time else 0)
+
+
+def from_abs_minute(m: int) -> str:
+    day, minute = divmod(int(m), DAY_MINUTES)
+    return f"{day_string(day)} {minute // 60:02d}:{minute % 60:02d}"
+
+
+class IntervalSet:
+    """Disjoint, sorted half-open [start, end) integer intervals; add/remove/query by binary search."""
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add(self, start: int, end: int):
+        if end <= start:
+            return
+        i = bisect_left(self.ends, start)    # first interval ending at/after start (touching ones merge)
+        j = bisect_right(self.starts, end)   # past the last interval starting at/before end
+        if i < j:
+            start = min(start, self.starts[i])
+            end = max(end, self.ends[j - 1])
+        self.starts[i:j] = [start]
+        self.ends[i:j] = [end]
+
+    def remove(self, start: int, end: int):
+        if end <= start:
+            return
+        i = bisect_right(self.ends, start)   # first interval ending after start
+        j = bisect_left(self.starts, end)    # past the last interval starting before end
+        if i >= j:
+            return
+        starts, ends = [], []
+        if self.starts[i] < start:
+            starts.append(self.starts[i])
+            ends.append(start)
+        if self.ends[j - 1] > end:
+            starts.append(end)
+            ends.append(self.ends[j - 1])
+        self.starts[i:j] = starts
+        self.ends[i:j] = ends
+
+    def overlapping(self, start: int, end: int):
+        """Intervals that intersect [start, end)."""
+        i = bisect_right(self.ends, start)
+        j = bisect_left(self.starts, end)
+        return list(zip(self.starts[i:j], self.ends[i:j]))
+
+
+class Template:
+    __slots__ = ("doctor", "weekdays", "start", "end", "slot_minutes", "valid_from", "valid_to")
+
+    def __init__(self, entry: dict):
+        self.doctor = str(entry["doctor"])
+        self.weekdays = frozenset(int(d) for d in entry.get("weekdays", range(7)))
+        self.start = minute_number(entry.get("start", "09:00"))
+        self.end = minute_number(entry.get("end", "17:00"))
+        self.slot_minutes = int(entry.get("slot_minutes", 60))
+        self.valid_from = day_number(entry["valid_from"]) if entry.get("valid_from") else None
+        self.valid_to = day_number(entry["valid_to"]) if entry.get("valid_to") else None
+
+    def applies(self, day: int, weekday: int) -> bool:
+        return (weekday in self.weekdays
+                and (self.valid_from is None or day >= self.valid_from)
+                and (self.valid_to is None or day <= self.valid_to))
+
+    def starts(self):
+        return range(self.start, self.end - self.slot_minutes + 1, self.slot_minutes)
+
+
+class AvailabilityTemplates:
+    """Loaded template file: expands doctor-days on request and records blocks."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.horizon_days = DEFAULT_HORIZON_DAYS
+        self.entries = []     # raw template dicts, as saved
+        self.blocks = []      # raw block dicts, as saved
+        self._templates = {}  # doctor -> [Template]
+        self._blocked = {}    # doctor or "*" -> IntervalSet of absolute minutes
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def load(self):
+        with open(self.path) as f:
+            data = json.load(f)
+        self.horizon_days = int(data.get("horizon_days", DEFAULT_HORIZON_DAYS))
+        self.entries = list(data.get("templates", []))
+        self.blocks = list(data.get("blocks", []))
+        self._templates = {}
+        for entry in self.entries:
+            t = Template(entry)
+            self._templates.setdefault(t.doctor, []).append(t)
+        self._blocked = {}
+        for b in self.blocks:
+            self._intervals(b["doctor"]).add(to_abs_minute(b["from"]), to_abs_minute(b["to"]))
+        return self
+
+    def save(self):
+        """
+        Write the file atomically (temp file in the same directory, then
+        os.replace). Read-modify-write across processes also needs
+        lock_path(): see Scheduler._edit_templates.
+        """
+        folder = os.path.dirname(self.path) or "."
+        os.makedirs(folder, exist_ok=True)
+        data = {"horizon_days": self.horizon_days, "templates": self.entries, "blocks": self.blocks}
+        fd, tmp = tempfile.mkstemp(dir=folder, prefix=".availability-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp, self.path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return self
+
+    def lock_path(self) -> str:
+        """Lock file serializing edits of this template file (agent.locks.file_lock)."""
+        return f"{self.path}.lock"
+
+    def _intervals(self, doctor) -> IntervalSet:
+        s = self._blocked.get(doctor)
+        if s is None:
+            s = self._blocked[doctor] = IntervalSet()
+        return s
+
+    # ---------- expansion ----------
+    @property
+    def slot_minutes(self) -> int:
+        lengths = [t.slot_minutes for ts in self._templates.values() for t in ts]
+        return min(lengths) if lengths else 60
+
+    def doctors(self):
+        return sorted(self._templates)
+
+    def window(self, today=None):
+        """Dates covered by open-ended slot searches: today + horizon_days."""
+        today = today or date_cls.today()
+        return [(today + timedelta(days=d)).isoformat() for d in range(self.horizon_days)]
+
+    def day_starts(self, doctor, date):
+        """[(minute, slot_minutes)] offered on one doctor-day, blocked ranges removed."""
+        templates = self._templates.get(doctor)
+        if not templates:
+            return []
+        day = day_number(date)
+        weekday = datetime.strptime(str(date)[:10], "%Y-%m-%d").weekday()
+        base = day * DAY_MINUTES
+        blocked = []
+        for key in (doctor, ALL_DOCTORS):
+            if key in self._blocked:
+                blocked.extend(self._blocked[key].overlapping(base, base + DAY_MINUTES))
+        out = {}
+        for t in templates:
+            if not t.applies(day, weekday):
+                continue
+            for m in t.starts():
+                s, e = base + m, base + m + t.slot_minutes
+                if not any(bs < e and s < be for bs, be in blocked):
+                    out.setdefault(m, t.slot_minutes)
+        return sorted(out.items())
+
+    # ---------- blocks ----------
+    def block(self, doctor, start: str, end: str, reason: str = ""):
+        """Block [start, end) ("YYYY-MM-DD[ HH:MM]") for a doctor, or everyone with "*"."""
+        self.blocks.append({"doctor": doctor, "from": start, "to": end, "reason": reason})
+        self._intervals(doctor).add(to_abs_minute(start), to_abs_minute(end))
+
+    def unblock(self, doctor, start: str, end: str):
+        """Lift a doctor's own blocks over [start, end); blocks for "*" stay unless doctor is "*"."""
+        lo, hi = to_abs_minute(start), to_abs_minute(end)
+        kept = []
+        for b in self.blocks:
+            bs, be = to_abs_minute(b["from"]), to_abs_minute(b["to"])
+            if b["doctor"] != doctor or be <= lo or bs >= hi:
+                kept.append(b)
+                continue
+            if bs < lo:
+                kept.append({**b, "to": from_abs_minute(lo)})
+            if be > hi:
+                kept.append({**b, "from": from_abs_minute(hi)})
+        self.blocks = kept
+        self._intervals(doctor).remove(lo, hi)
+
+
+def default_templates(path, doctors=("Smith", "Johnson"), horizon_days=7):
+    """Every day 9 AM - 5 PM in one-hour slots, searched 7 days ahead (the old default schedule)."""
+    t = AvailabilityTemplates(path)
+    t.horizon_days = horizon_days
+    t.entries = [{"doctor": d, "weekdays": list(range(7)), "start": "09:00", "end": "17:00",
+                  "slot_minutes": 60} for d in doctors]
+    return t.save().load()
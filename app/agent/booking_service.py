@@ -0,0 +1,329 @@
+# app/agent/booking_service.py
+"""
+Headless booking flow: identify -> find slots (rules applied) -> book ->
+notify, and cancel. No UI state; the Streamlit page, the CLI and the HTTP
+API are all thin clients of BookingService.
+"""
+import random
+import re
+import threading
+import uuid
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import List, Optional
+
+from agent import metrics
+from agent.emailer import Attachment
+from agent.patient_db import normalize_dob
+from agent.policy import duration_for_patient_type
+from agent.reminder import ReminderSystem
+from agent.resources import Resources, get_resources
+from agent.waitlist import WaitlistPlan, plan_waitlist
+from utils.calendar import build_ics
+from utils.intake_pdf import intake_filename, intake_values, render_intake_form
+
+
+def validate_identity(first_name, last_name, dob):
+    errors = []
+    try:
+        dob_date = datetime.strptime(dob, "%Y-%m-%d").date()
+        if dob_date >= datetime.today().date():
+            errors.append("❌ DOB must be in the past.")
+    except ValueError:
+        errors.append("❌ DOB must be in YYYY-MM-DD format.")
+    return errors
+
+
+def validate_contact(email, phone, insurance):
+    errors = []
+    if not re.match(r"[^@]+@[^@]+\.[^@]+", email):
+        errors.append("❌ Invalid email address.")
+    if not re.match(r"^\+?\d{8,15}$", phone):
+        errors.append("❌ Phone must contain only digits (8–15 digits).")
+    if not insurance.strip():
+        errors.append("❌ Insurance company is required.")
+    return errors
+
+
+def gen_member_ids():
+    member_id = f"MBR-{uuid.uuid4().hex[:6].upper()}"
+    group_number = f"GRP-{random.randint(10000,99999)}"
+    return member_id, group_number
+
+
+@dataclass
+class Patient:
+    first_name: str
+    last_name: str
+    dob: str
+    email: str = ""
+    phone: str = ""
+    insurance_company: str = ""
+    member_id: str = ""
+    group_number: str = ""
+    is_new: bool = False
+
+    @classmethod
+    def from_record(cls, row: dict, **identity):
+        """From a patients.csv row; identity fields (as typed) override the stored ones."""
+        return cls(
+            first_name=identity.get("first_name") or row.get("First Name", ""),
+            last_name=identity.get("last_name") or row.get("Last Name", ""),
+            dob=identity.get("dob") or normalize_dob(row.get("Date of Birth (YYYY-MM-DD)", "")),
+            email=row.get("Email (patient)", ""),
+            phone=row.get("Phone (patient)", ""),
+            insurance_company=row.get("Insurance Company (carrier)", ""),
+            member_id=row.get("Member ID", ""),
+            group_number=row.get("Group Number", ""),
+        )
+
+    def to_record(self) -> dict:
+        """patients.csv row for a new patient."""
+        return {
+            "First Name": self.first_name,
+            "Last Name": self.last_name,
+            "Date of Birth (YYYY-MM-DD)": self.dob,
+            "Email (patient)": self.email,
+            "Phone (patient)": self.phone,
+            "Insurance Company (carrier)": self.insurance_company,
+            "Member ID": self.member_id,
+            "Group Number": self.group_number,
+        }
+
+    def core(self) -> dict:
+        return {"first_name": self.first_name, "last_name": self.last_name,
+                "dob": self.dob, "is_new": self.is_new}
+
+    def details(self) -> dict:
+        return {"email": self.email, "phone": self.phone, "insurance_company": self.insurance_company,
+                "member_id": self.member_id, "group_number": self.group_number}
+
+    @property
+    def full_name(self) -> str:
+        return f"{self.first_name} {self.last_name}"
+
+
+@dataclass
+class Identification:
+    """identify() outcome: the patient to continue with, plus close matches for new patients."""
+    patient: Patient
+    found: bool
+    candidates: List[dict] = field(default_factory=list)  # [{"patient": row, "score": float}]
+
+
+@dataclass
+class SlotSearch:
+    minutes: int
+    slots: List[dict]  # [{"date", "time", "doctor"}]
+
+
+@dataclass
+class BookingConfirmation:
+    """book() outcome; truthy when the appointment was stored."""
+    ok: bool
+    appointment_id: Optional[int] = None
+    reason: str = ""
+    conflicts: List[int] = field(default_factory=list)
+    patient_added: bool = False
+    email_queued: bool = False
+    reminder_ids: List[int] = field(default_factory=list)
+    ics: bytes = b""
+    intake_pdf: bytes = b""
+
+    def __bool__(self):
+        return self.ok
+
+    def summary(self) -> dict:
+        """JSON-friendly view (without the attachment bytes)."""
+        out = asdict(self)
+        out.pop("ics")
+        out.pop("intake_pdf")
+        return out
+
+
+class BookingService:
+    """
+    One instance serves any number of concurrent callers; shared state lives
+    in Resources (schedule index, patients, rules) and the SQLite stores.
+    Pass `scheduler` (e.g. a ShardRouter) to book against something other
+    than the process-wide Scheduler.
+    """
+
+    def __init__(self, resources: Resources = None, reminders: ReminderSystem = None, outbox=None,
+                 scheduler=None):
+        self.resources = resources or get_resources()
+        self.reminders = reminders or ReminderSystem()
+        self._outbox = outbox
+        self._scheduler = scheduler
+
+    @property
+    def scheduler(self):
+        return self._scheduler or self.resources.scheduler()
+
+    @property
+    def outbox(self):
+        if self._outbox is None:
+            from agent.outbox import get_outbox
+            self._outbox = get_outbox()
+        return self._outbox
+
+    # ---------- identify ----------
+    def identify(self, first_name: str, last_name: str, dob: str) -> Identification:
+        db = self.resources.patient_db()
+        typed = {"first_name": first_name.strip(), "last_name": last_name.strip(), "dob": dob.strip()}
+        row = db.find_patient(first_name, last_name, dob)
+        if row:
+            return Identification(Patient.from_record(row, **typed), found=True)
+        member_id, group_number = gen_member_ids()
+        patient = Patient(**typed, member_id=member_id, group_number=group_number, is_new=True)
+        # Offer close matches (typos in name/DOB) before creating a duplicate record
+        return Identification(patient, found=False,
+                              candidates=db.find_similar_patients(first_name, last_name, dob))
+
+    def use_candidate(self, row: dict) -> Identification:
+        """Continue as an existing patient picked from identify()'s candidates."""
+        return Identification(Patient.from_record(row), found=True)
+
+    # ---------- slots ----------
+    def appointment_minutes(self, patient: Patient, ruleset=None) -> int:
+        ruleset = ruleset or self.resources.ruleset()
+        # A "duration" rule changes how much contiguous time we search for
+        _, duration_override = ruleset.apply(patient.core(), patient.details(), [], slots_version=())
+        return duration_override or duration_for_patient_type(patient.is_new)
+
+    @metrics.timed("find_slots")
+    def find_slots(self, patient: Patient, date: str = None, doctor: str = None) -> SlotSearch:
+        ruleset = self.resources.ruleset()
+        minutes = self.appointment_minutes(patient, ruleset)
+        scheduler = self.scheduler
+        if hasattr(scheduler, "get_available_slots_versioned"):
+            version, slots = scheduler.get_available_slots_versioned(minutes, date, doctor)
+        else:  # e.g. ShardRouter: no shared index version, evaluate every time
+            version, slots = None, scheduler.get_available_slots(minutes, date, doctor)
+        # Deduplicate slots
+        slots = list({(s["date"], s["time"], s["doctor"]): s for s in slots or []}.values())
+        slots, _ = ruleset.apply(patient.core(), patient.details(), slots, slots_version=version)
+        return SlotSearch(minutes, slots)
+
+    # ---------- book ----------
+    def book(self, patient: Patient, date: str, time: str, doctor: str,
+             minutes: int = None, notify: bool = True) -> BookingConfirmation:
+        """
+        Book the slot for `patient`. On success a new patient is saved, the
+        intake form and .ics are built in memory and, with notify, the
+        confirmation email and reminders are queued.
+        """
+        with metrics.span("booking"):
+            return self._book(patient, date, time, doctor, minutes, notify)
+
+    def _book(self, patient, date, time, doctor, minutes, notify):
+        minutes = minutes or self.appointment_minutes(patient)
+        record = {
+            "first_name": patient.first_name,
+            "last_name": patient.last_name,
+            "dob": patient.dob,
+            "email": patient.email,
+            "phone": patient.phone,
+            "insurance_company": patient.insurance_company,
+            "member_id": patient.member_id,
+            "group_number": patient.group_number,
+            "duration": minutes,
+            "form_sent": True,
+            "form_filled": False,
+            "status": "Scheduled",
+            "notes": ""
+        }
+        # Single-row insert into the appointment store
+        result = self.scheduler.book_slot(date, time, doctor, record=record)
+        if not result:
+            return BookingConfirmation(False, reason=result.reason, conflicts=result.conflicts)
+
+        out = BookingConfirmation(True, appointment_id=result.appointment_id)
+        if patient.is_new:
+            self.resources.patient_db().add_patient(patient.to_record())
+            out.patient_added = True
+
+        out.ics = build_ics(patient.full_name, doctor, date, time, minutes, appointment_id=result.appointment_id)
+        out.intake_pdf = render_intake_form(intake_values(asdict(patient), date, time, doctor, minutes))
+        if not notify:
+            return out
+
+        if patient.email:
+            subject = f"Appointment Confirmation — {date} {time}"
+            body = (
+                f"Hi {patient.first_name},\n\n"
+                f"Your appointment is confirmed on {date} at {time} with Dr. {doctor}.\n"
+                f"Please find the personalized intake form and a calendar invite attached.\n\nThanks."
+            )
+            # Delivered by the outbox worker; booking doesn't wait on SMTP
+            self.outbox.enqueue(patient.email, subject, body, attachments=[
+                Attachment(intake_filename(patient.last_name, date), out.intake_pdf, "application/pdf"),
+                Attachment("appointment.ics", out.ics, "text/calendar"),
+            ])
+            out.email_queued = True
+
+        # Reminders are persisted and emailed by the reminder service when due
+        out.reminder_ids = self.reminders.schedule_reminders(
+            {"first_name": patient.first_name, "email": patient.email},
+            {"id": result.appointment_id, "date": date, "time": time, "doctor": doctor}
+        )
+        return out
+
+    # ---------- waitlist ----------
+    def schedule_waitlist(self, patients: List[Patient], priorities=None, date_from: str = None,
+                          date_to: str = None, doctor: str = None, dry_run: bool = False,
+                          notify: bool = False) -> WaitlistPlan:
+        """
+        Place a whole waitlist at once (see agent.waitlist), then book each
+        placement unless dry_run. A slot taken by someone else in the meantime
+        leaves that placement with a reason instead of an appointment id.
+        """
+        scheduler = self.scheduler
+        scheduler.refresh()
+        # a local Scheduler's index is shared with concurrent bookings; a
+        # ShardRouter's index reads are calls to its workers and need no lock
+        plan = plan_waitlist(scheduler.index, patients, self.resources.ruleset().network, priorities=priorities,
+                             date_from=date_from, date_to=date_to, doctor=doctor,
+                             lock=getattr(scheduler, "_index_lock", None))
+        if dry_run:
+            return plan
+        for placement in plan.placements:
+            result = self.book(patients[placement.position], placement.date, placement.time,
+                               placement.doctor, minutes=placement.minutes, notify=notify)
+            if result:
+                placement.appointment_id = result.appointment_id
+            else:
+                placement.reason = result.reason
+        return plan
+
+    # ---------- cancel ----------
+    def cancel(self, appt_id: int, reason: str = None, notify: bool = True):
+        """Cancel an appointment, drop its reminders and tell the patient. Returns the updated row."""
+        row = self.scheduler.cancel_appointment(appt_id, reason)
+        if row is None:
+            return None
+        self.reminders.cancel_reminders(appt_id)
+        if notify and row.get("email"):
+            subject = f"Appointment Cancelled — {row['date']} {row['time']}"
+            body = (
+                f"Hi {row['first_name']},\n\n"
+                f"Your appointment has been cancelled by the doctor.\n"
+                f"Reason: {reason or 'Not specified'}.\n\n"
+                "Please rebook if needed."
+            )
+            self.outbox.enqueue(row["email"], subject, body)
+            row["email_queued"] = True
+        return row
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_booking_service() -> BookingService:
+    """Process-wide service instance."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = BookingService()
+        return _service
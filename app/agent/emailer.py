@@ -1,70 +1,127 @@
-# app/agent/emailer.py
 import os
 import smtplib
+from dataclasses import dataclass
 from email.message import EmailMessage
-from typing import List, Optional
+from typing import Any, List, Optional
+
+from agent import metrics
+
+@dataclass(frozen=True)
+class Attachment:
+    """
+    An in-memory attachment. data may be bytes, bytearray, memoryview or a
+    binary file-like object (read at build time); it goes into the message
+    as-is, so nothing has to be written to disk first.
+    """
+    filename: str
+    data: Any
+    mimetype: str = "application/octet-stream"
+
+    def payload(self):
+        if isinstance(self.data, (bytes, bytearray, memoryview)):
+            return self.data
+        if hasattr(self.data, "getbuffer"):  # BytesIO: share its buffer instead of copying
+            return self.data.getbuffer()
+        return self.data.read()
+
+def smtp_config():
+    """
+    SMTP settings from the environment, or None when not configured
+    (callers then simulate sending).
+    """
+    smtp_host = os.getenv("SMTP_HOST")
+    smtp_port = int(os.getenv("SMTP_PORT") or 0)
+    smtp_user = os.getenv("SMTP_USER")
+    smtp_pass = os.getenv("SMTP_PASS")
+    if not smtp_host or not smtp_user or not smtp_pass or smtp_port == 0:
+        return None
+    return {"host": smtp_host, "port": smtp_port, "user": smtp_user, "password": smtp_pass}
+
+def default_from_email() -> str:
+    return os.getenv("FROM_EMAIL") or os.getenv("SMTP_USER") or "no-reply@example.com"
+
+@metrics.timed("smtp_connect")
+def open_smtp(cfg: dict, timeout: int = 10):
+    """Open an authenticated SMTP connection (SSL on 465, STARTTLS otherwise)."""
+    if cfg["port"] == 465:
+        server = smtplib.SMTP_SSL(cfg["host"], cfg["port"], timeout=timeout)
+    else:
+        server = smtplib.SMTP(cfg["host"], cfg["port"], timeout=timeout)
+        server.ehlo()
+        server.starttls()
+        server.ehlo()
+    server.login(cfg["user"], cfg["password"])
+    return server
+
+def _mimetype_for(filename: str) -> str:
+    # Try to derive maintype/subtype from filename (pdf, ics, etc.)
+    if filename.lower().endswith(".pdf"):
+        return "application/pdf"
+    if filename.lower().endswith(".ics"):
+        return "text/calendar"
+    return "application/octet-stream"
+
+def build_message(to_email: str,
+                  subject: str,
+                  body: str,
+                  attachment_paths: Optional[List[str]] = None,
+                  from_email: Optional[str] = None,
+                  attachments: Optional[List[Attachment]] = None) -> EmailMessage:
+    msg = EmailMessage()
+    msg["From"] = from_email or default_from_email()
+    msg["To"] = to_email
+    msg["Subject"] = subject
+    msg.set_content(body)
+
+    # Attach files (if provided)
+    if attachment_paths:
+        for path in attachment_paths:
+            if not path or not os.path.exists(path):
+                continue
+            with open(path, "rb") as f:
+                data = f.read()
+            filename = os.path.basename(path)
+            maintype, subtype = _mimetype_for(filename).split("/", 1)
+            msg.add_attachment(data, maintype=maintype, subtype=subtype, filename=filename)
+
+    # In-memory attachments with explicit MIME types
+    for att in attachments or []:
+        maintype, subtype = att.mimetype.split("/", 1)
+        data = att.payload()
+        msg.add_attachment(data, maintype=maintype, subtype=subtype, filename=att.filename)
+        if isinstance(data, memoryview) and data is not att.data:
+            data.release()  # unpin the BytesIO buffer we borrowed
+    return msg
 
 def send_email(to_email: str,
                subject: str,
                body: str,
                attachment_paths: Optional[List[str]] = None,
-               from_email: Optional[str] = None) -> bool:
+               from_email: Optional[str] = None,
+               attachments: Optional[List[Attachment]] = None) -> bool:
     """
-    Send an email with optional multiple attachments.
+    Send an email with optional multiple attachments: files by path and/or
+    in-memory Attachment objects.
     If SMTP env vars are missing, this function will simulate sending and return True.
+    For non-blocking delivery use agent.outbox.queue_email instead.
     """
-    smtp_host = os.getenv("SMTP_HOST")
-    smtp_port = int(os.getenv("SMTP_PORT") or 0)
-    smtp_user = os.getenv("SMTP_USER")
-    smtp_pass = os.getenv("SMTP_PASS")
-    from_email = from_email or os.getenv("FROM_EMAIL") or smtp_user or "no-reply@example.com"
+    cfg = smtp_config()
 
     # Simulation mode if SMTP not configured
-    if not smtp_host or not smtp_user or not smtp_pass or smtp_port == 0:
-        print(f"[SIMULATED EMAIL] To: {to_email} Subject: {subject} Attachments: {attachment_paths}")
-        print("Body:\n", body)
+    if cfg is None:
+        names = list(attachment_paths or []) + [a.filename for a in attachments or []]
+        metrics.log_event("email_simulated", to=to_email, subject=subject, attachments=names, body=body)
         return True
 
     try:
-        msg = EmailMessage()
-        msg["From"] = from_email
-        msg["To"] = to_email
-        msg["Subject"] = subject
-        msg.set_content(body)
-
-        # Attach files (if provided)
-        if attachment_paths:
-            for path in attachment_paths:
-                if not path or not os.path.exists(path):
-                    continue
-                with open(path, "rb") as f:
-                    data = f.read()
-                # Try to derive maintype/subtype from filename (pdf, ics, etc.)
-                filename = os.path.basename(path)
-                if filename.lower().endswith(".pdf"):
-                    maintype, subtype = "application", "pdf"
-                elif filename.lower().endswith(".ics"):
-                    maintype, subtype = "text", "calendar"
-                else:
-                    maintype, subtype = "application", "octet-stream"
-                msg.add_attachment(data, maintype=maintype, subtype=subtype, filename=filename)
-
-        # Choose SSL or STARTTLS based on port
-        if smtp_port == 465:
-            server = smtplib.SMTP_SSL(smtp_host, smtp_port, timeout=10)
-            server.login(smtp_user, smtp_pass)
-            server.send_message(msg)
-            server.quit()
-        else:
-            server = smtplib.SMTP(smtp_host, smtp_port, timeout=10)
-            server.ehlo()
-            server.starttls()
-            server.ehlo()
-            server.login(smtp_user, smtp_pass)
+        msg = build_message(to_email, subject, body, attachment_paths, from_email, attachments)
+        with metrics.span("email_send"):
+            server = open_smtp(cfg)
             server.send_message(msg)
             server.quit()
-        print("[EMAIL SENT] To:", to_email, "Subject:", subject)
+        metrics.inc("emails_sent")
+        metrics.log_event("email_sent", to=to_email, subject=subject)
         return True
     except Exception as e:
-        print("Email send failed:", e)
+        metrics.log_error("email_send_failed", e, to=to_email)
         return False
@@ -1,8 +1,14 @@
 # app/agent/groq_client.py
 import os
-import time
 import json
+import random
 import re
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from agent import metrics
+from agent.rule_cache import RuleParseCache
+from agent.rule_grammar import parse_rule_locally
 
 try:
     from groq import Groq
@@ -11,12 +17,30 @@ except Exception:
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 GROQ_MODEL = os.getenv("GROQ_MODEL", "mixtral-8x7b-32768")
+LLM_MODEL = "llama-3.1-8b-instant"
+DEFAULT_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", "20"))
+NO_CLIENT_ERROR = "Groq client not configured (GROQ_API_KEY missing or SDK not installed)."
 
 # Create client if SDK available and key present
 client = None
 if Groq and GROQ_API_KEY:
     client = Groq(api_key=GROQ_API_KEY)
 
+# Parsed rules survive restarts; created lazily so importing stays cheap
+_cache = None
+
+# Blocking SDK calls run here rather than in the event loop's default executor:
+# asyncio.run() joins that one on exit, so a timed-out call would still hold
+# up a synchronous caller until the request itself gave up.
+_llm_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm")
+
+
+def get_rule_cache():
+    global _cache
+    if _cache is None:
+        _cache = RuleParseCache()
+    return _cache
+
 
 PROMPT_TEMPLATE = """
 You are a strict parser. Convert the admin's natural-language scheduling rule into a JSON object
@@ -43,6 +67,18 @@ Now convert this rule:
 JSON:
 """
 
+PACKED_PROMPT_TEMPLATE = """
+You are a strict parser. Convert EACH numbered scheduling rule below into a JSON object with
+exactly two keys, "condition" and "action", using the same conventions as:
+{"condition": {"patient_type": "new"}, "action": {"duration": 60}}
+
+Return ONLY a JSON array with one object per rule, in the same order as the input.
+
+Rules:
+<<RULES>>
+JSON:
+"""
+
 def _extract_json_from_text(text: str) -> str:
     """Try to extract JSON substring from LLM output."""
     # find first { and last } pair
@@ -51,39 +87,168 @@ def _extract_json_from_text(text: str) -> str:
         return m.group(0)
     return text.strip()
 
-def parse_rule_to_json(natural_rule: str, max_retries: int = 3, backoff: float = 1.0):
+def _extract_json_array(text: str) -> str:
+    """Like _extract_json_from_text, for the packed (multi-rule) prompt."""
+    m = re.search(r"\[.*\]", text, re.DOTALL)
+    if m:
+        return m.group(0)
+    return text.strip()
+
+
+def _backoff_delay(attempt: int, backoff: float) -> float:
+    """Exponential backoff with full jitter, so parallel retries don't stampede."""
+    return random.uniform(0, backoff * (2 ** attempt))
+
+
+def _complete(prompt: str, timeout: float = DEFAULT_TIMEOUT, max_tokens: int = 512) -> str:
+    with metrics.span("llm_request", model=LLM_MODEL):
+        resp = client.chat.completions.create(
+            model=LLM_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.0,
+            max_tokens=max_tokens,
+            timeout=timeout
+        )
+    # Groq output access pattern may differ; adapt if needed
+    if hasattr(resp, "choices") and len(resp.choices) > 0:
+        # Common pattern
+        return resp.choices[0].message.content
+    # fallback to str(resp)
+    return str(resp)
+
+
+def _lookup_without_llm(natural_rule: str, use_cache: bool = True):
+    """Local-grammar parse or cache hit; None means the LLM is needed."""
+    # The grammar goes first and is never cached: it only accepts sentences it
+    # read in full, and re-running it is cheaper than a lookup. The cache holds
+    # LLM answers only, so a sentence the grammar gives up on always gets one.
+    parsed = parse_rule_locally(natural_rule)
+    if parsed is not None:
+        metrics.inc("rule_parse", source="local")
+        return parsed
+    if use_cache:
+        cached = get_rule_cache().get(natural_rule)
+        if cached is not None:
+            metrics.inc("rule_parse", source="cache")
+            return cached
+    return None
+
+
+def parse_rule_to_json(natural_rule: str, max_retries: int = 3, backoff: float = 1.0,
+                       use_cache: bool = True, timeout: float = DEFAULT_TIMEOUT):
     """
-    Send natural_rule to LLM and return a dict. Returns None on failure.
+    Turn natural_rule into a dict. Returns (parsed, None) or (None, error).
+    Order: local grammar -> parse cache -> LLM (only for text neither understands).
+    Blocking wrapper around parse_rule_to_json_async: each LLM attempt is cut
+    off after `timeout` and retries back off on the event loop, not with
+    time.sleep on the caller's (e.g. Streamlit's) thread.
     """
-    if not client:
-        # No Groq client available — return None so caller can fallback
-        return None, f"Groq client not configured (GROQ_API_KEY missing or SDK not installed)."
+    parsed = _lookup_without_llm(natural_rule, use_cache)
+    if parsed is not None:
+        return parsed, None
+    return asyncio.run(parse_rule_to_json_async(natural_rule, max_retries=max_retries, backoff=backoff,
+                                                use_cache=use_cache, timeout=timeout))
+
 
-    prompt = PROMPT_TEMPLATE.replace("<<RULE_TEXT>>", natural_rule.strip())
+# ---------- asyncio API ----------
 
+async def _llm_json_async(prompt: str, max_retries: int, backoff: float, timeout: float,
+                          max_tokens: int = 512, extract=_extract_json_from_text):
+    """One LLM request with per-attempt timeout and jittered retries, off the event loop."""
+    last_err = None
     for attempt in range(max_retries):
         try:
-            resp = client.chat.completions.create(
-                model="llama-3.1-8b-instant",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.0,
-                max_tokens=512
+            loop = asyncio.get_running_loop()
+            content = await asyncio.wait_for(
+                loop.run_in_executor(_llm_pool, _complete, prompt, timeout, max_tokens), timeout
             )
-            # Groq output access pattern may differ; adapt if needed
-            content = None
-            if hasattr(resp, "choices") and len(resp.choices) > 0:
-                # Common pattern
-                content = resp.choices[0].message.content
-            else:
-                # fallback to str(resp)
-                content = str(resp)
-
-            json_text = _extract_json_from_text(content)
-            parsed = json.loads(json_text)
-            return parsed, None
+            return json.loads(extract(content)), None
+        except asyncio.TimeoutError:
+            last_err = f"timed out after {timeout}s"
+            metrics.inc("llm_timeouts")
         except Exception as e:
             last_err = str(e)
-            time.sleep(backoff * (attempt + 1))
-            continue
-
+        if attempt < max_retries - 1:
+            await asyncio.sleep(_backoff_delay(attempt, backoff))
     return None, f"Failed to parse rule after {max_retries} attempts: {last_err}"
+
+
+async def parse_rule_to_json_async(natural_rule: str, max_retries: int = 3, backoff: float = 1.0,
+                                   use_cache: bool = True, timeout: float = DEFAULT_TIMEOUT):
+    """Async twin of parse_rule_to_json; never blocks the event loop."""
+    results = await parse_rules_bulk_async([natural_rule], max_retries=max_retries, backoff=backoff,
+                                           use_cache=use_cache, timeout=timeout)
+    return results[0]
+
+
+async def parse_rules_bulk_async(texts, concurrency: int = 4, pack_size: int = 1,
+                                 max_retries: int = 3, backoff: float = 1.0,
+                                 use_cache: bool = True, timeout: float = DEFAULT_TIMEOUT):
+    """
+    Parse many rules at once. Returns [(parsed, err), ...] in input order.
+    Cached/locally parsable rules resolve immediately; the rest go to the LLM
+    with at most `concurrency` requests in flight, `pack_size` rules per request.
+    """
+    texts = list(texts)
+    results = [None] * len(texts)
+    pending = []
+    for i, text in enumerate(texts):
+        parsed = _lookup_without_llm(text, use_cache)
+        if parsed is not None:
+            results[i] = (parsed, None)
+        else:
+            pending.append(i)
+
+    if pending and not client:
+        for i in pending:
+            results[i] = (None, NO_CLIENT_ERROR)
+        return results
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def parse_one(i):
+        prompt = PROMPT_TEMPLATE.replace("<<RULE_TEXT>>", texts[i].strip())
+        results[i] = await _llm_json_async(prompt, max_retries, backoff, timeout)
+
+    async def parse_pack(indices):
+        async with semaphore:
+            if len(indices) > 1:
+                numbered = "\n".join(f"{n}. {texts[i].strip()}" for n, i in enumerate(indices, 1))
+                prompt = PACKED_PROMPT_TEMPLATE.replace("<<RULES>>", numbered)
+                parsed, _ = await _llm_json_async(prompt, max_retries, backoff, timeout,
+                                                  max_tokens=256 * len(indices), extract=_extract_json_array)
+                if isinstance(parsed, list) and len(parsed) == len(indices) and all(isinstance(p, dict) for p in parsed):
+                    for i, p in zip(indices, parsed):
+                        results[i] = (p, None)
+                    return
+            # single rule, or the packed answer didn't line up: one request per rule
+            for i in indices:
+                await parse_one(i)
+
+    size = max(1, pack_size)
+    await asyncio.gather(*(parse_pack(pending[k:k + size]) for k in range(0, len(pending), size)))
+
+    for i in pending:
+        parsed, err = results[i]
+        metrics.inc("rule_parse", source="llm_error" if err or parsed is None else "llm")
+        if use_cache and parsed is not None and not err:
+            get_rule_cache().put(texts[i], parsed)
+    return results
+
+
+def parse_rules_bulk(texts, **kwargs):
+    """Blocking wrapper around parse_rules_bulk_async for scripts and the Streamlit thread."""
+    return asyncio.run(parse_rules_bulk_async(texts, **kwargs))
+
+
+def read_rule_texts(source):
+    """One rule per line from a path, file object or string; blank lines and # comments skipped."""
+    if hasattr(source, "read"):
+        data = source.read()
+        data = data.decode("utf-8") if isinstance(data, bytes) else data
+    elif os.path.exists(str(source)):
+        with open(source, "r", encoding="utf-8") as f:
+            data = f.read()
+    else:
+        data = str(source)
+    return [line.strip() for line in data.splitlines() if line.strip() and not line.strip().startswith("#")]
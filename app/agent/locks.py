@@ -0,0 +1,52 @@
+# app/agent/locks.py
+import os
+import zlib
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+LOCK_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "locks")
+STRIPES = 64
+
+
+def stripe_for(key: str, stripes: int = STRIPES) -> int:
+    return zlib.crc32(key.encode("utf-8")) % stripes
+
+
+@contextmanager
+def striped_lock(key: str, lock_dir: str = LOCK_DIR, stripes: int = STRIPES):
+    """
+    Cross-process exclusive lock for `key` (e.g. one doctor-day).
+    Keys hash onto a fixed set of lock files, so unrelated doctors rarely
+    wait on each other and there is no single global lock.
+    """
+    os.makedirs(lock_dir, exist_ok=True)
+    with file_lock(os.path.join(lock_dir, f"stripe-{stripe_for(key, stripes):03d}.lock")):
+        yield
+
+
+@contextmanager
+def file_lock(path: str):
+    """
+    Cross-process exclusive lock on one lock file (e.g. "<data file>.lock").
+    Each call opens the file itself, so it also excludes other threads; do not
+    nest two locks on the same path.
+    """
+    with open(path, "a+b") as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
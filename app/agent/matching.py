@@ -0,0 +1,85 @@
+# app/agent/matching.py
+"""Phonetic blocking keys and edit-distance scoring for patient matching."""
+
+_SOUNDEX_CODES = {}
+for _letters, _digit in (("BFPV", "1"), ("CGJKQSXZ", "2"), ("DT", "3"),
+                         ("L", "4"), ("MN", "5"), ("R", "6")):
+    for _ch in _letters:
+        _SOUNDEX_CODES[_ch] = _digit
+
+
+def soundex(name: str) -> str:
+    """American Soundex code (e.g. 'Andrews' -> 'A536'); '' for empty input."""
+    letters = [c for c in str(name or "").upper() if c.isalpha()]
+    if not letters:
+        return ""
+    first = letters[0]
+    out = [first]
+    prev = _SOUNDEX_CODES.get(first, "")
+    for ch in letters[1:]:
+        code = _SOUNDEX_CODES.get(ch, "")
+        if code and code != prev:
+            out.append(code)
+            if len(out) == 4:
+                break
+        if ch not in "HW":  # H/W do not separate equal codes
+            prev = code
+    return "".join(out).ljust(4, "0")
+
+
+def levenshtein(a: str, b: str) -> int:
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    if not b:
+        return len(a)
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = cur
+    return prev[-1]
+
+
+def similarity(a: str, b: str) -> float:
+    """1.0 for identical strings, falling linearly with edit distance."""
+    a, b = str(a or "").strip().lower(), str(b or "").strip().lower()
+    if not a and not b:
+        return 1.0
+    return 1.0 - levenshtein(a, b) / max(len(a), len(b))
+
+
+def block_keys(first_name: str, last_name: str, dob: str):
+    """
+    Blocking keys for one record. Two records are only compared if they share
+    at least one key, so a lookup never scans the whole table.
+    dob must already be normalized.
+    """
+    sf, sl = soundex(first_name), soundex(last_name)
+    keys = []
+    if dob:
+        keys.append(("dob_last", dob, sl))
+        keys.append(("dob_first", dob, sf))
+    if sf and sl:
+        keys.append(("names", sf, sl))  # tolerates a mistyped DOB
+    return keys
+
+
+# Weights for the combined score
+FIRST_WEIGHT = 0.3
+LAST_WEIGHT = 0.4
+DOB_WEIGHT = 0.3
+
+
+def match_score(query, candidate) -> float:
+    """Score two (first, last, normalized dob) tuples between 0 and 1."""
+    qf, ql, qd = query
+    cf, cl, cd = candidate
+    return round(
+        FIRST_WEIGHT * similarity(qf, cf)
+        + LAST_WEIGHT * similarity(ql, cl)
+        + DOB_WEIGHT * similarity(qd, cd),
+        4,
+    )
@@ -0,0 +1,264 @@
+# app/agent/metrics.py
+"""
+Lightweight timing and counters for the hot paths, exported in Prometheus
+text format, plus structured (JSON) log lines.
+
+Off by default: span() hands back a shared no-op and inc()/observe() return
+immediately, so instrumented code costs one flag check. Enable with
+METRICS_ENABLED=1 (or enable()); expose with METRICS_PORT (HTTP /metrics)
+and/or METRICS_FILE (rewritten every METRICS_INTERVAL seconds).
+"""
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = "ai_scheduler_"
+# seconds; covers microsecond renders up to slow LLM / SMTP round trips
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SLOW_SPAN_SECONDS = float(os.getenv("METRICS_SLOW_SPAN", "1.0"))  # spans slower than this are logged
+
+logger = logging.getLogger("ai_scheduler")
+
+_enabled = os.getenv("METRICS_ENABLED", "").lower() in ("1", "true", "yes")
+
+
+def enable(on: bool = True):
+    global _enabled
+    _enabled = bool(on)
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items())) if labels else ()
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, labels=None):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, labels=None):
+        key = (name, _label_key(labels))
+        with self._lock:
+            h = self._histograms.get(key)
+            if h is None:
+                h = self._histograms[key] = _Histogram()
+            h.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            h.sum += seconds
+            h.count += 1
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            hists = {k: (list(h.counts), h.sum, h.count) for k, h in self._histograms.items()}
+        return counters, hists
+
+    def render(self) -> str:
+        """Prometheus text exposition format (0.0.4)."""
+        counters, hists = self.snapshot()
+        lines, typed = [], set()
+        for (name, labels), value in sorted(counters.items()):
+            metric = f"{PREFIX}{name}_total"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{_fmt_labels(labels)} {value}")
+        for (name, labels), (counts, total, count) in sorted(hists.items()):
+            metric = f"{PREFIX}{name}_seconds"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            cumulative = 0
+            for bound, n in zip(list(LATENCY_BUCKETS) + ["+Inf"], counts):
+                cumulative += n
+                lines.append(f"{metric}_bucket{_fmt_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{metric}_sum{_fmt_labels(labels)} {total:.6f}")
+            lines.append(f"{metric}_count{_fmt_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _fmt_labels(labels):
+    if not labels:
+        return ""
+    esc = (lambda v: v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in labels) + "}"
+
+
+REGISTRY = Registry()
+
+
+# ---------- recording ----------
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name, labels):
+        self.name, self.labels = name, labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        REGISTRY.observe(self.name, elapsed, self.labels)
+        if exc_type is not None:
+            REGISTRY.inc(f"{self.name}_errors", 1, self.labels)
+            log_event("span_error", level=logging.WARNING, span=self.name, seconds=round(elapsed, 6),
+                      error=f"{exc_type.__name__}: {exc}", **self.labels)
+        elif elapsed >= SLOW_SPAN_SECONDS:
+            log_event("slow_span", level=logging.INFO, span=self.name, seconds=round(elapsed, 6), **self.labels)
+        return False
+
+
+def span(name: str, **labels):
+    """with span("scheduler_book_slot"): ...  -> latency histogram <name>_seconds."""
+    if not _enabled:
+        return _NOOP
+    return _Span(name, labels)
+
+
+def timed(name: str):
+    """Decorator form of span()."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _Span(name, {}):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+def inc(name: str, value=1, **labels):
+    if _enabled:
+        REGISTRY.inc(name, value, labels)
+
+
+def observe(name: str, seconds: float, **labels):
+    if _enabled:
+        REGISTRY.observe(name, seconds, labels)
+
+
+# ---------- structured logs ----------
+def configure_logging(default_level: str = "INFO"):
+    """Entry points: log lines as bare JSON on stderr, at LOG_LEVEL (default `default_level`)."""
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", default_level), format="%(message)s")
+
+
+def log_event(event: str, level=logging.INFO, **fields):
+    """One JSON object per line on the "ai_scheduler" logger."""
+    if logger.isEnabledFor(level):
+        logger.log(level, json.dumps({"ts": round(time.time(), 3), "event": event, **fields}, default=str))
+
+
+def log_error(event: str, error, **fields):
+    """Count and log a handled failure (always logged, counted when metrics are on)."""
+    inc("errors", event=event)
+    log_event(event, level=logging.ERROR, error=str(error), error_type=type(error).__name__, **fields)
+
+
+# ---------- export ----------
+def render_prometheus() -> str:
+    return REGISTRY.render()
+
+
+def write_prometheus(path: str):
+    """Atomically (re)write a Prometheus text file, e.g. for node_exporter's textfile collector."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(render_prometheus())
+    os.replace(tmp, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        data = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+_exporter_started = False
+_exporter_lock = threading.Lock()
+
+
+def start_exporter():
+    """
+    Start the exporters configured in the environment (idempotent):
+    METRICS_PORT -> HTTP /metrics, METRICS_FILE -> periodic text file.
+    Either one switches metrics on.
+    """
+    global _exporter_started
+    with _exporter_lock:
+        if _exporter_started:
+            return
+        _exporter_started = True
+        port, path = os.getenv("METRICS_PORT"), os.getenv("METRICS_FILE")
+        if port or path:
+            enable()
+        if port:
+            server = ThreadingHTTPServer((os.getenv("METRICS_HOST", "127.0.0.1"), int(port)), _MetricsHandler)
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        if path:
+            interval = float(os.getenv("METRICS_INTERVAL", "15"))
+
+            def _dump():
+                while True:
+                    try:
+                        write_prometheus(path)
+                    except OSError as e:
+                        log_error("metrics_file_write", e, path=path)
+                    time.sleep(interval)
+
+            threading.Thread(target=_dump, name="metrics-file", daemon=True).start()
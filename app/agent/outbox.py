@@ -0,0 +1,362 @@
+# app/agent/outbox.py
+import os
+import queue
+import smtplib
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from email import message_from_bytes
+from email.policy import default as default_policy
+from typing import List, Optional
+
+from agent import metrics
+from agent.emailer import Attachment, build_message, default_from_email, open_smtp, smtp_config
+
+OUTBOX_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "outbox.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    to_email TEXT NOT NULL, from_email TEXT NOT NULL, subject TEXT,
+    message BLOB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',   -- pending | sending | sent | dead
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    created_at TEXT, sent_at TEXT,
+    claimed_by TEXT, lease_until REAL         -- who is sending it, and until when that claim holds
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_attempt_at);
+"""
+
+# columns added after the first release, for outbox.db files created before them
+MIGRATIONS = {"claimed_by": "TEXT", "lease_until": "REAL"}
+
+
+def _now():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+class SMTPPool:
+    """
+    Small pool of authenticated SMTP connections. Idle connections are
+    checked with NOOP before reuse and reopened when the server dropped them.
+    """
+
+    def __init__(self, cfg: dict, size: int = 2):
+        self.cfg = cfg
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _healthy(self, server):
+        try:
+            return server.noop()[0] == 250
+        except smtplib.SMTPException:
+            return False
+        except OSError:
+            return False
+
+    @contextmanager
+    def connection(self):
+        try:
+            server = self._idle.get_nowait()
+            if not self._healthy(server):
+                self._close(server)
+                server = open_smtp(self.cfg)
+        except queue.Empty:
+            server = open_smtp(self.cfg)
+        try:
+            yield server
+        except Exception:
+            self._close(server)  # state unknown after a failure; don't reuse
+            raise
+        else:
+            try:
+                self._idle.put_nowait(server)
+            except queue.Full:
+                self._close(server)
+
+    def _close(self, server):
+        try:
+            server.quit()
+        except Exception:
+            pass
+
+    def close_all(self):
+        while True:
+            try:
+                self._close(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+class Outbox:
+    """
+    Persistent email queue. Callers enqueue and return immediately; worker
+    threads drain due messages in batches over pooled SMTP connections,
+    retry failures with exponential backoff and move messages that keep
+    failing to the dead-letter state.
+
+    Several processes can share one outbox file. A claimed batch is leased
+    to its Outbox for `lease_seconds`; only a lease that ran out (its
+    worker crashed or hung) puts the message back up for another worker.
+    """
+
+    def __init__(self, path: str = OUTBOX_PATH, workers: int = 1, batch_size: int = 20,
+                 max_attempts: int = 5, retry_base: float = 30.0, lease_seconds: float = 300.0):
+        self.path = path
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.lease_seconds = lease_seconds
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        cfg = smtp_config()
+        self.pool = SMTPPool(cfg, size=workers) if cfg else None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executescript(SCHEMA)
+                have = {r["name"] for r in conn.execute("PRAGMA table_info(outbox)")}
+                for column, kind in MIGRATIONS.items():
+                    if column not in have:
+                        conn.execute(f"ALTER TABLE outbox ADD COLUMN {column} {kind}")
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    # ---------- producer side ----------
+    def enqueue(self, to_email: str, subject: str, body: str,
+                attachment_paths: Optional[List[str]] = None,
+                from_email: Optional[str] = None,
+                attachments: Optional[List[Attachment]] = None) -> int:
+        """Serialize the message now and store it; returns the outbox id."""
+        from_email = from_email or default_from_email()
+        msg = build_message(to_email, subject, body, attachment_paths, from_email, attachments)
+        conn = self._connect()
+        try:
+            cur = conn.execute(
+                "INSERT INTO outbox (to_email, from_email, subject, message, next_attempt_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (to_email, from_email, subject, msg.as_bytes(), time.time(), _now()),
+            )
+            outbox_id = cur.lastrowid
+        finally:
+            conn.close()
+        self._wake.set()
+        return outbox_id
+
+    def enqueue_many(self, messages) -> int:
+        """
+        Enqueue many messages in one transaction.
+        messages: iterable of dicts with to_email, subject, body and optional
+        attachment_paths / attachments / from_email. Returns the number queued.
+        """
+        now, created = time.time(), _now()
+        rows = []
+        for m in messages:
+            from_email = m.get("from_email") or default_from_email()
+            msg = build_message(m["to_email"], m["subject"], m["body"], m.get("attachment_paths"), from_email,
+                                m.get("attachments"))
+            rows.append((m["to_email"], from_email, m["subject"], msg.as_bytes(), now, created))
+        if not rows:
+            return 0
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT INTO outbox (to_email, from_email, subject, message, next_attempt_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        self._wake.set()
+        return len(rows)
+
+    # ---------- consumer side ----------
+    def _claim_batch(self):
+        """Lease a batch of due messages: pending ones, and sends whose lease ran out."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT id, to_email, from_email, subject, message, attempts FROM outbox "
+                "WHERE (status = 'pending' AND next_attempt_at <= ?) "
+                "OR (status = 'sending' AND COALESCE(lease_until, 0) < ?) "
+                "ORDER BY next_attempt_at LIMIT ?",
+                (now, now, self.batch_size),
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE outbox SET status = 'sending', claimed_by = ?, lease_until = ? WHERE id = ?",
+                    [(self.owner, now + self.lease_seconds, r["id"]) for r in rows],
+                )
+            conn.execute("COMMIT")
+            return [dict(r) for r in rows]
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _mark(self, outbox_id, status, error=None, attempts=None, next_attempt_at=None):
+        conn = self._connect()
+        try:
+            if status == "sent":
+                conn.execute("UPDATE outbox SET status = 'sent', sent_at = ?, last_error = NULL, "
+                             "claimed_by = NULL, lease_until = NULL WHERE id = ?", (_now(), outbox_id))
+            else:
+                # only while we still hold the lease: a worker that took over owns the row now
+                conn.execute(
+                    "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, "
+                    "claimed_by = NULL, lease_until = NULL WHERE id = ? AND claimed_by = ?",
+                    (status, attempts, next_attempt_at or time.time(), error, outbox_id, self.owner),
+                )
+        finally:
+            conn.close()
+
+    def _failed(self, row, error):
+        attempts = row["attempts"] + 1
+        if attempts >= self.max_attempts:
+            self._mark(row["id"], "dead", str(error), attempts)
+            metrics.inc("emails_dead_lettered")
+            metrics.log_error("outbox_dead_letter", error, outbox_id=row["id"], to=row["to_email"])
+        else:
+            delay = self.retry_base * (2 ** (attempts - 1))
+            self._mark(row["id"], "pending", str(error), attempts, time.time() + delay)
+
+    def _deliver(self, batch):
+        if self.pool is None:
+            # Simulation mode if SMTP not configured
+            for row in batch:
+                msg = message_from_bytes(row["message"], policy=default_policy)
+                body = msg.get_body(preferencelist=("plain",))
+                metrics.log_event("email_simulated", outbox_id=row["id"], to=row["to_email"],
+                                  subject=row["subject"], body=body.get_content() if body else "")
+                self._mark(row["id"], "sent")
+            return
+        remaining = list(batch)
+        try:
+            with metrics.span("outbox_deliver_batch"), self.pool.connection() as server:
+                while remaining:
+                    row = remaining[0]
+                    try:
+                        server.sendmail(row["from_email"], [row["to_email"]], row["message"])
+                    except smtplib.SMTPRecipientsRefused as e:
+                        self._failed(row, e)  # this message only; connection still fine
+                    else:
+                        self._mark(row["id"], "sent")
+                        metrics.inc("emails_sent")
+                    remaining.pop(0)
+        except Exception as e:
+            # connection-level failure: everything not yet sent goes back with a retry
+            metrics.log_error("outbox_smtp_batch_failed", e, unsent=len(remaining))
+            for row in remaining:
+                self._failed(row, e)
+
+    def drain_once(self) -> int:
+        """Send one batch of due messages; returns how many were attempted."""
+        batch = self._claim_batch()
+        if batch:
+            self._deliver(batch)
+        return len(batch)
+
+    def _run(self, poll_interval):
+        while not self._stop.is_set():
+            try:
+                if self.drain_once():
+                    continue
+            except Exception as e:
+                metrics.log_error("outbox_worker_error", e)
+            self._wake.wait(poll_interval)
+            self._wake.clear()
+
+    def start(self, poll_interval: float = 5.0):
+        """Start the background workers (idempotent)."""
+        if self._threads:
+            return self
+        self._stop.clear()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, args=(poll_interval,), name=f"outbox-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+        if self.pool:
+            self.pool.close_all()
+
+    # ---------- admin ----------
+    def stats(self):
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM outbox GROUP BY status").fetchall()
+        finally:
+            conn.close()
+        return {r["status"]: r["n"] for r in rows}
+
+    def dead_letters(self, limit: int = 100):
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT id, to_email, subject, attempts, last_error, created_at FROM outbox "
+                "WHERE status = 'dead' ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [dict(r) for r in rows]
+
+    def retry_dead(self, outbox_id: int = None):
+        """Requeue one dead letter (or all of them)."""
+        conn = self._connect()
+        try:
+            if outbox_id is None:
+                cur = conn.execute("UPDATE outbox SET status = 'pending', attempts = 0, next_attempt_at = ? "
+                                   "WHERE status = 'dead'", (time.time(),))
+            else:
+                cur = conn.execute("UPDATE outbox SET status = 'pending', attempts = 0, next_attempt_at = ? "
+                                   "WHERE id = ? AND status = 'dead'", (time.time(), outbox_id))
+        finally:
+            conn.close()
+        self._wake.set()
+        return cur.rowcount
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox() -> Outbox:
+    """Process-wide outbox with its worker started."""
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = Outbox(workers=int(os.getenv("OUTBOX_WORKERS", "1"))).start()
+        return _outbox
+
+
+def queue_email(to_email: str, subject: str, body: str,
+                attachment_paths: Optional[List[str]] = None,
+                from_email: Optional[str] = None,
+                attachments: Optional[List[Attachment]] = None) -> int:
+    """Drop-in, non-blocking alternative to send_email."""
+    return get_outbox().enqueue(to_email, subject, body, attachment_paths, from_email, attachments)
@@ -1,29 +1,150 @@
 # app/agent/patient_db.py
 import pandas as pd
 import os
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+from agent import metrics
+from agent.matching import block_keys, match_score
+
+COLUMNS = [
+    "First Name", "Last Name", "Date of Birth (YYYY-MM-DD)",
+    "Email (patient)", "Phone (patient)",
+    "Insurance Company (carrier)", "Member ID", "Group Number"
+]
+DOB_COL = "Date of Birth (YYYY-MM-DD)"
+
+# patients.csv stores DD-MM-YYYY while the UI asks for YYYY-MM-DD
+DOB_FORMATS = ("%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y")
+
+
+def normalize_dob(dob) -> str:
+    """Return DOB as YYYY-MM-DD, or the stripped input if no known format matches."""
+    s = str(dob or "").strip()
+    for fmt in DOB_FORMATS:
+        try:
+            return datetime.strptime(s, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return s
+
+
+def patient_key(first_name, last_name, dob):
+    return (str(first_name).strip().lower(), str(last_name).strip().lower(), normalize_dob(dob))
+
 
 class PatientDB:
     def __init__(self, path=None):
         if path is None:
             path = os.path.join("app", "data", "patients.csv")
         self.path = path
+        self._lock = threading.Lock()
+        self._stamp = None   # (mtime_ns, size) of the file the index was built from
+        self._df = None
+        self._appended = []  # rows added through add_patient since the last build
+        self._index = {}     # normalized (first, last, dob) -> row position
+        self._keys = []      # normalized key of every row, by position
+        self._blocks = None  # blocking key -> row positions, built on first fuzzy lookup
 
     def load_patients(self):
         if os.path.exists(self.path):
             return pd.read_csv(self.path)
-        return pd.DataFrame(columns=[
-            "First Name", "Last Name", "Date of Birth (YYYY-MM-DD)",
-            "Email (patient)", "Phone (patient)",
-            "Insurance Company (carrier)", "Member ID", "Group Number"
-        ])
+        return pd.DataFrame(columns=COLUMNS)
 
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    @metrics.timed("patient_index_build")
+    def _rebuild(self, stamp):
+        if stamp is None:
+            df = pd.DataFrame(columns=COLUMNS)
+        else:
+            df = pd.read_csv(self.path, dtype=str, keep_default_na=False)
+        index = {}
+        keys = [patient_key(f, l, d) for f, l, d in zip(df["First Name"], df["Last Name"], df[DOB_COL])]
+        for pos, key in enumerate(keys):
+            # first occurrence wins, same as the old row-scan lookup
+            index.setdefault(key, pos)
+        self._df = df
+        self._appended = []
+        self._index = index
+        self._keys = keys
+        self._blocks = None
+        self._stamp = stamp
+
+    def _ensure_blocks(self):
+        if self._blocks is not None:
+            return
+        blocks = defaultdict(list)
+        for pos, key in enumerate(self._keys):
+            for bk in block_keys(*key):
+                blocks[bk].append(pos)
+        self._blocks = blocks
+
+    def _ensure_index(self):
+        stamp = self._file_stamp()
+        if self._df is None or stamp != self._stamp:
+            self._rebuild(stamp)
+
+    def _row(self, pos):
+        n = len(self._df)
+        if pos < n:
+            return self._df.iloc[pos].to_dict()
+        return dict(self._appended[pos - n])
+
+    @metrics.timed("patient_find")
     def find_patient(self, first_name, last_name, dob):
-        df = self.load_patients()
-        match = df[
-            (df["First Name"].str.lower() == first_name.lower()) &
-            (df["Last Name"].str.lower() == last_name.lower()) &
-            (df["Date of Birth (YYYY-MM-DD)"] == dob)
-        ]
-        if not match.empty:
-            return match.iloc[0].to_dict()
-        return None
+        with self._lock:
+            self._ensure_index()
+            pos = self._index.get(patient_key(first_name, last_name, dob))
+            return self._row(pos) if pos is not None else None
+
+    @metrics.timed("patient_find_similar")
+    def find_similar_patients(self, first_name, last_name, dob, limit=5, min_score=0.75):
+        """
+        Fuzzy lookup for typos such as "Andrew" vs "Andrews".
+        Only rows sharing a phonetic blocking key (Soundex + DOB, or Soundex of
+        both names) are scored. Returns [{"patient": row, "score": float}],
+        best first.
+        """
+        query = patient_key(first_name, last_name, dob)
+        with self._lock:
+            self._ensure_index()
+            self._ensure_blocks()
+            candidates = set()
+            for bk in block_keys(*query):
+                candidates.update(self._blocks.get(bk, ()))
+            scored = []
+            for pos in candidates:
+                score = match_score(query, self._keys[pos])
+                if score >= min_score:
+                    scored.append((score, pos))
+            scored.sort(key=lambda t: (-t[0], t[1]))
+            return [{"patient": self._row(pos), "score": score} for score, pos in scored[:limit]]
+
+    def add_patient(self, patient: dict):
+        """Append one patient row to the CSV and to the in-memory index."""
+        row = {c: "" if patient.get(c) is None else str(patient.get(c)) for c in COLUMNS}
+        with self._lock:
+            self._ensure_index()
+            write_header = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            pd.DataFrame([row], columns=COLUMNS).to_csv(
+                self.path, mode="a", header=write_header, index=False
+            )
+            pos = len(self._df) + len(self._appended)
+            key = patient_key(row["First Name"], row["Last Name"], row[DOB_COL])
+            self._appended.append(row)
+            self._keys.append(key)
+            self._index.setdefault(key, pos)
+            if self._blocks is not None:
+                for bk in block_keys(*key):
+                    self._blocks[bk].append(pos)
+            # our own append must not trigger a full rebuild
+            self._stamp = self._file_stamp()
+        return row
@@ -1,30 +1,340 @@
-import time
+import heapq
+import os
+import sqlite3
 import threading
-import streamlit as st
+import time
+from datetime import datetime, timedelta
+
+from agent import metrics
+
+REMINDERS_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "reminders.db")
+
+# (how long before the appointment, which message)
+REMINDER_OFFSETS = [
+    (timedelta(days=3), "details"),
+    (timedelta(days=1), "intake_form"),
+    (timedelta(hours=2), "confirm"),
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reminders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    appointment_id INTEGER,
+    due_at REAL NOT NULL,
+    to_email TEXT NOT NULL, subject TEXT, body TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',   -- pending | sending | fired | cancelled
+    lease_until REAL                          -- a 'sending' row goes back to pending after this
+);
+CREATE INDEX IF NOT EXISTS idx_reminders_due ON reminders(status, due_at);
+CREATE INDEX IF NOT EXISTS idx_reminders_appt ON reminders(appointment_id);
+"""
+
+CLAIM_LEASE = 60.0  # seconds a claimed reminder has to reach the outbox
+
+
+def reminder_messages(patient, appointment):
+    """The three reminder texts for a booked appointment, in send order."""
+    return [
+        f"📧 Reminder 1: Hello {patient['first_name']}, "
+        f"your appointment is on {appointment['date']} at {appointment['time']} with {appointment['doctor']}.",
+
+        f"📧 Reminder 2: Hi {patient['first_name']}, "
+        f"please confirm you filled your intake form before your appointment.",
+
+        f"📧 Reminder 3: Final reminder! Please confirm your visit or reply with reason for cancellation."
+    ]
+
+
+class ReminderStore:
+    """Due reminders on disk; every query goes through the (status, due_at) index."""
+
+    def __init__(self, path: str = REMINDERS_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.executescript(SCHEMA)
+            if "lease_until" not in {r["name"] for r in conn.execute("PRAGMA table_info(reminders)")}:
+                conn.execute("ALTER TABLE reminders ADD COLUMN lease_until REAL")
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def add_many(self, rows):
+        """rows: dicts with appointment_id, due_at, to_email, subject, body. Returns [(due_at, id)]."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN")
+            out = []
+            for r in rows:
+                cur = conn.execute(
+                    "INSERT INTO reminders (appointment_id, due_at, to_email, subject, body) VALUES (?, ?, ?, ?, ?)",
+                    (r.get("appointment_id"), r["due_at"], r["to_email"], r["subject"], r["body"]),
+                )
+                out.append((r["due_at"], cur.lastrowid))
+            conn.execute("COMMIT")
+            return out
+        finally:
+            conn.close()
+
+    def pending_before(self, until: float, limit: int):
+        """(due_at, id) of reminders due before `until` that nobody holds, earliest first."""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT due_at, id FROM reminders WHERE due_at <= ? AND (status = 'pending' "
+                "OR (status = 'sending' AND lease_until < ?)) ORDER BY due_at LIMIT ?",
+                (until, time.time(), limit)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [(r["due_at"], r["id"]) for r in rows]
+
+    def claim(self, ids, lease: float = CLAIM_LEASE):
+        """
+        Atomically flip pending -> sending for `lease` seconds; returns the rows
+        this caller won. mark_fired() once they are in the outbox; a claim
+        that is never confirmed (crash) expires and the reminders are due again.
+        """
+        if not ids:
+            return []
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            marks = ",".join("?" * len(ids))
+            rows = conn.execute(
+                f"SELECT * FROM reminders WHERE id IN ({marks}) "
+                "AND (status = 'pending' OR (status = 'sending' AND lease_until < ?))", list(ids) + [now]
+            ).fetchall()
+            conn.executemany("UPDATE reminders SET status = 'sending', lease_until = ? WHERE id = ?",
+                             [(now + lease, r["id"]) for r in rows])
+            conn.execute("COMMIT")
+            return [dict(r) for r in rows]
+        finally:
+            conn.close()
+
+    def _set_claimed(self, ids, status):
+        if not ids:
+            return
+        conn = self._connect()
+        try:
+            marks = ",".join("?" * len(ids))
+            conn.execute(f"UPDATE reminders SET status = ?, lease_until = NULL "
+                         f"WHERE status = 'sending' AND id IN ({marks})", [status] + list(ids))
+        finally:
+            conn.close()
+
+    def mark_fired(self, ids):
+        self._set_claimed(ids, "fired")
+
+    def release(self, ids):
+        """Hand claimed reminders back (their email could not be queued)."""
+        self._set_claimed(ids, "pending")
+
+    def cancel_for(self, appointment_id: int) -> int:
+        """
+        Cancel an appointment's reminders, including claimed ones: a claim
+        whose sender dies must not come back due for a cancelled appointment.
+        """
+        conn = self._connect()
+        try:
+            cur = conn.execute(
+                "UPDATE reminders SET status = 'cancelled', lease_until = NULL "
+                "WHERE appointment_id = ? AND status IN ('pending', 'sending')",
+                (appointment_id,),
+            )
+            return cur.rowcount
+        finally:
+            conn.close()
+
+
+class ReminderScheduler:
+    """
+    Single service thread driven by a min-heap of (due_at, id).
+    Only reminders due within `horizon` seconds are held in memory; the heap
+    is topped up from the store's due-time index, so a restart resumes from
+    disk without looking at appointments. Due reminders fire in batches
+    through the email outbox.
+    """
+
+    def __init__(self, store: ReminderStore = None, outbox=None,
+                 batch_size: int = 500, horizon: float = 3600.0):
+        self.store = store or ReminderStore()
+        self._outbox = outbox
+        self.batch_size = batch_size
+        self.horizon = horizon
+        self._heap = []
+        self._in_heap = set()
+        self._loaded_until = 0.0
+        self._truncated = False  # last refill hit its row limit
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = None
+
+    @property
+    def outbox(self):
+        if self._outbox is None:
+            from agent.outbox import get_outbox
+            self._outbox = get_outbox()
+        return self._outbox
+
+    def _push(self, due_at, rid):
+        if rid not in self._in_heap:
+            heapq.heappush(self._heap, (due_at, rid))
+            self._in_heap.add(rid)
+
+    def _refill(self, now):
+        until = now + self.horizon
+        limit = self.batch_size * 20
+        rows = self.store.pending_before(until, limit=limit)
+        for due_at, rid in rows:
+            self._push(due_at, rid)
+        # if the window was truncated, only trust it up to the last row we saw
+        self._truncated = len(rows) == limit
+        self._loaded_until = rows[-1][0] if self._truncated else until
+
+    def _refill_at(self):
+        # a truncated window can't learn anything new until its last row is due:
+        # everything before it is already in the heap
+        return self._loaded_until if self._truncated else self._loaded_until - self.horizon / 2
+
+    def _needs_refill(self, now):
+        return now >= self._refill_at()
+
+    def add(self, rows):
+        """Persist reminders; the ones inside the loaded window join the heap immediately."""
+        entries = self.store.add_many(rows)
+        with self._cond:
+            for due_at, rid in entries:
+                if due_at <= self._loaded_until:
+                    self._push(due_at, rid)
+            self._cond.notify()
+        return [rid for _, rid in entries]
+
+    def cancel_for(self, appointment_id: int) -> int:
+        # heap entries are dropped lazily: claim() skips rows that are no longer pending
+        return self.store.cancel_for(appointment_id)
+
+    def fire_due(self, now: float = None) -> int:
+        """Send everything due by `now`; returns the number of reminders sent."""
+        now = time.time() if now is None else now
+        fired = 0
+        while True:
+            with self._cond:
+                if self._needs_refill(now):
+                    self._refill(now)
+                ids = []
+                while self._heap and self._heap[0][0] <= now and len(ids) < self.batch_size:
+                    _, rid = heapq.heappop(self._heap)
+                    self._in_heap.discard(rid)
+                    ids.append(rid)
+            if not ids:
+                return fired
+            rows = self.store.claim(ids)
+            claimed = [r["id"] for r in rows]
+            try:
+                self.outbox.enqueue_many(
+                    {"to_email": r["to_email"], "subject": r["subject"], "body": r["body"]} for r in rows
+                )
+            except Exception:
+                self.store.release(claimed)
+                with self._cond:
+                    for r in rows:
+                        self._push(r["due_at"], r["id"])
+                raise
+            # only now are they sent; a crash before this leaves the claim to expire
+            self.store.mark_fired(claimed)
+            fired += len(rows)
+            metrics.inc("reminders_fired", len(rows))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._stop:
+                    return
+                now = time.time()
+                refill_at = self._refill_at()
+                next_due = self._heap[0][0] if self._heap else refill_at
+                wait = max(0.0, min(next_due, refill_at) - now)
+                if wait > 0:
+                    self._cond.wait(wait)
+                if self._stop:
+                    return
+            try:
+                self.fire_due()
+            except Exception as e:
+                metrics.log_error("reminders_fire_failed", e)
+                time.sleep(5)
+
+    def start(self):
+        if self._thread is None:
+            with self._cond:
+                self._refill(time.time())
+            self._thread = threading.Thread(target=self._run, name="reminders", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
 
 class ReminderSystem:
-    def __init__(self):
+    def __init__(self, scheduler: ReminderScheduler = None):
+        self.scheduler = scheduler
         self.reminders = []
 
     def schedule_reminders(self, patient, appointment):
         """
-        Simulate 3 reminders for the booked appointment.
-        In real deployment, you'd use email/SMS APIs + proper scheduling.
+        Persist 3 reminders for the booked appointment (3 days, 1 day and
+        2 hours before; any that are already past go out right away) and hand
+        them to the reminder service, which emails them when due.
+        patient: {"first_name", "email"}; appointment: {"date", "time", "doctor", "id" optional}
         """
-        self.reminders = [
-            f"📧 Reminder 1: Hello {patient['first_name']}, "
-            f"your appointment is on {appointment['date']} at {appointment['time']} with {appointment['doctor']}.",
+        self.reminders = reminder_messages(patient, appointment)
+        to_email = patient.get("email")
+        if not to_email:
+            return []
+
+        start = datetime.strptime(f"{appointment['date']} {appointment['time']}", "%Y-%m-%d %H:%M")
+        now = time.time()
+        if start.timestamp() <= now:
+            return []
+        rows = []
+        for (offset, _kind), text in zip(REMINDER_OFFSETS, self.reminders):
+            rows.append({
+                "appointment_id": appointment.get("id"),
+                "due_at": max(now, (start - offset).timestamp()),
+                "to_email": to_email,
+                "subject": f"Appointment reminder — {appointment['date']} {appointment['time']}",
+                "body": text,
+            })
+        scheduler = self.scheduler or get_reminder_scheduler()
+        return scheduler.add(rows)
+
+    def cancel_reminders(self, appointment_id):
+        scheduler = self.scheduler or get_reminder_scheduler()
+        return scheduler.cancel_for(appointment_id)
 
-            f"📧 Reminder 2: Hi {patient['first_name']}, "
-            f"please confirm you filled your intake form before your appointment.",
 
-            f"📧 Reminder 3: Final reminder! Please confirm your visit or reply with reason for cancellation."
-        ]
+_scheduler = None
+_scheduler_lock = threading.Lock()
 
-        # Run in background (simulated delays)
-        def send_all():
-            for r in self.reminders:
-                time.sleep(2)  # simulate delay
-                st.toast(r)
 
-        threading.Thread(target=send_all, daemon=True).start()
+def get_reminder_scheduler() -> ReminderScheduler:
+    """Process-wide reminder service, started on first use (recovers pending reminders)."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = ReminderScheduler().start()
+        return _scheduler
@@ -0,0 +1,71 @@
+# app/agent/resources.py
+"""
+Process-wide shared resources: the schedule (Scheduler and its slot index),
+the patient table and the rule list. Each is built once and handed to every
+session; a cheap os.stat() on the backing files decides when to rebuild, so
+Streamlit reruns only pay for in-memory work.
+"""
+import threading
+
+from agent import rules as rules_mod
+from agent.appointments import AppointmentRepository
+from agent.patient_db import PatientDB
+from agent.scheduler import SCHEDULE_PATH, Scheduler
+
+
+class Resources:
+    """
+    Thread-safe holder of shared objects. Readers get the current instance;
+    when its file changed on disk, the first caller rebuilds it (others wait
+    on that resource's lock instead of rebuilding in parallel).
+    Returned objects are shared: treat the rules list as read-only.
+    """
+
+    def __init__(self, schedule_path: str = SCHEDULE_PATH, patients_path: str = None,
+                 repo: AppointmentRepository = None):
+        self.schedule_path = schedule_path
+        self.patients_path = patients_path
+        self.repo = repo or AppointmentRepository()
+        self._locks = {name: threading.Lock() for name in ("scheduler", "patients")}
+        self._scheduler = None
+        self._patients = None
+
+    def scheduler(self) -> Scheduler:
+        with self._locks["scheduler"]:
+            # the templates / column store, not the workbook: Excel is only read on first import
+            if self._scheduler is None or self._scheduler.source_stamp() != self._scheduler.stamp:
+                self._scheduler = Scheduler(self.schedule_path, repo=self.repo)
+            return self._scheduler
+
+    def patient_db(self) -> PatientDB:
+        # PatientDB re-reads its CSV by itself when the file's mtime/size change
+        with self._locks["patients"]:
+            if self._patients is None:
+                self._patients = PatientDB(self.patients_path)
+            return self._patients
+
+    def ruleset(self) -> rules_mod.RuleSet:
+        """The versioned rule set (re-read only when rules.json changes)."""
+        return rules_mod.get_ruleset().current()
+
+    def rules(self):
+        return self.ruleset().entries
+
+    def invalidate(self):
+        """Drop the cached schedule and rules; the next access reloads from disk."""
+        with self._locks["scheduler"]:
+            self._scheduler = None
+        rules_mod.get_ruleset().invalidate()
+
+
+_resources = None
+_resources_lock = threading.Lock()
+
+
+def get_resources() -> Resources:
+    """The process-wide Resources instance (shared by all Streamlit sessions)."""
+    global _resources
+    with _resources_lock:
+        if _resources is None:
+            _resources = Resources()
+        return _resources
@@ -0,0 +1,98 @@
+# app/agent/rule_cache.py
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "rule_parse_cache.db")
+MAX_ENTRIES = 2000
+# Bumped when entries written by older code must not be served. 2: earlier
+# versions also cached local-grammar parses, some of which dropped qualifiers.
+CACHE_VERSION = 2
+
+
+def normalize_rule_text(text: str) -> str:
+    """Cache key: lowercase, single spaces, no trailing punctuation."""
+    return re.sub(r"\s+", " ", str(text or "")).strip().rstrip(".!;").lower()
+
+
+class RuleParseCache:
+    """
+    Disk-backed LRU of LLM-parsed rules keyed by normalized rule text.
+    Hits are served from an in-memory OrderedDict; SQLite keeps entries across
+    restarts. The least recently used entry is evicted past MAX_ENTRIES.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._mem = OrderedDict()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS rule_cache ("
+                    "key TEXT PRIMARY KEY, parsed TEXT NOT NULL, last_used REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_rule_cache_used ON rule_cache(last_used)")
+                if conn.execute("PRAGMA user_version").fetchone()[0] < CACHE_VERSION:
+                    conn.execute("DELETE FROM rule_cache")
+                    conn.execute(f"PRAGMA user_version = {CACHE_VERSION}")
+            rows = conn.execute(
+                "SELECT key, parsed FROM rule_cache ORDER BY last_used DESC LIMIT ?", (max_entries,)
+            ).fetchall()
+        finally:
+            conn.close()
+        for key, parsed in reversed(rows):
+            self._mem[key] = json.loads(parsed)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def get(self, text: str):
+        """Memory-only lookup; recency is written to disk with the next put()."""
+        key = normalize_rule_text(text)
+        with self._lock:
+            parsed = self._mem.get(key)
+            if parsed is None:
+                return None
+            self._mem.move_to_end(key)
+        return json.loads(json.dumps(parsed))  # callers may mutate their copy
+
+    def put(self, text: str, parsed: dict):
+        key = normalize_rule_text(text)
+        with self._lock:
+            self._mem[key] = parsed
+            self._mem.move_to_end(key)
+            evicted = []
+            while len(self._mem) > self.max_entries:
+                evicted.append(self._mem.popitem(last=False)[0])
+            # persist the in-memory recency order so a restart evicts the same keys
+            now = time.time()
+            recency = [(now - i * 1e-6, k) for i, k in enumerate(reversed(self._mem))]
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO rule_cache (key, parsed, last_used) VALUES (?, ?, ?)",
+                    (key, json.dumps(parsed), now),
+                )
+                conn.executemany("UPDATE rule_cache SET last_used = ? WHERE key = ?", recency)
+                conn.executemany("DELETE FROM rule_cache WHERE key = ?", [(k,) for k in evicted])
+        finally:
+            conn.close()
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM rule_cache")
+        finally:
+            conn.close()
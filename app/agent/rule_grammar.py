@@ -0,0 +1,151 @@
+# app/agent/rule_grammar.py
+"""
+Deterministic parser for the common rule phrasings, so most admin rules
+never need the LLM. Returns None whenever it is not confident.
+"""
+import re
+
+_DOCTOR = r"(?:dr\.?|doctor)\s+([A-Z][A-Za-z'\-]+)"
+# the same, with the whole reference as a group so its span can be marked as read
+_DOCTOR_REF = r"(?P<doctor>(?:dr\.?|doctor)\s+(?P<name>[A-Z][A-Za-z'\-]+))"
+
+_PATIENT_TYPE = [
+    (re.compile(r"\bnew\s+patients?\b", re.I), "new"),
+    (re.compile(r"\b(?:returning|existing|follow[- ]?up|repeat)\s+patients?\b", re.I), "returning"),
+]
+
+_INSURANCE = [
+    re.compile(r"\b(?:with|using|insured\s+(?:by|with)|covered\s+by|on|have|having)\s+([A-Z][\w&\-]*(?:\s+[A-Z][\w&\-]*)*)\s+(?:insurance|coverage|plans?)\b"),
+    re.compile(r"\binsurance(?:\s+company)?\s+(?:is|=|of)\s+([A-Z][\w&\-]*(?:\s+[A-Z][\w&\-]*)*)"),
+]
+
+_AGE = [
+    (re.compile(r"\b(?:aged\s+)?(\d{1,3})\s*(?:\+|years?\s+(?:old\s+)?(?:and|or)\s+(?:older|over|above))", re.I), "age_gte"),
+    (re.compile(r"\b(?:aged\s+)?(\d{1,3})\s*(?:years?\s+(?:old\s+)?)?(?:and|or)\s+(?:younger|under|below)", re.I), "age_lte"),
+    (re.compile(r"\b(?:over|older\s+than|above|greater\s+than|more\s+than)\s+(?:age\s+)?(\d{1,3})", re.I), "age_gt"),
+    (re.compile(r"\b(?:under|younger\s+than|below|less\s+than)\s+(?:age\s+)?(\d{1,3})", re.I), "age_lt"),
+]
+
+_LAST_NAME = re.compile(r"\blast\s+name\s+(?:is\s+|of\s+|=\s*)?([A-Z][A-Za-z'\-]+)")
+
+# Words that may stand between the recognized phrases without changing what
+# the rule means. Anything else left over (a qualifier like "in the morning",
+# "except", "unless", a second negation) means the sentence was not fully
+# understood.
+_FILLER = frozenset("""
+    a an the all any every patient patients who that whose are is be been get gets
+    should must shall will always only to with for of and at by their they them
+    booked book booking scheduled schedule scheduling assigned assign see sees seen
+    appointment appointments visit visits slot slots long length lasting last
+    need needs require requires take takes have has given years year old age aged
+    dr doctor please
+""".split())
+
+# between an action's trigger word and its doctor only filler may appear, so
+# "not over 65 ... Dr. X" is not read as a block on Dr. X
+_GAP = r"(?:\s+(?:" + "|".join(sorted(_FILLER, key=len, reverse=True)) + r")\b)*\s+"
+
+_BLOCK = re.compile(
+    r"(?P<trigger>\b(?:never|not|\w+n't|cannot|no(?:\s+longer)?|avoid|block|exclude)\b)" + _GAP + _DOCTOR_REF, re.I
+)
+_PREFER = re.compile(r"(?P<trigger>\bprefer(?:ably|red|s|ence\s+(?:for|to))?\b)" + _GAP + _DOCTOR_REF, re.I)
+_ASSIGN = re.compile(
+    r"(?P<trigger>\b(?:only|always|must|assign(?:ed)?|schedul(?:e|ed)|book(?:ed)?|see|with)\b)"
+    + _GAP + _DOCTOR_REF, re.I
+)
+
+_MINUTES = re.compile(r"\b(\d{1,3})\s*(?:-\s*)?(?:minutes?|mins?)\b", re.I)
+_HOURS = re.compile(r"\b(\d{1,2})\s*(?:-\s*)?(?:hours?|hrs?)\b", re.I)
+_ONE_HOUR = re.compile(r"\b(?:an|one)\s+hour\b", re.I)
+_HALF_HOUR = re.compile(r"\bhalf\s+an?\s+hour\b", re.I)
+
+
+def _doctor_name(surname):
+    return f"Dr. {surname[0].upper()}{surname[1:]}"
+
+
+def _conditions(text, used):
+    condition = {}
+    for pattern, value in _PATIENT_TYPE:
+        m = pattern.search(text)
+        if m:
+            condition["patient_type"] = value
+            used.append(m.span())
+            break
+    for pattern in _INSURANCE:
+        m = pattern.search(text)
+        if m:
+            condition["insurance_company"] = m.group(1).strip()
+            used.append(m.span())
+            break
+    for pattern, key in _AGE:
+        m = pattern.search(text)
+        if m:
+            condition[key] = int(m.group(1))
+            used.append(m.span())
+            break
+    m = _LAST_NAME.search(text)
+    if m:
+        condition["last_name"] = m.group(1)
+        used.append(m.span())
+    return condition
+
+
+def _duration(text, used):
+    for pattern, minutes in ((_HALF_HOUR, lambda m: 30), (_MINUTES, lambda m: int(m.group(1))),
+                             (_HOURS, lambda m: int(m.group(1)) * 60), (_ONE_HOUR, lambda m: 60)):
+        m = pattern.search(text)
+        if m:
+            used.append(m.span())
+            return minutes(m)
+    return None
+
+
+def _actions(text, used):
+    action = {}
+    for pattern, key in ((_BLOCK, "block_doctor"), (_PREFER, "prefer_doctor"), (_ASSIGN, "assign_doctor")):
+        m = pattern.search(text)
+        if m:
+            action[key] = _doctor_name(m.group("name"))
+            used += [m.span("trigger"), m.span("doctor")]
+            break
+    minutes = _duration(text, used)
+    if minutes:
+        action["duration"] = minutes
+    return action
+
+
+def _leftover(text, used):
+    """Words of `text` outside the recognized spans that are not filler."""
+    chars = list(text)
+    for start, end in used:
+        chars[start:end] = " " * (end - start)
+    return [w for w in re.findall(r"[a-z0-9]+", "".join(chars).lower()) if w not in _FILLER]
+
+
+def parse_rule_locally(natural_rule: str):
+    """
+    Parse rules like "New patients over 65 must be booked for 60 minutes with Dr. Smith".
+    Returns {"condition": {...}, "action": {...}} or None if the text is not
+    fully understood (the caller then falls back to the LLM): every word must
+    belong to a recognized phrase or be filler, so a dropped qualifier or
+    negation can never turn into a confident, wrong rule.
+    """
+    text = " ".join(str(natural_rule or "").split())
+    if not text:
+        return None
+    used = []
+    condition = _conditions(text, used)
+    action = _actions(text, used)
+    if not condition or not action:
+        return None
+    # Several doctors in one sentence (e.g. "Smith, otherwise Johnson") is left to the LLM
+    doctors = {d.lower() for d in re.findall(_DOCTOR, text, re.I)}
+    if len(doctors) > 1:
+        return None
+    # "not ... for 30 minutes with Dr. X": which part the negation covers is ambiguous
+    if "block_doctor" in action and "duration" in action:
+        return None
+    if _leftover(text, used):
+        return None
+    return {"condition": condition, "action": action}
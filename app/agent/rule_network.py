@@ -0,0 +1,250 @@
+# app/agent/rule_network.py
+"""
+Rule matching through a discrimination network instead of a scan.
+
+Every condition is filed under its attribute: patient_type and exact values
+in hash tables, age thresholds in sorted arrays (one bisect per operator),
+name/insurer text by needle (the patient's value is cut into its substrings
+and each one is looked up). Matching a patient walks those indexes once and
+counts satisfied conditions per rule; a rule fires when all of its
+conditions have been counted. Rules that share nothing with the patient are
+never touched, so cost follows the rules that can fire, not the rule count.
+
+analyze() reports rule pairs that contradict or override each other.
+"""
+import math
+from bisect import bisect_left, bisect_right
+
+from agent.rules import AgePredicate, PatientTypePredicate, patient_age
+
+SUBSTRING_SCAN_MAX = 64  # longer values are checked needle by needle instead
+
+
+def _lookup(key, patient_core, patient_details):
+    """The value a Predicate would test: patient_details first, then patient_core."""
+    if patient_details and key in patient_details:
+        return patient_details.get(key)
+    return patient_core.get(key) if patient_core else None
+
+
+class RuleNetwork:
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self._need = [len(r.predicates) for r in self.rules]
+        self._always = [i for i, n in enumerate(self._need) if n == 0]
+        self._ptype = {}     # "new"/"returning" -> rule ids
+        self._ages = {}      # op -> (sorted thresholds, rule ids in the same order)
+        self._contains = {}  # key -> {lowercase needle: rule ids}
+        self._needle_len = {}
+        self._equals = {}    # key -> {value: rule ids}
+        self._generic = []   # (rule id, predicate) with unhashable values: evaluated directly
+        ages = {}
+        for i, rule in enumerate(self.rules):
+            for p in rule.predicates:
+                if isinstance(p, PatientTypePredicate):
+                    self._ptype.setdefault(p.value, []).append(i)
+                elif isinstance(p, AgePredicate):
+                    if p.threshold is not None:  # unparseable thresholds never match
+                        ages.setdefault(p.key, []).append((p.threshold, i))
+                elif p.value_lower is not None:
+                    self._contains.setdefault(p.key, {}).setdefault(p.value_lower, []).append(i)
+                    self._needle_len[p.key] = max(self._needle_len.get(p.key, 0), len(p.value_lower))
+                else:
+                    try:
+                        self._equals.setdefault(p.key, {}).setdefault(p.value, []).append(i)
+                    except TypeError:
+                        self._generic.append((i, p))
+        for op, entries in ages.items():
+            entries.sort()
+            self._ages[op] = ([t for t, _ in entries], [i for _, i in entries])
+
+    def __len__(self):
+        return len(self.rules)
+
+    # ---------- matching ----------
+    def match_ids(self, patient_core, patient_details):
+        """Indices of the rules whose conditions all hold, in rule order."""
+        counts = {}
+
+        def hit(ids):
+            for i in ids:
+                counts[i] = counts.get(i, 0) + 1
+
+        hit(self._ptype.get("new" if patient_core and patient_core.get("is_new") else "returning", ()))
+
+        if self._ages:
+            age = patient_age(patient_core)
+            if age is not None:
+                for op, (thresholds, ids) in self._ages.items():
+                    if op == "age_gte":
+                        hit(ids[:bisect_right(thresholds, age)])
+                    elif op == "age_gt":
+                        hit(ids[:bisect_left(thresholds, age)])
+                    elif op == "age_lte":
+                        hit(ids[bisect_left(thresholds, age):])
+                    else:  # age_lt
+                        hit(ids[bisect_right(thresholds, age):])
+
+        for key, needles in self._contains.items():
+            val = _lookup(key, patient_core, patient_details)
+            if not isinstance(val, str):
+                continue
+            v = val.lower()
+            if len(v) > SUBSTRING_SCAN_MAX:
+                for needle, ids in needles.items():
+                    if needle in v:
+                        hit(ids)
+                continue
+            hit(needles.get("", ()))
+            longest = self._needle_len[key]
+            seen = set()
+            for s in range(len(v)):
+                for e in range(s + 1, min(len(v), s + longest) + 1):
+                    sub = v[s:e]
+                    if sub not in seen:
+                        seen.add(sub)
+                        hit(needles.get(sub, ()))
+
+        for key, table in self._equals.items():
+            val = _lookup(key, patient_core, patient_details)
+            if val is None:
+                continue
+            try:
+                hit(table.get(val, ()))
+            except TypeError:
+                pass
+
+        for i, p in self._generic:
+            if p(patient_core, patient_details):
+                hit((i,))
+
+        need = self._need
+        return sorted([i for i, c in counts.items() if c == need[i]] + self._always)
+
+    def match(self, patient_core, patient_details):
+        return [self.rules[i] for i in self.match_ids(patient_core, patient_details)]
+
+    # ---------- analysis ----------
+    def analyze(self):
+        """
+        Pairs of rules that contradict or override each other, as dicts
+        {"kind", "rules": [i, j], "detail"}:
+          never_matches    conditions can't hold together (e.g. age_gte 70 + age_lt 60)
+          duplicate        same conditions and actions as an earlier rule
+          shadowed         a later, more general rule always overrides this duration
+          duration_conflict  overlapping rules set different durations (later wins)
+          assign_conflict  overlapping rules assign different doctors (no slots left)
+          assign_blocked   a rule blocks the doctor another one assigns
+          prefer_blocked   a rule blocks the doctor another one prefers
+        Two different texts on one attribute (insurer A vs insurer B) are
+        taken as exclusive unless one contains the other.
+        """
+        cons = [_Constraints(r) for r in self.rules]
+        findings = []
+        for i, c in enumerate(cons):
+            if c.empty:
+                findings.append({"kind": "never_matches", "rules": [i], "detail": "conditions exclude each other"})
+
+        def add(kind, i, j, detail):
+            findings.append({"kind": kind, "rules": [i, j], "detail": detail})
+
+        live = [i for i, c in enumerate(cons) if not c.empty]
+        seen = {}
+        for i in live:
+            r = self.rules[i]
+            sig = (cons[i].key(), r.assign_doctor, r.block_doctor, r.prefer_doctor, r.duration)
+            if sig in seen:
+                add("duplicate", seen[sig], i, f"rule {i} repeats rule {seen[sig]}")
+            else:
+                seen[sig] = i
+
+        durations = [i for i in live if self.rules[i].duration is not None]
+        for x, i in enumerate(durations):
+            for j in durations[x + 1:]:
+                a, b = self.rules[i], self.rules[j]
+                if a.duration == b.duration or not cons[i].compatible(cons[j]):
+                    continue
+                if cons[j].covers(cons[i]):
+                    add("shadowed", i, j, f"rule {j} ({b.duration} min) always overrides rule {i} ({a.duration} min)")
+                elif not cons[i].covers(cons[j]):
+                    add("duration_conflict", i, j, f"{a.duration} vs {b.duration} min; rule {j} wins where both match")
+
+        assigns = [i for i in live if self.rules[i].assign_doctor is not None]
+        blocks = [i for i in live if self.rules[i].block_doctor is not None]
+        prefers = [i for i in live if self.rules[i].prefer_doctor is not None]
+        for x, i in enumerate(assigns):
+            for j in assigns[x + 1:]:
+                a, b = self.rules[i].assign_doctor, self.rules[j].assign_doctor
+                if a not in b and b not in a and cons[i].compatible(cons[j]):
+                    add("assign_conflict", i, j, f"assign '{a}' and '{b}' together leave no doctor")
+        for kind, group, attr in (("assign_blocked", assigns, "assign_doctor"),
+                                  ("prefer_blocked", prefers, "prefer_doctor")):
+            for i in group:
+                target = getattr(self.rules[i], attr)
+                for j in blocks:
+                    if i != j and self.rules[j].block_doctor in target and cons[i].compatible(cons[j]):
+                        add(kind, i, j, f"'{target}' is blocked by rule {j}")
+        return findings
+
+
+class _Constraints:
+    """One rule's conditions in a form that can be intersected and compared."""
+
+    def __init__(self, rule):
+        self.ptype = None
+        self.lo, self.hi = -math.inf, math.inf  # whole years, inclusive
+        self.contains = {}
+        self.equals = {}
+        self.empty = False
+        for p in rule.predicates:
+            if isinstance(p, PatientTypePredicate):
+                self.ptype = p.value
+            elif isinstance(p, AgePredicate):
+                t = p.threshold
+                if t is None:
+                    self.empty = True
+                elif p.key == "age_gte":
+                    self.lo = max(self.lo, math.ceil(t))
+                elif p.key == "age_gt":
+                    self.lo = max(self.lo, math.floor(t) + 1)
+                elif p.key == "age_lte":
+                    self.hi = min(self.hi, math.floor(t))
+                else:
+                    self.hi = min(self.hi, math.ceil(t) - 1)
+            elif p.value_lower is not None:
+                self.contains[p.key] = p.value_lower
+            else:
+                self.equals[p.key] = p.value
+        if self.lo > self.hi or self.ptype not in (None, "new", "returning"):
+            self.empty = True
+
+    def key(self):
+        return (self.ptype, self.lo, self.hi, tuple(sorted(self.contains.items())),
+                tuple(sorted((k, repr(v)) for k, v in self.equals.items())))
+
+    def compatible(self, other) -> bool:
+        """Can one patient satisfy both?"""
+        if self.ptype and other.ptype and self.ptype != other.ptype:
+            return False
+        if max(self.lo, other.lo) > min(self.hi, other.hi):
+            return False
+        for k, v in self.equals.items():
+            if k in other.contains or (k in other.equals and other.equals[k] != v):
+                return False
+        for k, n in self.contains.items():
+            if k in other.equals:
+                return False
+            m = other.contains.get(k)
+            if m is not None and n not in m and m not in n:
+                return False
+        return True
+
+    def covers(self, other) -> bool:
+        """Does every patient matching `other` also match self?"""
+        if self.ptype and self.ptype != other.ptype:
+            return False
+        if self.lo > other.lo or self.hi < other.hi:
+            return False
+        if any(k not in other.equals or other.equals[k] != v for k, v in self.equals.items()):
+            return False
+        return all(k in other.contains and n in other.contains[k] for k, n in self.contains.items())
@@ -1,105 +1,402 @@
 # app/agent/rules.py
 import os
 import json
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
 
-RULES_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "rules.json")
+import numpy as np
+
+from agent import metrics
+from agent.locks import file_lock
+from agent.patient_db import normalize_dob
+from agent.schedule_store import file_stamp
 
-def ensure_rules_file():
-    d = os.path.dirname(RULES_PATH)
-    os.makedirs(d, exist_ok=True)
-    if not os.path.exists(RULES_PATH):
-        with open(RULES_PATH, "w") as f:
-            json.dump([], f)
+RULES_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "rules.json")
 
 def load_rules():
-    ensure_rules_file()
-    with open(RULES_PATH, "r") as f:
-        return json.load(f)
+    """Current rule entries (shared; treat as read-only). Re-read only when rules.json changed."""
+    return get_ruleset().current().entries
 
 def save_rule(rule_obj, raw_text=None):
     """
     Append rule_obj (dict) to rules.json; optionally store raw natural text.
     """
-    ensure_rules_file()
-    rules = load_rules()
     # store both parsed and raw text for traceability
-    entry = {"rule": rule_obj}
-    if raw_text:
-        entry["raw"] = raw_text
-    rules.append(entry)
-    with open(RULES_PATH, "w") as f:
-        json.dump(rules, f, indent=2)
+    get_ruleset().add([(rule_obj, raw_text)])
+    return True
+
+def save_rules(entries):
+    """
+    Append several (rule_obj, raw_text) pairs with a single file write.
+    """
+    get_ruleset().add(entries)
     return True
 
 def delete_rule(index):
-    rules = load_rules()
-    if 0 <= index < len(rules):
-        rules.pop(index)
-        with open(RULES_PATH, "w") as f:
-            json.dump(rules, f, indent=2)
-        return True
-    return False
-
-# Simple rule applier (keeps logic small & deterministic)
+    return get_ruleset().delete(index)
+
+# ---------- Compiled rule evaluation ----------
+# Rules are compiled once into predicate/action objects; slot filtering and
+# ranking then run as numpy mask/sort operations over slot columns.
+
+class Predicate:
+    """Equality/contains check of one condition key, as the admin wrote it."""
+
+    def __init__(self, key, value):
+        self.key = key
+        self.value = value
+        self.value_lower = value.lower() if isinstance(value, str) else None
+
+    def __call__(self, patient_core, patient_details):
+        k = self.key
+        # check patient_details first then patient_core
+        val = patient_details.get(k) if patient_details and k in patient_details else patient_core.get(k) if patient_core else None
+        if val is None:
+            return False
+        # case-insensitive compare if strings
+        if self.value_lower is not None and isinstance(val, str):
+            return self.value_lower in val.lower()
+        return val == self.value
+
+
+class PatientTypePredicate(Predicate):
+    def __call__(self, patient_core, patient_details):
+        ptype = "new" if patient_core and patient_core.get("is_new") else "returning"
+        return ptype == self.value
+
+
+AGE_OPS = {
+    "age_gt": lambda age, v: age > v,
+    "age_gte": lambda age, v: age >= v,
+    "age_lt": lambda age, v: age < v,
+    "age_lte": lambda age, v: age <= v,
+}
+
+
+def patient_age(patient_core, today=None):
+    """Age in whole years from patient_core["dob"], or None if it can't be parsed."""
+    dob = normalize_dob((patient_core or {}).get("dob"))
+    try:
+        born = datetime.strptime(dob, "%Y-%m-%d").date()
+    except ValueError:
+        return None
+    today = today or date.today()
+    return today.year - born.year - ((today.month, today.day) < (born.month, born.day))
+
+
+class AgePredicate(Predicate):
+    def __init__(self, key, value):
+        super().__init__(key, value)
+        self.op = AGE_OPS[key]
+        try:
+            self.threshold = float(value)
+        except (TypeError, ValueError):
+            self.threshold = None
+
+    def __call__(self, patient_core, patient_details):
+        if self.threshold is None:
+            return False
+        age = patient_age(patient_core)
+        return age is not None and self.op(age, self.threshold)
+
+
+def make_predicate(key, value):
+    if key == "patient_type":
+        return PatientTypePredicate(key, value)
+    if key in AGE_OPS:
+        return AgePredicate(key, value)
+    return Predicate(key, value)
+
+
+class CompiledRule:
+    def __init__(self, rule: dict):
+        condition = rule.get("condition", {}) or {}
+        action = rule.get("action", {}) or {}
+        self.predicates = [make_predicate(k, v) for k, v in condition.items()]
+        self.assign_doctor = str(action["assign_doctor"]).lower() if "assign_doctor" in action else None
+        self.block_doctor = str(action["block_doctor"]).lower() if "block_doctor" in action else None
+        self.prefer_doctor = str(action["prefer_doctor"]).lower() if "prefer_doctor" in action else None
+        try:
+            self.duration = int(action["duration"]) if "duration" in action else None
+        except Exception:
+            self.duration = None
+
+    def matches(self, patient_core, patient_details):
+        return all(p(patient_core, patient_details) for p in self.predicates)
+
+
+class SlotColumns:
+    """Column view of a slot list: doctor ids plus date and time arrays."""
+
+    def __init__(self, slots):
+        self.n = len(slots)
+        doctors = [str(s.get("doctor", "")).lower() for s in slots]
+        self.doctor_names, self.doctor_ids = np.unique(np.array(doctors, dtype=object), return_inverse=True)
+        self.dates = np.array([s.get("date", "") for s in slots], dtype=object)
+        self.times = np.array([s.get("time", "") for s in slots], dtype=object)
+        self._masks = {}
+
+    def doctor_mask(self, needle):
+        """Boolean mask of slots whose doctor name contains `needle` (lowercase)."""
+        mask = self._masks.get(needle)
+        if mask is None:
+            # substring test once per distinct doctor, then broadcast over slots
+            per_doctor = np.array([needle in d for d in self.doctor_names], dtype=bool)
+            mask = per_doctor[self.doctor_ids] if self.n else np.zeros(0, dtype=bool)
+            self._masks[needle] = mask
+        return mask
+
+
+_COMPILED_CACHE = {}
+_COMPILED_CACHE_MAX = 8
+
+
+def compile_rules(rules):
+    """Compile rule entries (as returned by load_rules) once per distinct rule set."""
+    fingerprint = json.dumps(rules, sort_keys=True, default=str)
+    compiled = _COMPILED_CACHE.get(fingerprint)
+    if compiled is None:
+        compiled = [CompiledRule(entry.get("rule", {}) or {}) for entry in rules]
+        if len(_COMPILED_CACHE) >= _COMPILED_CACHE_MAX:
+            _COMPILED_CACHE.pop(next(iter(_COMPILED_CACHE)))
+        _COMPILED_CACHE[fingerprint] = compiled
+    return compiled
+
+
+def rule_duration(matched):
+    """Duration override of the matched rules (the last one wins), or None."""
+    duration_override = None
+    for r in matched:
+        if r.duration is not None:
+            duration_override = r.duration
+    return duration_override
+
+
+def rank_slots(matched, cols: SlotColumns):
+    """
+    Indices of the slots the matched rules allow, preferred doctors first and
+    otherwise in the given order.
+    """
+    mask = np.ones(cols.n, dtype=bool)
+    prefer_keys = []
+    for r in matched:
+        if r.assign_doctor is not None:
+            mask &= cols.doctor_mask(r.assign_doctor)
+        if r.block_doctor is not None:
+            mask &= ~cols.doctor_mask(r.block_doctor)
+        if r.prefer_doctor is not None:
+            # 0 = preferred doctor first
+            prefer_keys.append(~cols.doctor_mask(r.prefer_doctor))
+
+    keep = np.flatnonzero(mask)
+    if prefer_keys and len(keep):
+        # Stable lexsort with the last prefer rule as primary key, which equals
+        # re-sorting stably once per prefer_doctor rule in order.
+        order = np.lexsort([k[keep] for k in prefer_keys])
+        keep = keep[order]
+    return keep
+
+
+@metrics.timed("rules_apply")
 def apply_rules(patient_core, patient_details, slots, rules):
     """
     patient_core: {"first_name","last_name","dob","patient_type":"new"/"returning" optional}
     patient_details: {"email","phone","insurance_company","member_id","group_number"}
     slots: list of slot dicts: {"date","time","doctor",...}
-    rules: list loaded from load_rules() -> entries with "rule"
+    rules: list loaded from load_rules() -> entries with "rule" (or compile_rules() output)
     Returns: (filtered_slots, duration_override or None)
     """
-    duration_override = None
-    filtered_slots = slots[:]  # start with all available
+    compiled = rules if rules and isinstance(rules[0], CompiledRule) else compile_rules(rules or [])
+    matched = [r for r in compiled if r.matches(patient_core, patient_details)]
+    return apply_matched(matched, slots)
+
+
+def apply_matched(matched, slots):
+    """apply_rules() once the matching rules are known (in rule order)."""
+    duration_override = rule_duration(matched)
+
+    if not any(r.assign_doctor or r.block_doctor or r.prefer_doctor for r in matched):
+        return slots[:], duration_override
+
+    keep = rank_slots(matched, SlotColumns(slots))
+    return [slots[i] for i in keep], duration_override
+
+
+# ---------- Versioned rule set ----------
+class RuleSet:
+    """
+    rules.json held in memory: entries, their compiled form and a version
+    that moves whenever the content does. current() re-reads the file only
+    when its mtime/size changed; writes replace it by rename under a
+    cross-process lock, so readers never see a half-written file.
+
+    apply() matches through a RuleNetwork (see rule_network) and memoizes
+    per (version, patient profile signature, slot-set version): patients who
+    agree on every attribute the rules look at get the same answer for the
+    same slots without evaluating again.
+    """
+
+    MEMO_SIZE = 1024
+
+    def __init__(self, path: str = None):
+        self.path = path or RULES_PATH
+        self.version = 0
+        self.entries = []
+        self.compiled = []
+        self.network = None
+        self._keys = ()
+        self._report = None
+        self._stamp = None
+        self._lock = threading.RLock()
+        self._memo = OrderedDict()
+
+    # ---------- loading ----------
+    def current(self):
+        with self._lock:
+            stamp = file_stamp(self.path)
+            if stamp is None:
+                with self._file_lock():
+                    # another process may have created it (and added rules) meanwhile
+                    if file_stamp(self.path) is None:
+                        self._write([])
+                    else:
+                        self._read()
+            elif stamp != self._stamp:
+                self._read()
+            return self
+
+    def _read(self):
+        """Load the file as it is now (a missing file is an empty rule set)."""
+        stamp = file_stamp(self.path)
+        entries = []
+        if stamp is not None:
+            with open(self.path, "r") as f:
+                entries = json.load(f)
+        self._set(entries, stamp)
+        return entries
+
+    def invalidate(self):
+        """Force a re-read on the next current()."""
+        with self._lock:
+            self._stamp = None
+
+    def _set(self, entries, stamp):
+        self.entries = entries
+        from agent.rule_network import RuleNetwork  # imports this module
+        self.compiled = [CompiledRule(entry.get("rule", {}) or {}) for entry in entries]
+        self.network = RuleNetwork(self.compiled)
+        self._report = None
+        # condition keys in first-seen order: what a profile signature has to cover
+        self._keys = tuple(dict.fromkeys(p.key for r in self.compiled for p in r.predicates))
+        self._stamp = stamp
+        self.version += 1
+        self._memo.clear()
+
+    # ---------- writes ----------
+    def _write(self, entries):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(entries, f, indent=2)
+        os.replace(tmp, self.path)
+        self._set(entries, file_stamp(self.path))
+
+    def _file_lock(self):
+        """
+        Cross-process lock for creating and editing the file: its own lock file,
+        not a stripe shared with the doctor-day booking locks.
+        """
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        return file_lock(f"{self.path}.lock")
 
-    for entry in rules:
-        rule = entry.get("rule", {})
-        condition = rule.get("condition", {})
-        action = rule.get("action", {})
+    def _update(self, change):
+        """Read-modify-write against the latest file, serialized across processes."""
+        with self._lock, self._file_lock():
+            entries = list(self._read())
+            result = change(entries)
+            if result is not False:
+                self._write(entries)
+            return result
 
-        # Evaluate condition — simplistic equals/contains check
-        match = True
-        for k, v in condition.items():
+    def add(self, pairs):
+        """Append (rule_obj, raw_text) pairs in one write."""
+        def change(entries):
+            for rule_obj, raw_text in pairs:
+                entry = {"rule": rule_obj}
+                if raw_text:
+                    entry["raw"] = raw_text
+                entries.append(entry)
+        self._update(change)
+
+    def delete(self, index) -> bool:
+        def change(entries):
+            if not 0 <= index < len(entries):
+                return False
+            entries.pop(index)
+            return True
+        return self._update(change)
+
+    # ---------- evaluation ----------
+    def signature(self, patient_core, patient_details):
+        """The profile as the rules see it: the value of every condition key they test."""
+        sig = []
+        for k in self._keys:
             if k == "patient_type":
-                ptype = "new" if patient_core and patient_core.get("is_new") else "returning"
-                if ptype != v:
-                    match = False; break
+                v = bool(patient_core and patient_core.get("is_new"))
+            elif k in AGE_OPS:
+                v = patient_age(patient_core)
+            elif patient_details and k in patient_details:
+                v = patient_details.get(k)
             else:
-                # check patient_details first then patient_core
-                val = patient_details.get(k) if patient_details and k in patient_details else patient_core.get(k) if patient_core else None
-                if val is None:
-                    match = False; break
-                # case-insensitive compare if strings
-                if isinstance(v, str) and isinstance(val, str):
-                    if v.lower() not in val.lower():
-                        match = False; break
-                else:
-                    if val != v:
-                        match = False; break
-
-        if not match:
-            continue
-
-        # Apply action
-        if "assign_doctor" in action:
-            doc = action["assign_doctor"]
-            filtered_slots = [s for s in filtered_slots if doc.lower() in s.get("doctor", "").lower()]
-
-        if "block_doctor" in action:
-            doc = action["block_doctor"]
-            filtered_slots = [s for s in filtered_slots if doc.lower() not in s.get("doctor", "").lower()]
-
-        if "prefer_doctor" in action:
-            doc = action["prefer_doctor"].lower()
-            # sort so preferred doctor appears first
-            filtered_slots = sorted(filtered_slots, key=lambda s: 0 if doc in s.get("doctor","").lower() else 1)
-
-        if "duration" in action:
-            try:
-                duration_override = int(action["duration"])
-            except Exception:
-                pass
-
-        # other actions can be added as needed
-
-    return filtered_slots, duration_override
+                v = patient_core.get(k) if patient_core else None
+            if isinstance(v, str):
+                v = v.lower()  # string conditions match case-insensitively
+            sig.append(v if v is None or isinstance(v, (str, int, float, bool)) else repr(v))
+        return tuple(sig)
+
+    def apply(self, patient_core, patient_details, slots, slots_version=None):
+        """
+        apply_rules() with the compiled rules. Pass slots_version (anything
+        hashable that changes whenever `slots` would) to reuse earlier results.
+        """
+        with self._lock:
+            version, network = self.version, self.network
+            key = None
+            if slots_version is not None:
+                key = (version, self.signature(patient_core, patient_details), slots_version)
+                hit = self._memo.get(key)
+                if hit is not None:
+                    self._memo.move_to_end(key)
+                    metrics.inc("rules_memo", outcome="hit")
+                    return list(hit[0]), hit[1]
+        result = apply_matched(network.match(patient_core, patient_details), slots)
+        if key is not None:
+            metrics.inc("rules_memo", outcome="miss")
+            with self._lock:
+                if self.version == version:
+                    self._memo[key] = result
+                    if len(self._memo) > self.MEMO_SIZE:
+                        self._memo.popitem(last=False)
+        return list(result[0]), result[1]
+
+    def report(self):
+        """RuleNetwork.analyze() findings for the current rules (computed once per version)."""
+        with self._lock:
+            if self._report is None:
+                self._report = self.network.analyze()
+            return self._report
+
+
+_rulesets = {}
+_rulesets_lock = threading.Lock()
+
+
+def get_ruleset(path: str = None) -> RuleSet:
+    """The process-wide RuleSet for `path` (default: RULES_PATH)."""
+    path = path or RULES_PATH
+    with _rulesets_lock:
+        rs = _rulesets.get(path)
+        if rs is None:
+            rs = _rulesets[path] = RuleSet(path)
+        return rs
@@ -0,0 +1,252 @@
+# app/agent/schedule_store.py
+"""
+Columnar doctor schedule: one .npy file per column, opened as NumPy memmaps.
+
+    CURRENT                  name of the live generation directory
+    gen-000002-xxxx/
+        meta.json            row count and the doctor names
+        doctor.npy     int32   category code into meta.json["doctors"]
+        day.npy        int32   days since 1970-01-01
+        minute.npy     int16   minutes since midnight
+        available.npy  uint8   1 = offered (edited in place)
+
+Every write() fills a new generation directory and then switches CURRENT
+with one os.replace, so a reader maps either all old or all new columns.
+Stores written before generations existed (the files directly in the store
+directory) are still read.
+
+Rows are sorted by (doctor, day, minute), so a slot is found with one binary
+search. Loading maps the files instead of parsing them; Excel is only an
+import/export format (see scripts/convert_schedule.py).
+"""
+import json
+import os
+import re
+import shutil
+import tempfile
+from datetime import date as date_cls, timedelta
+
+import numpy as np
+import pandas as pd
+
+from agent import metrics
+
+EPOCH = date_cls(1970, 1, 1)
+COLUMNS = {"doctor": np.int32, "day": np.int32, "minute": np.int16, "available": np.uint8}
+META_FILE = "meta.json"
+CURRENT_FILE = "CURRENT"
+FORMAT_VERSION = 2  # 2: generation directories behind CURRENT
+_GENERATION = re.compile(r"gen-(\d+)-")
+
+
+def store_dir_for(xlsx_path: str) -> str:
+    """The store that sits next to a schedule workbook (app/data/schedule for the default one)."""
+    return os.path.join(os.path.dirname(xlsx_path), "schedule")
+
+
+def day_number(date_str: str) -> int:
+    return (date_cls.fromisoformat(str(date_str)[:10]) - EPOCH).days
+
+
+def day_string(day: int) -> str:
+    return (EPOCH + timedelta(days=int(day))).isoformat()
+
+
+def minute_number(time_str: str) -> int:
+    h, m = str(time_str).split(":")[:2]
+    return int(h) * 60 + int(m)
+
+
+def file_stamp(path):
+    """(mtime_ns, size) of a file, or None when it doesn't exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class ScheduleStore:
+    def __init__(self, path: str):
+        self.path = path
+        self.doctors = []
+        self.cols = {}
+        self._doctor_codes = {}
+        self._keys = None
+        self.generation = None  # loaded generation directory (None: flat layout)
+
+    # ---------- files ----------
+    def _current(self):
+        """Name of the live generation directory, or None for the flat pre-generation layout."""
+        try:
+            with open(os.path.join(self.path, CURRENT_FILE)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _dir(self, generation=None):
+        return os.path.join(self.path, generation) if generation else self.path
+
+    def _file(self, name, generation=None):
+        return os.path.join(self._dir(generation), f"{name}.npy")
+
+    def exists(self) -> bool:
+        return self._current() is not None or os.path.exists(os.path.join(self.path, META_FILE))
+
+    def stamp(self):
+        """Changes whenever the store is rewritten or edited in place."""
+        generation = self._current()
+        return (generation, file_stamp(os.path.join(self._dir(generation), META_FILE)),
+                file_stamp(self._file("available", generation)))
+
+    def write(self, doctors, doctor, day, minute, available):
+        """
+        Replace the store with new columns (sorted here). They are written to a
+        fresh generation directory and published by switching CURRENT, so
+        readers see all old or all new columns, never a mix.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        doctor = np.asarray(doctor, dtype=COLUMNS["doctor"])
+        day = np.asarray(day, dtype=COLUMNS["day"])
+        minute = np.asarray(minute, dtype=COLUMNS["minute"])
+        available = np.asarray(available, dtype=COLUMNS["available"])
+        order = np.lexsort((minute, day, doctor))
+
+        previous = self._current()
+        number = self._generation_number(previous) + 1
+        folder = tempfile.mkdtemp(dir=self.path, prefix=f"gen-{number:06d}-")
+        generation = os.path.basename(folder)
+        for name, col in (("doctor", doctor), ("day", day), ("minute", minute), ("available", available)):
+            with open(self._file(name, generation), "wb") as f:
+                np.save(f, np.ascontiguousarray(col[order]))
+        meta = {"format": FORMAT_VERSION, "generation": number, "rows": int(len(order)),
+                "doctors": list(doctors)}
+        with open(os.path.join(folder, META_FILE), "w") as f:
+            json.dump(meta, f)
+
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix=".current-")
+        with os.fdopen(fd, "w") as f:
+            f.write(generation)
+        os.replace(tmp, os.path.join(self.path, CURRENT_FILE))
+        self._drop_old_generations(previous)
+        return self.load()
+
+    @staticmethod
+    def _generation_number(generation):
+        m = _GENERATION.match(generation or "")
+        return int(m.group(1)) if m else 0
+
+    def _drop_old_generations(self, previous):
+        """
+        Delete generations older than the one just replaced (which a reader may
+        still be opening), and the pre-generation flat files. Open memmaps of
+        deleted files stay valid.
+        """
+        keep_from = self._generation_number(previous)
+        for entry in os.listdir(self.path):
+            m = _GENERATION.match(entry)
+            if m and int(m.group(1)) < keep_from:
+                shutil.rmtree(os.path.join(self.path, entry), ignore_errors=True)
+        for legacy in [self._file(name) for name in COLUMNS] + [os.path.join(self.path, META_FILE)]:
+            try:
+                os.remove(legacy)
+            except OSError:  # already gone, or still mapped (Windows)
+                pass
+
+    def load(self):
+        """Map the columns of the live generation (no parsing; pages are read on first touch)."""
+        with metrics.span("schedule_store_load"):
+            for attempt in range(3):
+                generation = self._current()
+                try:
+                    with open(os.path.join(self._dir(generation), META_FILE)) as f:
+                        meta = json.load(f)
+                    cols = {name: np.load(self._file(name, generation), mmap_mode="r") for name in COLUMNS}
+                    # availability is the only column edited after import
+                    cols["available"] = np.load(self._file("available", generation), mmap_mode="r+")
+                    break
+                except FileNotFoundError:
+                    # two writes went by between reading CURRENT and opening its files
+                    if attempt == 2:
+                        raise
+            self.generation = generation
+            self.doctors = list(meta["doctors"])
+            self._doctor_codes = {name: i for i, name in enumerate(self.doctors)}
+            self.cols = cols
+            self._keys = None
+        return self
+
+    def __len__(self):
+        return len(self.cols.get("day", ()))
+
+    # ---------- conversions ----------
+    def from_dataframe(self, df: pd.DataFrame):
+        """Columns date, time, doctor, available (the workbook layout)."""
+        doctor = df["doctor"].astype(str)
+        codes, doctors = pd.factorize(doctor, sort=True)
+        dates = pd.to_datetime(df["date"].astype(str).str[:10], format="%Y-%m-%d")
+        day = ((dates - pd.Timestamp(EPOCH)) // pd.Timedelta(days=1)).to_numpy()
+        minute = df["time"].astype(str).map(minute_number).to_numpy()
+        available = df["available"].astype(bool).to_numpy() if "available" in df else np.ones(len(df), bool)
+        return self.write(list(doctors), codes, day, minute, available)
+
+    def import_excel(self, xlsx_path: str):
+        with metrics.span("schedule_import_excel"):
+            return self.from_dataframe(pd.read_excel(xlsx_path))
+
+    def to_dataframe(self) -> pd.DataFrame:
+        day, minute = np.asarray(self.cols["day"]), np.asarray(self.cols["minute"])
+        uniq, inv = np.unique(day, return_inverse=True)
+        date_names = np.array([day_string(d) for d in uniq], dtype=object)
+        return pd.DataFrame({
+            "date": date_names[inv],
+            "time": [f"{m // 60:02d}:{m % 60:02d}" for m in minute.tolist()],
+            "doctor": np.asarray(self.doctors, dtype=object)[np.asarray(self.cols["doctor"])],
+            "available": np.asarray(self.cols["available"]).astype(bool),
+        })
+
+    def export_excel(self, target):
+        """Write the schedule as a workbook (path or binary buffer)."""
+        self.to_dataframe().to_excel(target, index=False, engine="openpyxl")
+        return target
+
+    # ---------- queries ----------
+    def dates(self):
+        return [day_string(d) for d in np.unique(np.asarray(self.cols["day"])).tolist()]
+
+    def _sort_keys(self):
+        if self._keys is None:
+            self._keys = ((np.asarray(self.cols["doctor"], dtype=np.int64) << 32)
+                          | (np.asarray(self.cols["day"], dtype=np.int64) * 1440
+                             + np.asarray(self.cols["minute"], dtype=np.int64)))
+        return self._keys
+
+    def _row(self, date, time, doctor):
+        code = self._doctor_codes.get(doctor)
+        if code is None:
+            return None
+        key = (code << 32) | (day_number(date) * 1440 + minute_number(time))
+        keys = self._sort_keys()
+        i = int(np.searchsorted(keys, key))
+        return i if i < len(keys) and keys[i] == key else None
+
+    def set_available(self, date, time, doctor, available: bool) -> bool:
+        """Flip one slot in place (no rewrite). Returns False if the slot is not in the schedule."""
+        i = self._row(date, time, doctor)
+        if i is None:
+            return False
+        self.cols["available"][i] = 1 if available else 0
+        self.cols["available"].flush()
+        os.utime(self._file("available", self.generation))  # mmap writes don't reliably bump mtime; stamp() relies on it
+        return True
+
+    def iter_rows(self):
+        """(doctor, date, minute, available) for every row, decoding each day once."""
+        day_names = {}
+        cols = zip(np.asarray(self.cols["doctor"]).tolist(), np.asarray(self.cols["day"]).tolist(),
+                   np.asarray(self.cols["minute"]).tolist(), np.asarray(self.cols["available"]).tolist())
+        for code, d, m, a in cols:
+            name = day_names.get(d)
+            if name is None:
+                name = day_names[d] = day_string(d)
+            yield self.doctors[code], name, m, bool(a)
@@ -1,75 +1,237 @@
 import pandas as pd
 import os
-from datetime import datetime, timedelta
+import threading
+from dataclasses import dataclass, field
+from datetime import date as date_cls, timedelta
+from typing import List, Optional
+
+from agent import metrics
+from agent.appointments import AppointmentRepository, SlotConflict
+from agent.availability import AvailabilityIndex, LazyAvailabilityIndex, to_time, to_unit, units_for
+from agent.availability_templates import (ALL_DOCTORS, AvailabilityTemplates, default_templates,
+                                          templates_path_for)
+from agent.locks import file_lock, striped_lock
+from agent.schedule_store import ScheduleStore, file_stamp, minute_number, store_dir_for
 
 SCHEDULE_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "doctor_schedule.xlsx")
 
+@dataclass
+class BookingResult:
+    """Outcome of Scheduler.book_slot; truthy when the booking went through."""
+    ok: bool
+    appointment_id: Optional[int] = None
+    reason: str = ""
+    conflicts: List[int] = field(default_factory=list)  # ids of overlapping appointments
+
+    def __bool__(self):
+        return self.ok
+
+
 class Scheduler:
-    def __init__(self, path: str = SCHEDULE_PATH):
+    def __init__(self, path: str = SCHEDULE_PATH, repo: AppointmentRepository = None,
+                 store_dir: str = None, templates_path: str = None, lock_dir: str = None):
+        # `path` is the workbook the schedule was first imported from. The live
+        # schedule is either recurring templates (availability.json) or the
+        # memory-mapped column store, both next to it; templates win.
         self.path = path
-        # If doctor schedule file doesn’t exist → create dummy schedule
-        if not os.path.exists(self.path):
-            self._create_default_schedule()
-        self.df = pd.read_excel(self.path)
-
-    def _create_default_schedule(self):
-        doctors = ["Smith", "Johnson"]
-        today = datetime.today().date()
-        slots = []
-        for d in range(7):  # next 7 days
-            day = today + timedelta(days=d)
-            for doctor in doctors:
-                for hour in range(9, 17):  # 9 AM - 5 PM
-                    slot_time = f"{hour:02d}:00"
-                    slots.append({
-                        "date": day.strftime("%Y-%m-%d"),
-                        "time": slot_time,
-                        "doctor": doctor,
-                        "available": True
-                    })
-        df = pd.DataFrame(slots)
-        os.makedirs(os.path.dirname(self.path), exist_ok=True)
-        df.to_excel(self.path, index=False)
+        self.repo = repo or AppointmentRepository()
+        # doctor-day locks live next to the appointments they guard (app/data/locks
+        # by default), so schedulers over different databases never contend
+        self.lock_dir = lock_dir or os.path.join(os.path.dirname(os.path.abspath(self.repo.path)), "locks")
+        self.store = ScheduleStore(store_dir or store_dir_for(path))
+        self.templates = None
+        templates = AvailabilityTemplates(templates_path or templates_path_for(path))
+        if templates.exists():
+            self.templates = templates.load()
+        elif self.store.exists():
+            self.store.load()
+        elif os.path.exists(self.path):
+            self.store.import_excel(self.path)
+        else:
+            # no schedule at all → create dummy schedule
+            self.templates = default_templates(templates.path)
+        self._templates_path = templates.path
+        self.stamp = self.source_stamp()  # what this instance has seen on disk (see Resources)
+        self._index_lock = threading.Lock()
+        self._seen_change = self.repo.last_change()
+        self.index = self._build_index()
+        # rows stored without a duration hold one slot, as the index counts them
+        self.repo.use_slot_length(self.index.slot_minutes)
+
+    def source_stamp(self):
+        return file_stamp(self._templates_path), self.store.stamp()
+
+    def _build_index(self):
+        with metrics.span("availability_index_build"):
+            if self.templates is not None:
+                # expanded per doctor-day on first use
+                return LazyAvailabilityIndex(self.templates, self.repo.claimed_units)
+            return AvailabilityIndex.build_from_store(self.store, self.repo.booked_ranges())
+
+    @property
+    def df(self) -> pd.DataFrame:
+        """The schedule as a DataFrame (date, time, doctor, available); built on each access."""
+        if self.templates is None:
+            return self.store.to_dataframe()
+        rows = [{"date": day, "time": f"{m // 60:02d}:{m % 60:02d}", "doctor": doctor, "available": True}
+                for day in self.templates.window() for doctor in self.templates.doctors()
+                for m, _ in self.templates.day_starts(doctor, day)]
+        return pd.DataFrame(rows, columns=["date", "time", "doctor", "available"])
+
+    def doctors(self):
+        return self.templates.doctors() if self.templates is not None else list(self.store.doctors)
+
+    def dates(self):
+        """Schedule dates (with templates: the open-search window)."""
+        return self.templates.window() if self.templates is not None else self.store.dates()
+
+    def refresh(self):
+        """Pull bookings/cancellations made by other processes into the index."""
+        seq, changed = self.repo.changes_since(self._seen_change)
+        with self._index_lock:
+            for doctor, date in changed:
+                self.index.reset_day(date, doctor, self.repo.claimed_units(doctor, date))
+            self._seen_change = max(self._seen_change, seq)
+
+    def set_slot_available(self, date: str, time: str, doctor: str, available: bool) -> bool:
+        """
+        Offer or withdraw one schedule slot. Only that doctor-day of the index
+        is recomputed; the store's availability column is updated in place, or
+        with templates a one-slot block is added / lifted.
+        Returns False if the slot is not part of the schedule.
+        """
+        with striped_lock(f"{doctor}|{date}", self.lock_dir):
+            if self.templates is not None:
+                start = f"{date} {time}"
+                end = f"{date} {to_time(to_unit(time) + units_for(self.index.slot_minutes))}"
+                if available:
+                    self.unblock_time(doctor, start, end)
+                    return self._offered(date, time, doctor)
+                return self._offered(date, time, doctor) and self.block_time(doctor, start, end)
+            if not self.store.set_available(date, time, doctor, available):
+                return False
+            with self._index_lock:
+                self.index.set_offered(date, time, doctor, available, self.repo.claimed_units(doctor, date))
+            self.stamp = self.source_stamp()
+        return True
+
+    def _offered(self, date, time, doctor):
+        minute = minute_number(time)
+        return any(m == minute for m, _ in self.templates.day_starts(doctor, date))
+
+    def block_time(self, doctor: str, start: str, end: str, reason: str = "") -> bool:
+        """
+        Block [start, end) ("YYYY-MM-DD[ HH:MM]") for a doctor, or for everyone
+        with doctor "*": leave, holidays, meetings. Needs recurring templates;
+        returns False on a materialized schedule.
+        """
+        if self.templates is None:
+            return False
+        self._edit_templates(lambda t: t.block(doctor, start, end, reason), doctor, start, end)
+        return True
+
+    def unblock_time(self, doctor: str, start: str, end: str) -> bool:
+        if self.templates is None:
+            return False
+        self._edit_templates(lambda t: t.unblock(doctor, start, end), doctor, start, end)
+        return True
+
+    def _edit_templates(self, edit, doctor, start, end):
+        """
+        Apply `edit` to the template file as it is on disk now, under the
+        file's cross-process lock, so edits made by other processes since we
+        loaded it are kept rather than overwritten.
+        """
+        with file_lock(self.templates.lock_path()), self._index_lock:
+            stale = file_stamp(self._templates_path) != self.stamp[0]
+            self.templates.load()
+            edit(self.templates)
+            self.templates.save()
+            if stale:
+                # someone else changed the file too: any cached day may be out of date
+                self.index.invalidate()
+            else:
+                # end is exclusive; "YYYY-MM-DD" alone means midnight, so that day is untouched
+                last = end[:10] if len(end) > 10 else (date_cls.fromisoformat(end[:10]) - timedelta(days=1)).isoformat()
+                self.index.invalidate(None if doctor == ALL_DOCTORS else doctor, start[:10], last)
+            self.stamp = self.source_stamp()
 
     def get_available_slots(self, minutes_required: int, chosen_date: str = None, doctor: str = None):
-        """Return available slots for a specific date (default: today)."""
-        df_avail = self.df[self.df['available'] == True]
-        if chosen_date:
-            df_avail = df_avail[df_avail['date'] == chosen_date]
-        if doctor:
-            df_avail = df_avail[df_avail['doctor'] == doctor]
-
-        # Remove already booked from appointments.xlsx
-        appt_file = os.path.join("app", "data", "appointments.xlsx")
-        if os.path.exists(appt_file) and not df_avail.empty:
-            booked_df = pd.read_excel(appt_file)
-            booked_keys = set(zip(booked_df["date"], booked_df["time"], booked_df["doctor"]))
-            df_avail = df_avail[~df_avail.apply(
-                lambda r: (r["date"], r["time"], r["doctor"]) in booked_keys, axis=1
-            )]
-
-        return df_avail.to_dict(orient="records")
-
-    def book_slot(self, date: str, time: str, doctor: str):
-        """Book a slot if available and not already booked."""
-        idx = self.df.index[
-            (self.df['date'] == date) & (self.df['time'] == time) & (self.df['doctor'] == doctor)
-        ]
-        if len(idx) > 0 and self.df.loc[idx, 'available'].all():
-            # Double-booking check against appointments.xlsx
-            appt_file = os.path.join("app", "data", "appointments.xlsx")
-            if os.path.exists(appt_file):
-                booked_df = pd.read_excel(appt_file)
-                conflict = booked_df[
-                    (booked_df['date'] == date) &
-                    (booked_df['time'] == time) &
-                    (booked_df['doctor'] == doctor)
-                ]
-                if not conflict.empty:
-                    return False  # already taken
-
-            # Mark unavailable in doctor schedule
-            self.df.loc[idx, 'available'] = False
-            self.df.to_excel(self.path, index=False)
-            return True
-        return False
+        """
+        Return slot starts with `minutes_required` of contiguous free time,
+        optionally for a specific date and/or doctor.
+        """
+        return self.get_available_slots_versioned(minutes_required, chosen_date, doctor)[1]
+
+    def get_available_slots_versioned(self, minutes_required: int, chosen_date: str = None, doctor: str = None):
+        """
+        (slot-set version, slots): the version is equal for two calls only if
+        they returned the same slots, so results derived from them can be cached.
+        """
+        with metrics.span("scheduler_get_available_slots"):
+            self.refresh()
+            with self._index_lock:
+                # open-ended searches with templates cover a window that starts today
+                window = None if chosen_date else date_cls.today().isoformat()
+                version = (self.index.uid, self.index.version, minutes_required, chosen_date, doctor, window)
+                return version, self.index.slots(date=chosen_date, doctor=doctor, minutes=minutes_required)
+
+    def book_slot(self, date: str, time: str, doctor: str, record: dict = None, minutes: int = None):
+        """
+        Book `minutes` (default: the record's duration, else one slot) starting
+        at `time` if `time` is a slot start the schedule offers on a date not
+        in the past and that whole range is free, storing `record` in the
+        appointment repository (a bare call stores a "Blocked" entry).
+
+        Safe across sessions and processes: the doctor-day's striped file lock
+        is held while the range is claimed, and the claim itself is a
+        compare-and-swap on the slot_claims primary key.
+        """
+        with metrics.span("scheduler_book_slot"):
+            result = self._book_slot(date, time, doctor, record, minutes)
+        metrics.inc("bookings", outcome="booked" if result else "conflict")
+        return result
+
+    def _book_slot(self, date, time, doctor, record, minutes):
+        minutes = minutes or (record or {}).get("duration") or self.index.slot_minutes
+        stored = {**(record or {"status": "Blocked"}), "date": date, "time": time,
+                  "doctor": doctor, "duration": minutes}
+
+        if str(date)[:10] < date_cls.today().isoformat():
+            return BookingResult(False, reason="Date is in the past.")
+        with striped_lock(f"{doctor}|{date}", self.lock_dir):
+            self.refresh()
+            with self._index_lock:
+                # only the starts the schedule offers, not any free stretch of the day
+                if not self.index.offers(date, time, doctor):
+                    return BookingResult(False, reason="Slot is not offered.")
+                if not self.index.is_free(date, time, doctor, minutes):
+                    return BookingResult(False, reason="Slot is already taken.")
+            try:
+                appt_id = self.repo.add(stored)
+            except SlotConflict as e:
+                self.refresh()
+                return BookingResult(False, reason="Slot was just taken by another booking.",
+                                     conflicts=e.holders)
+            with self._index_lock:
+                self.index.book(date, time, doctor, minutes)
+            # our change is in the log after anything other processes wrote since
+            # the last refresh: replay the log rather than jumping past it
+            self.refresh()
+        return BookingResult(True, appointment_id=appt_id)
+
+    def release_slot(self, date: str, time: str, doctor: str, minutes: int = None):
+        """Return a booked range to the pool of available time (in this process's index)."""
+        with self._index_lock:
+            return self.index.release(date, time, doctor, minutes)
+
+    def cancel_appointment(self, appt_id: int, reason: str = None):
+        """Cancel a stored appointment and free its slot. Returns the updated row."""
+        before = self.repo.get(appt_id)
+        if before is None:
+            return None
+        with striped_lock(f"{before['doctor']}|{before['date']}", self.lock_dir):
+            row = self.repo.cancel(appt_id, reason)
+            if not str(before.get("status") or "").startswith("Cancelled"):
+                self.release_slot(row["date"], row["time"], row["doctor"], row.get("duration"))
+        return row
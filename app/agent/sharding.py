@@ -0,0 +1,349 @@
+# app/agent/sharding.py
+"""
+Sharded scheduling: doctors are partitioned into shards, each with its own
+schedule and appointments.db under app/data/shards/shard-NN/ and owned by
+one worker process that applies every booking for it. ShardRouter offers
+the Scheduler API in front of them: calls naming a doctor go to that
+doctor's shard, cross-doctor searches fan out to all shards in parallel and
+are merged. Bookings for different shards never share a file or a lock
+(each shard keeps its doctor-day locks in shard-NN/locks/), so throughput
+grows with the number of shards/cores.
+
+Appointment ids are global: local id * shard count + shard number.
+
+    python scripts/shard_data.py --shards 4                # split app/data
+    python app/booking_api.py serve --shards-dir app/data/shards
+"""
+import heapq
+import json
+import multiprocessing
+import os
+import threading
+import zlib
+
+import pandas as pd
+
+from agent.appointments import AppointmentRepository
+from agent.availability_templates import ALL_DOCTORS, AvailabilityTemplates, templates_path_for
+from agent.schedule_store import ScheduleStore, store_dir_for
+from agent.scheduler import BookingResult, Scheduler
+
+SHARDS_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "shards")
+CONFIG_FILE = "shards.json"
+
+# Scheduler / repository calls a worker will run for the router
+WORKER_METHODS = {
+    "get_available_slots", "book_slot", "cancel_appointment", "release_slot",
+    "set_slot_available", "block_time", "unblock_time", "doctors", "dates",
+    "repo.get", "repo.query", "repo.count", "index.slots", "index.free_bits",
+}
+
+
+class ShardError(Exception):
+    """A shard worker failed to run a call (the message carries the worker's error)."""
+
+
+def shard_dir(shards_dir: str, k: int) -> str:
+    return os.path.join(shards_dir, f"shard-{k:02d}")
+
+
+def shard_paths(directory: str):
+    """(schedule workbook path, appointments.db path) for a data or shard directory."""
+    return os.path.join(directory, "doctor_schedule.xlsx"), os.path.join(directory, "appointments.db")
+
+
+def to_global(local_id, k, n_shards):
+    return None if local_id is None else int(local_id) * n_shards + k
+
+
+def from_global(appt_id, n_shards):
+    """-> (shard, local id)"""
+    local, k = divmod(int(appt_id), n_shards)
+    return k, local
+
+
+class ShardConfig:
+    """Shard count plus optional pinned doctors (e.g. one clinic per shard); others hash."""
+
+    def __init__(self, n_shards: int, doctors: dict = None):
+        self.n_shards = int(n_shards)
+        if self.n_shards < 1:
+            raise ValueError(f"need at least one shard, got {self.n_shards}")
+        self.doctors = {}
+        for doctor, k in (doctors or {}).items():
+            k = int(k)
+            if not 0 <= k < self.n_shards:
+                raise ValueError(f"{doctor} is pinned to shard {k}, but shards are 0..{self.n_shards - 1}")
+            self.doctors[doctor] = k
+
+    def shard_for(self, doctor: str) -> int:
+        k = self.doctors.get(doctor)
+        return k if k is not None else zlib.crc32(str(doctor).encode("utf-8")) % self.n_shards
+
+    @classmethod
+    def load(cls, shards_dir: str = SHARDS_DIR):
+        with open(os.path.join(shards_dir, CONFIG_FILE)) as f:
+            data = json.load(f)
+        return cls(data["shards"], data.get("doctors"))
+
+    def save(self, shards_dir: str = SHARDS_DIR):
+        os.makedirs(shards_dir, exist_ok=True)
+        path = os.path.join(shards_dir, CONFIG_FILE)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump({"shards": self.n_shards, "doctors": self.doctors}, f, indent=2)
+        os.replace(f"{path}.tmp", path)
+
+
+# ---------- partitioning ----------
+def partition(data_dir: str, shards_dir: str, config: ShardConfig):
+    """
+    Split a single-node data directory (schedule + appointments.db) into
+    shard directories. Appointment ids are renumbered per shard.
+    Returns {shard: (doctors, appointments)}.
+    """
+    xlsx, db = shard_paths(data_dir)
+    source = Scheduler(xlsx, repo=AppointmentRepository(db, legacy_xlsx=None))
+    config.save(shards_dir)
+    appointments = source.repo.to_dataframe()
+    appt_shard = appointments["doctor"].map(config.shard_for)
+    if source.templates is None:
+        schedule = source.store.to_dataframe()
+        sched_shard = schedule["doctor"].map(config.shard_for)
+
+    summary = {}
+    for k in range(config.n_shards):
+        target = shard_dir(shards_dir, k)
+        os.makedirs(target, exist_ok=True)
+        t_xlsx, t_db = shard_paths(target)
+        doctors = [d for d in source.doctors() if config.shard_for(d) == k]
+        if source.templates is not None:
+            t = AvailabilityTemplates(templates_path_for(t_xlsx))
+            t.horizon_days = source.templates.horizon_days
+            t.entries = [e for e in source.templates.entries if config.shard_for(str(e["doctor"])) == k]
+            t.blocks = [b for b in source.templates.blocks
+                        if b["doctor"] == ALL_DOCTORS or config.shard_for(b["doctor"]) == k]
+            t.save()
+        else:
+            ScheduleStore(store_dir_for(t_xlsx)).from_dataframe(schedule[sched_shard == k])
+        if os.path.exists(t_db):
+            os.remove(t_db)
+        rows = appointments[appt_shard == k].drop(columns=["id", "created_at", "updated_at"])
+        AppointmentRepository(t_db, legacy_xlsx=None).import_records(
+            rows.astype(object).where(pd.notna(rows), None).to_dict(orient="records"))
+        summary[k] = (doctors, len(rows))
+    return summary
+
+
+# ---------- worker ----------
+def _serve_shard(directory, conn):
+    """Worker process: own one shard's Scheduler and run the router's calls in order."""
+    xlsx, db = shard_paths(directory)
+    templates = AvailabilityTemplates(templates_path_for(xlsx))
+    if not templates.exists() and not ScheduleStore(store_dir_for(xlsx)).exists() and not os.path.exists(xlsx):
+        templates.save()  # a shard without doctors: empty, not the two-doctor demo schedule
+    scheduler = Scheduler(xlsx, repo=AppointmentRepository(db, legacy_xlsx=None))
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+        if msg is None:
+            break
+        method, args, kwargs = msg
+        try:
+            if method not in WORKER_METHODS:
+                raise ShardError(f"method not allowed: {method}")
+            prefix = method.split(".")[0]
+            target = {"repo": scheduler.repo, "index": scheduler.index}.get(prefix, scheduler)
+            conn.send((True, getattr(target, method.split(".")[-1])(*args, **kwargs)))
+        except Exception as e:  # reported to the router, the worker keeps serving
+            conn.send((False, f"{type(e).__name__}: {e}"))
+
+
+class _Shard:
+    __slots__ = ("process", "conn", "lock")
+
+    def __init__(self, process, conn):
+        self.process, self.conn, self.lock = process, conn, threading.Lock()
+
+
+# ---------- router ----------
+class ShardRouter:
+    """Scheduler-compatible front end over the shard workers (thread-safe)."""
+
+    def __init__(self, shards_dir: str = SHARDS_DIR):
+        self.shards_dir = shards_dir
+        self.config = ShardConfig.load(shards_dir)
+        self.n = self.config.n_shards
+        ctx = multiprocessing.get_context("spawn")
+        self._shards = []
+        for k in range(self.n):
+            parent, child = ctx.Pipe()
+            p = ctx.Process(target=_serve_shard, args=(shard_dir(shards_dir, k), child),
+                            name=f"shard-{k:02d}", daemon=True)
+            p.start()
+            child.close()
+            self._shards.append(_Shard(p, parent))
+        self.repo = ShardedRepository(self)
+        self.index = ShardedIndex(self)
+
+    # ---------- transport ----------
+    @staticmethod
+    def _result(reply):
+        ok, value = reply
+        if not ok:
+            raise ShardError(value)
+        return value
+
+    def _exchange(self, k, msg=None, send=True, recv=True):
+        conn = self._shards[k].conn
+        try:
+            if send:
+                conn.send(msg)
+            return conn.recv() if recv else None
+        except (EOFError, OSError) as e:
+            raise ShardError(f"shard {k} worker is not running ({e})") from e
+
+    def call(self, k, method, *args, **kwargs):
+        with self._shards[k].lock:
+            return self._result(self._exchange(k, (method, args, kwargs)))
+
+    def fan_out(self, calls):
+        """calls: {shard: (method, args, kwargs)}. Sends all before waiting, so shards work in parallel."""
+        ks = sorted(calls)
+        for k in ks:  # fixed order: concurrent fan-outs can't deadlock
+            self._shards[k].lock.acquire()
+        try:
+            for k in ks:
+                self._exchange(k, calls[k], recv=False)
+            replies = {k: self._exchange(k, send=False) for k in ks}
+        finally:
+            for k in ks:
+                self._shards[k].lock.release()
+        return {k: self._result(replies[k]) for k in ks}
+
+    def _all(self, method, *args, **kwargs):
+        return self.fan_out({k: (method, args, kwargs) for k in range(self.n)})
+
+    def close(self):
+        for shard in self._shards:
+            with shard.lock:
+                try:
+                    shard.conn.send(None)
+                except OSError:
+                    pass
+            shard.process.join(timeout=5)
+
+    # ---------- Scheduler API ----------
+    def refresh(self):
+        """Each worker keeps its own index current; nothing to pull here."""
+
+    def doctors(self):
+        return sorted({d for ds in self._all("doctors").values() for d in ds})
+
+    def dates(self):
+        return sorted({d for ds in self._all("dates").values() for d in ds})
+
+    def get_available_slots(self, minutes_required: int, chosen_date: str = None, doctor: str = None):
+        if doctor is not None:
+            return self.call(self.config.shard_for(doctor), "get_available_slots",
+                             minutes_required, chosen_date, doctor)
+        slots = [s for part in self._all("get_available_slots", minutes_required, chosen_date).values()
+                 for s in part]
+        slots.sort(key=lambda s: (s["date"], s["time"], s["doctor"]))
+        return slots
+
+    def book_slot(self, date: str, time: str, doctor: str, record: dict = None, minutes: int = None):
+        k = self.config.shard_for(doctor)
+        result = self.call(k, "book_slot", date, time, doctor, record=record, minutes=minutes)
+        return BookingResult(result.ok, to_global(result.appointment_id, k, self.n), result.reason,
+                             [to_global(c, k, self.n) for c in result.conflicts])
+
+    def cancel_appointment(self, appt_id: int, reason: str = None):
+        k, local = from_global(appt_id, self.n)
+        return self.repo.globalize(self.call(k, "cancel_appointment", local, reason), k)
+
+    def release_slot(self, date: str, time: str, doctor: str, minutes: int = None):
+        return self.call(self.config.shard_for(doctor), "release_slot", date, time, doctor, minutes)
+
+    def set_slot_available(self, date: str, time: str, doctor: str, available: bool) -> bool:
+        return self.call(self.config.shard_for(doctor), "set_slot_available", date, time, doctor, available)
+
+    def block_time(self, doctor: str, start: str, end: str, reason: str = "") -> bool:
+        if doctor == ALL_DOCTORS:
+            return all(self._all("block_time", doctor, start, end, reason).values())
+        return self.call(self.config.shard_for(doctor), "block_time", doctor, start, end, reason)
+
+    def unblock_time(self, doctor: str, start: str, end: str) -> bool:
+        if doctor == ALL_DOCTORS:
+            return all(self._all("unblock_time", doctor, start, end).values())
+        return self.call(self.config.shard_for(doctor), "unblock_time", doctor, start, end)
+
+
+class ShardedIndex:
+    """
+    Read-only view of the shards' slot indexes: the part of AvailabilityIndex
+    the waitlist planner reads (slots, free_bits). Doctors never span shards,
+    so a doctor-day's bitmap comes whole from its shard.
+    """
+
+    def __init__(self, router: ShardRouter):
+        self.router = router
+
+    def slots(self, date=None, doctor=None, minutes=None):
+        if doctor is not None:
+            return self.router.call(self.router.config.shard_for(doctor), "index.slots",
+                                    date=date, doctor=doctor, minutes=minutes)
+        return [s for part in self.router._all("index.slots", date=date, minutes=minutes).values()
+                for s in part]
+
+    def free_bits(self, date, doctor) -> int:
+        return self.router.call(self.router.config.shard_for(doctor), "index.free_bits", date, doctor)
+
+
+class ShardedRepository:
+    """The read side of AppointmentRepository across shards (get, query, count) with global ids."""
+
+    def __init__(self, router: ShardRouter):
+        self.router = router
+
+    def globalize(self, row, k):
+        if row is not None:
+            row["id"] = to_global(row["id"], k, self.router.n)
+        return row
+
+    def get(self, appt_id: int):
+        k, local = from_global(appt_id, self.router.n)
+        return self.globalize(self.router.call(k, "repo.get", local), k)
+
+    def count(self, **filters) -> int:
+        return sum(self.router._all("repo.count", **filters).values())
+
+    def query(self, date_from: str = None, date_to: str = None, doctor: str = None,
+              status: str = None, patient: str = None, sort: str = "date",
+              descending: bool = False, after=None, limit: int = 50):
+        """
+        One merged page. The cursor is one keyset cursor per shard, so each
+        shard resumes exactly after the last row it contributed.
+        """
+        filters = dict(date_from=date_from, date_to=date_to, doctor=doctor, status=status,
+                       patient=patient, sort=sort, descending=descending, limit=limit, with_sort_keys=True)
+        after = list(after) if after else [None] * self.router.n
+        pages = self.router.fan_out({
+            k: ("repo.query", (), {**filters, "after": tuple(after[k]) if after[k] else None})
+            for k in range(self.router.n)
+        })
+        # rows of each shard are already in order: merge, don't sort
+        streams = [[(tuple("" if v is None else v for v in r["_sort_key"]), k, r) for r in pages[k][0]]
+                   for k in range(self.router.n)]
+        merged = list(heapq.merge(*streams, key=lambda e: e[:2], reverse=descending))
+        taken = merged[:limit]
+        cursors = list(after)
+        for _, k, r in taken:
+            cursors[k] = list(r["_sort_key"])
+        more = len(merged) > limit or any(pages[k][1] is not None for k in range(self.router.n))
+        rows = []
+        for _, k, r in taken:
+            del r["_sort_key"]
+            rows.append(self.globalize(r, k))
+        return rows, (cursors if more else None)
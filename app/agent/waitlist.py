@@ -0,0 +1,133 @@
+# app/agent/waitlist.py
+"""
+Bulk placement of a waitlist onto free slots.
+
+Patients whose rules come out the same (matched rules + visit length) share
+one cost vector: the rule-filtered candidate slots ranked preferred doctor
+first, then earliest. Patients are then taken from a priority queue (lower
+priority value first, ties in list order) and each gets the cheapest
+candidate that is still free in a scratch copy of the slot bitmaps. Taken
+candidates never free up again during a plan, so each group walks its
+ranking once: placing P patients over S slots costs O(S log S) per group
+plus O(P log P), not O(P * S).
+"""
+import heapq
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from datetime import date
+from typing import List, Optional
+
+from agent import metrics
+from agent.availability import range_mask, to_unit, units_for
+from agent.policy import duration_for_patient_type
+from agent.rule_network import RuleNetwork
+from agent.rules import CompiledRule, SlotColumns, compile_rules, rank_slots, rule_duration
+
+
+@dataclass
+class Placement:
+    position: int           # index into the waitlist
+    patient: str            # full name
+    date: str
+    time: str
+    doctor: str
+    minutes: int
+    appointment_id: Optional[int] = None
+    reason: str = ""        # why booking the planned slot failed, if it did
+
+
+@dataclass
+class WaitlistPlan:
+    placements: List[Placement] = field(default_factory=list)
+    unplaced: List[int] = field(default_factory=list)  # waitlist positions with no feasible slot
+
+    @property
+    def booked(self):
+        return [p for p in self.placements if p.appointment_id is not None]
+
+
+def _in_range(slot, date_from, date_to):
+    return (date_from is None or slot["date"] >= date_from) and (date_to is None or slot["date"] <= date_to)
+
+
+@metrics.timed("waitlist_plan")
+def plan_waitlist(index, patients, rules, priorities=None, date_from=None, date_to=None, doctor=None,
+                  lock=None):
+    """
+    index: AvailabilityIndex (read only; the plan works on a copy of its free bits)
+    patients: objects with core(), details(), is_new and full_name (BookingService's Patient)
+    rules: load_rules() entries, compile_rules() output or a RuleNetwork
+    priorities: optional numbers, one per patient (lower goes first)
+    date_from: first date to place on (default: today)
+    lock: held while the index is read, when other threads update it; the
+          candidates and their free bits are then copied in one go
+    """
+    if isinstance(rules, RuleNetwork):
+        network = rules
+    else:
+        network = RuleNetwork(rules if rules and isinstance(rules[0], CompiledRule) else compile_rules(rules or []))
+    compiled = network.rules
+    date_from = date_from or date.today().isoformat()
+
+    # ---- group patients with identical rule outcomes ----
+    groups = {}  # (matched rule ids, minutes) -> [positions]
+    for i, p in enumerate(patients):
+        core, details = p.core(), p.details()
+        matched = tuple(network.match_ids(core, details))
+        minutes = rule_duration([compiled[j] for j in matched]) or duration_for_patient_type(p.is_new)
+        groups.setdefault((matched, minutes), []).append(i)
+
+    # ---- candidate slots per visit length ----
+    candidates = {}  # minutes -> chronological slots
+    free = {}        # (doctor, date) -> scratch free bits
+    with lock or nullcontext():
+        for minutes in {m for _, m in groups}:
+            slots = [s for s in index.slots(doctor=doctor, minutes=minutes) if _in_range(s, date_from, date_to)]
+            slots.sort(key=lambda s: (s["date"], s["time"], s["doctor"]))
+            candidates[minutes] = slots
+        if lock is not None:
+            # bookings may change the index once the lock is released: copy the bits now
+            for slots in candidates.values():
+                for s in slots:
+                    day = (s["doctor"], s["date"])
+                    if day not in free:
+                        free[day] = index.free_bits(s["date"], s["doctor"])
+
+    # ---- ranked once per group ----
+    candidates = {m: (slots, SlotColumns(slots)) for m, slots in candidates.items()}
+    ranking = {key: rank_slots([compiled[j] for j in key[0]], candidates[key[1]][1]) for key in groups}
+
+    group_of = {i: key for key, members in groups.items() for i in members}
+    cursor = dict.fromkeys(groups, 0)
+
+    heap = [((priorities[i] if priorities else 0), i) for i in range(len(patients))]
+    heapq.heapify(heap)
+    plan = WaitlistPlan()
+    while heap:
+        _, i = heapq.heappop(heap)
+        key = group_of[i]
+        minutes = key[1]
+        slots = candidates[minutes][0]
+        order = ranking[key]
+        n_units = units_for(minutes)
+        placed = None
+        while cursor[key] < len(order):
+            s = slots[order[cursor[key]]]
+            cursor[key] += 1
+            day = (s["doctor"], s["date"])
+            bits = free.get(day)
+            if bits is None:
+                bits = free[day] = index.free_bits(s["date"], s["doctor"])
+            mask = range_mask(to_unit(s["time"]), n_units)
+            if bits & mask == mask:
+                free[day] = bits & ~mask
+                placed = s
+                break
+        if placed is None:
+            plan.unplaced.append(i)
+            continue
+        plan.placements.append(Placement(i, patients[i].full_name, placed["date"], placed["time"],
+                                         placed["doctor"], minutes))
+    metrics.inc("waitlist_placed", len(plan.placements))
+    metrics.inc("waitlist_unplaced", len(plan.unplaced))
+    return plan
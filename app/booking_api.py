@@ -0,0 +1,262 @@
+# app/booking_api.py
+"""
+Booking without the browser: a Typer CLI over BookingService, plus a small
+JSON HTTP API that keeps one service (and its slot index) warm per process.
+
+    python app/booking_api.py identify Jane Doe 1990-01-01
+    python app/booking_api.py slots Jane Doe 1990-01-01 --date 2025-09-05
+    python app/booking_api.py book Jane Doe 1990-01-01 2025-09-05 10:00 Smith --email j@x.io
+    python app/booking_api.py cancel 42 --reason "Doctor unavailable"
+    python app/booking_api.py waitlist waitlist.csv --date-from 2025-09-05 --dry-run
+    python app/booking_api.py block Smith "2025-12-24" "2025-12-27" --reason Holiday
+    python app/booking_api.py check-rules
+    python app/booking_api.py serve --port 8082 [--shards-dir app/data/shards]
+        POST /identify  {"first_name", "last_name", "dob"}
+        POST /slots     {"patient": {...}, "date"?, "doctor"?}
+        POST /book      {"patient": {...}, "date", "time", "doctor", "minutes"?, "notify"?}
+        POST /cancel    {"appointment_id", "reason"?}
+        POST /waitlist  {"patients": [{..., "priority"?}], "date_from"?, "date_to"?, "doctor"?,
+                         "dry_run"?, "notify"?}
+        GET  /appointments?doctor=&status=&date_from=&date_to=&patient=&sort=&limit=
+                           &after=<next_cursor of the previous page, as JSON>
+        GET  /metrics   (Prometheus text; metrics are switched on by `serve`)
+"""
+import csv
+import json
+import logging
+from dataclasses import asdict, fields
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+import typer
+
+from agent import metrics
+from agent.booking_service import BookingService, Patient, get_booking_service
+
+app = typer.Typer(help="Headless booking: identify, find slots, book and cancel.")
+
+PATIENT_FIELDS = {f.name for f in fields(Patient)}
+
+
+def _echo(data):
+    typer.echo(json.dumps(data, indent=2, default=str))
+
+
+def _patient(service, first_name, last_name, dob, **details):
+    """Identify, then apply any contact/insurance details given on the command line."""
+    patient = service.identify(first_name, last_name, dob).patient
+    for key, value in details.items():
+        if value is not None:
+            setattr(patient, key, value)
+    return patient
+
+
+def patient_from_json(data: dict) -> Patient:
+    return Patient(**{k: v for k, v in data.items() if k in PATIENT_FIELDS})
+
+
+@app.command()
+def identify(first_name: str, last_name: str, dob: str):
+    """Look a patient up (exact match, else close matches)."""
+    found = get_booking_service().identify(first_name, last_name, dob)
+    _echo(asdict(found))
+
+
+@app.command()
+def slots(first_name: str, last_name: str, dob: str,
+          date: Optional[str] = None, doctor: Optional[str] = None,
+          insurance_company: Optional[str] = typer.Option(None, "--insurance")):
+    """Available slots for a patient, with scheduling rules applied."""
+    service = get_booking_service()
+    patient = _patient(service, first_name, last_name, dob, insurance_company=insurance_company)
+    _echo(asdict(service.find_slots(patient, date=date, doctor=doctor)))
+
+
+@app.command()
+def book(first_name: str, last_name: str, dob: str, date: str, time: str, doctor: str,
+         email: Optional[str] = None, phone: Optional[str] = None,
+         insurance_company: Optional[str] = typer.Option(None, "--insurance"),
+         minutes: Optional[int] = None, notify: bool = True):
+    """Book a slot; new patients are saved and the confirmation is queued."""
+    service = get_booking_service()
+    patient = _patient(service, first_name, last_name, dob,
+                       email=email, phone=phone, insurance_company=insurance_company)
+    result = service.book(patient, date, time, doctor, minutes=minutes, notify=notify)
+    _echo(result.summary())
+    raise typer.Exit(0 if result else 1)
+
+
+@app.command()
+def cancel(appointment_id: int, reason: Optional[str] = None, notify: bool = True):
+    """Cancel an appointment and notify the patient."""
+    row = get_booking_service().cancel(appointment_id, reason, notify=notify)
+    if row is None:
+        typer.echo(f"Appointment {appointment_id} not found.", err=True)
+        raise typer.Exit(1)
+    _echo(row)
+
+
+def _waitlist_patients(service, rows):
+    """Identify each waitlist row (to pick up stored details); row fields override. Returns (patients, priorities)."""
+    patients, priorities = [], []
+    for row in rows:
+        patient = service.identify(row["first_name"], row["last_name"], row["dob"]).patient
+        for key, value in row.items():
+            if key in PATIENT_FIELDS and key not in ("first_name", "last_name", "dob", "is_new") and value not in (None, ""):
+                setattr(patient, key, value)
+        patients.append(patient)
+        priorities.append(float(row.get("priority") or 0))
+    return patients, priorities
+
+
+@app.command()
+def waitlist(path: str, date_from: Optional[str] = None, date_to: Optional[str] = None,
+             doctor: Optional[str] = None, dry_run: bool = False, notify: bool = False):
+    """Place a CSV waitlist (first_name,last_name,dob[,priority,...]) onto free slots in one pass."""
+    service = get_booking_service()
+    with open(path, newline="", encoding="utf-8") as f:
+        patients, priorities = _waitlist_patients(service, list(csv.DictReader(f)))
+    plan = service.schedule_waitlist(patients, priorities, date_from=date_from, date_to=date_to,
+                                     doctor=doctor, dry_run=dry_run, notify=notify)
+    _echo(asdict(plan))
+
+
+@app.command()
+def block(doctor: str, start: str, end: str, reason: str = ""):
+    """Block [START, END) ("YYYY-MM-DD[ HH:MM]") on recurring availability; doctor "*" = everyone."""
+    if not get_booking_service().scheduler.block_time(doctor, start, end, reason):
+        typer.echo("Blocking time needs recurring availability templates (availability.json).", err=True)
+        raise typer.Exit(1)
+    typer.echo(f"Blocked {doctor} from {start} to {end}.")
+
+
+@app.command()
+def unblock(doctor: str, start: str, end: str):
+    """Lift a doctor's blocks over [START, END)."""
+    if not get_booking_service().scheduler.unblock_time(doctor, start, end):
+        typer.echo("Unblocking time needs recurring availability templates (availability.json).", err=True)
+        raise typer.Exit(1)
+    typer.echo(f"Unblocked {doctor} from {start} to {end}.")
+
+
+@app.command("check-rules")
+def check_rules():
+    """Report rules that never match, repeat, shadow or contradict each other."""
+    findings = get_booking_service().resources.ruleset().report()
+    _echo(findings)
+    if findings:
+        raise typer.Exit(1)
+
+
+# ---------- HTTP ----------
+def handle(service: BookingService, method: str, path: str, body: dict):
+    """Dispatch one API call; returns (status, payload)."""
+    url = urlsplit(path)
+    if method == "GET" and url.path == "/appointments":
+        q = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        limit = int(q.pop("limit", 50))
+        after = json.loads(q.pop("after")) if q.get("after") else None
+        allowed = {"date_from", "date_to", "doctor", "status", "patient", "sort"}
+        rows, cursor = service.scheduler.repo.query(**{k: v for k, v in q.items() if k in allowed},
+                                                    after=after, limit=limit)
+        return 200, {"appointments": rows, "next_cursor": cursor}
+    if method != "POST":
+        return 404, {"error": "not found"}
+    if url.path == "/identify":
+        return 200, asdict(service.identify(body["first_name"], body["last_name"], body["dob"]))
+    if url.path == "/slots":
+        search = service.find_slots(patient_from_json(body["patient"]),
+                                    date=body.get("date"), doctor=body.get("doctor"))
+        return 200, asdict(search)
+    if url.path == "/book":
+        result = service.book(patient_from_json(body["patient"]), body["date"], body["time"], body["doctor"],
+                              minutes=body.get("minutes"), notify=body.get("notify", True))
+        return (200 if result else 409), result.summary()
+    if url.path == "/waitlist":
+        patients, priorities = _waitlist_patients(service, body["patients"])
+        plan = service.schedule_waitlist(patients, priorities, date_from=body.get("date_from"),
+                                         date_to=body.get("date_to"), doctor=body.get("doctor"),
+                                         dry_run=body.get("dry_run", False), notify=body.get("notify", False))
+        return 200, asdict(plan)
+    if url.path == "/cancel":
+        row = service.cancel(int(body["appointment_id"]), body.get("reason"), notify=body.get("notify", True))
+        return (200, row) if row else (404, {"error": "appointment not found"})
+    return 404, {"error": "not found"}
+
+
+def make_handler(service: BookingService):
+    class BookingHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive: clients can pipeline many calls on one socket
+
+        def _dispatch(self, method):
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+                status, payload = handle(service, method, self.path, body)
+            except (KeyError, TypeError, ValueError) as e:
+                status, payload = 400, {"error": f"bad request: {e}"}
+            except Exception as e:
+                # always answer: an unhandled error would leave a keep-alive client waiting
+                metrics.log_error("api_request_failed", e, method=method, path=self.path)
+                status, payload = 500, {"error": "internal error"}
+            data = json.dumps(payload, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.split("?", 1)[0] == "/metrics":
+                data = metrics.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                return
+            self._dispatch("GET")
+
+        def do_POST(self):
+            self._dispatch("POST")
+
+        def log_request(self, code="-", size="-"):
+            metrics.log_event("api_request", method=self.command, path=self.path,
+                              status=getattr(code, "value", code), client=self.client_address[0])
+
+        def log_message(self, fmt, *args):
+            metrics.log_event("api_server_message", level=logging.WARNING, message=fmt % args,
+                              client=self.client_address[0])
+
+    return BookingHandler
+
+
+@app.command()
+def serve(host: str = "127.0.0.1", port: int = 8082,
+          shards_dir: Optional[str] = typer.Option(None, help="book through shard workers (see agent.sharding)")):
+    """Serve the JSON booking API (one warm service shared by all requests)."""
+    metrics.configure_logging()
+    metrics.enable()
+    metrics.start_exporter()
+    router = None
+    if shards_dir:
+        from agent.sharding import ShardRouter
+        router = ShardRouter(shards_dir)
+        service = BookingService(scheduler=router)
+        typer.echo(f"Routing to {router.n} shard workers in {shards_dir}")
+    else:
+        service = get_booking_service()
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    typer.echo(f"Booking API on http://{host}:{port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if router is not None:
+            router.close()
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,127 @@
+# app/calendar_feed.py
+"""
+Per-doctor / per-day calendar feeds streamed straight from the appointment store.
+
+    python app/calendar_feed.py serve --port 8081
+        GET /calendar/doctor/<doctor name>.ics
+        GET /calendar/day/<YYYY-MM-DD>.ics
+        GET /calendar/all.ics
+    python app/calendar_feed.py export --doctor "Dr. Smith" > smith.ics
+"""
+import argparse
+import logging
+import sys
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+from agent import metrics
+from agent.appointments import AppointmentRepository
+from utils.calendar import feed_etag, iter_calendar_feed
+
+
+def feed_for(repo, doctor=None, date=None):
+    """(chunk generator, etag, last-modified datetime or None, calendar name)."""
+    version = repo.feed_version(doctor=doctor, date=date)
+    last_modified = None
+    if version[1]:
+        last_modified = datetime.fromisoformat(version[1]).astimezone(timezone.utc)
+    name = doctor or (f"Appointments {date}" if date else "All appointments")
+    chunks = iter_calendar_feed(repo.iter_appointments(doctor=doctor, date=date), calendar_name=name)
+    return chunks, feed_etag(version), last_modified, name
+
+
+def _route(path):
+    """'/calendar/doctor/Dr.%20Smith.ics' -> {"doctor": "Dr. Smith"}; None if unknown."""
+    path = unquote(path.split("?", 1)[0])
+    if not path.startswith("/calendar/") or not path.endswith(".ics"):
+        return None
+    parts = path[len("/calendar/"):-len(".ics")].split("/", 1)
+    if parts == ["all"]:
+        return {}
+    if len(parts) == 2 and parts[0] == "doctor" and parts[1]:
+        return {"doctor": parts[1]}
+    if len(parts) == 2 and parts[0] == "day" and parts[1]:
+        return {"date": parts[1]}
+    return None
+
+
+def make_handler(repo):
+    class FeedHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            target = _route(self.path)
+            if target is None:
+                self.send_error(404, "Unknown feed")
+                return
+            chunks, etag, last_modified, _ = feed_for(repo, **target)
+
+            # Conditional GET: subscribers polling an unchanged feed get a 304
+            if self.headers.get("If-None-Match") == etag:
+                self._not_modified(etag)
+                return
+            ims = self.headers.get("If-Modified-Since")
+            if ims and last_modified and not self.headers.get("If-None-Match"):
+                try:
+                    if last_modified.replace(microsecond=0) <= parsedate_to_datetime(ims):
+                        self._not_modified(etag)
+                        return
+                except (TypeError, ValueError):
+                    pass
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/calendar; charset=utf-8")
+            self.send_header("ETag", etag)
+            if last_modified:
+                self.send_header("Last-Modified", format_datetime(last_modified, usegmt=True))
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            for chunk in chunks:
+                self.wfile.write(chunk)
+
+        def _not_modified(self, etag):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+
+        def log_request(self, code="-", size="-"):
+            metrics.log_event("feed_request", method=self.command, path=self.path,
+                              status=getattr(code, "value", code), client=self.client_address[0])
+
+        def log_message(self, fmt, *args):
+            metrics.log_event("feed_server_message", level=logging.WARNING, message=fmt % args,
+                              client=self.client_address[0])
+
+    return FeedHandler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="serve feeds over HTTP")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8081)
+    export = sub.add_parser("export", help="write one feed to stdout")
+    export.add_argument("--doctor")
+    export.add_argument("--date")
+    args = parser.parse_args(argv)
+
+    repo = AppointmentRepository()
+    if args.command == "export":
+        chunks, _, _, _ = feed_for(repo, doctor=args.doctor, date=args.date)
+        for chunk in chunks:
+            sys.stdout.buffer.write(chunk)
+        return 0
+
+    metrics.configure_logging()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(repo))
+    print(f"Serving calendar feeds on http://{args.host}:{args.port}/calendar/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
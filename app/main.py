@@ -1,47 +1,27 @@
 import streamlit as st
 from dotenv import load_dotenv
+import io
 import os
 import pandas as pd
-import uuid, random
-import re
-
-from datetime import datetime
-from agent.patient_db import PatientDB
-from agent.policy import duration_for_patient_type
-from agent.scheduler import Scheduler
-from agent.emailer import send_email
-from utils.calendar import create_ics_file
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-
-from agent.groq_client import parse_rule_to_json
-from agent.rules import load_rules, save_rule, delete_rule, apply_rules
-import json
 
-def validate_identity(first_name, last_name, dob):
-    errors = []
-    try:
-        dob_date = datetime.strptime(dob, "%Y-%m-%d").date()
-        if dob_date >= datetime.today().date():
-            errors.append("❌ DOB must be in the past.")
-    except ValueError:
-        errors.append("❌ DOB must be in YYYY-MM-DD format.")
-    return errors
+from agent import metrics
+from agent.booking_service import get_booking_service, validate_contact, validate_identity
+from agent.resources import get_resources
+from agent.appointments import COLUMNS as APPOINTMENT_COLUMNS, SORT_KEYS, STATUS_FILTERS
+from agent.outbox import get_outbox
 
-def validate_contact(email, phone, insurance):
-    errors = []
-    if not re.match(r"[^@]+@[^@]+\.[^@]+", email):
-        errors.append("❌ Invalid email address.")
-    if not re.match(r"^\+?\d{8,15}$", phone):
-        errors.append("❌ Phone must contain only digits (8–15 digits).")
-    if not insurance.strip():
-        errors.append("❌ Insurance company is required.")
-    return errors
+from agent.groq_client import parse_rule_to_json, parse_rules_bulk, read_rule_texts
+from agent.rules import save_rule, save_rules, delete_rule
+import json
 
 
 
 load_dotenv()
 
+# Structured JSON logs on stderr; METRICS_PORT / METRICS_FILE turn on the metrics exporter
+metrics.configure_logging()
+metrics.start_exporter()
+
 st.set_page_config(page_title="AI Scheduling Agent", page_icon="📅", layout="wide")
 
 st.title("📅 AI Scheduling Agent")
@@ -52,18 +32,18 @@ os.makedirs(os.path.join("app", "data"), exist_ok=True)
 # Sidebar switch
 mode = st.sidebar.radio("Select Mode", ["Patient Portal", "Admin Dashboard"])
 
-# Init DB + Scheduler
-db = PatientDB()
-scheduler = Scheduler()
+# Shared per process; rebuilt only when the schedule / patients / rules files change
+resources = get_resources()
+service = get_booking_service()
+scheduler = resources.scheduler()
 
 # ---------- Session state init ----------
 def init_state():
     defaults = {
         "minutes": None,
         "patient_found": False,
-        "is_new_patient": None,
-        "patient_core": None,
-        "patient_details": None,
+        "patient": None,
+        "patient_candidates": [],
         "available_slots": [],
         "available_dates": [],
         "selected_date": None,
@@ -77,10 +57,17 @@ def init_state():
 init_state()
 
 # Small helpers
-def gen_member_ids():
-    member_id = f"MBR-{uuid.uuid4().hex[:6].upper()}"
-    group_number = f"GRP-{random.randint(10000,99999)}"
-    return member_id, group_number
+def use_identification(found):
+    st.session_state.patient = found.patient
+    st.session_state.patient_found = found.found
+    st.session_state.patient_candidates = found.candidates
+    st.session_state.minutes = service.appointment_minutes(found.patient)
+
+def reset_scheduling():
+    st.session_state.available_slots = []
+    st.session_state.available_dates = []
+    st.session_state.selected_date = None
+    st.session_state.chosen_slot = None
 
 def require_nonempty(value, label):
     if not value or str(value).strip() == "":
@@ -108,68 +95,50 @@ if mode == "Patient Portal":
                 st.error(e)
             st.stop()
 
-
-        patient = db.find_patient(first_name, last_name, dob)
-
-        st.session_state.patient_core = {
-            "first_name": first_name.strip(),
-            "last_name": last_name.strip(),
-            "dob": dob.strip()
-        }
-
-        if patient:
-            # Existing
-            st.session_state.patient_found = True
-            st.session_state.is_new_patient = False
-            st.session_state.minutes = duration_for_patient_type(False)
-            st.session_state.patient_details = {
-                "email": patient.get("Email (patient)", ""),
-                "phone": patient.get("Phone (patient)", ""),
-                "insurance_company": patient.get("Insurance Company (carrier)", ""),
-                "member_id": patient.get("Member ID", ""),
-                "group_number": patient.get("Group Number", "")
-            }
-            st.success(f"Returning patient found: {patient['First Name']} {patient['Last Name']}")
+        found = service.identify(first_name, last_name, dob)
+        use_identification(found)
+        if found.found:
+            st.success(f"Returning patient found: {found.patient.first_name} {found.patient.last_name}")
         else:
-            # New patient
-            st.session_state.patient_found = False
-            st.session_state.is_new_patient = True
-            st.session_state.minutes = duration_for_patient_type(True)
-            mbr, grp = gen_member_ids()
-            st.session_state.patient_details = {
-                "email": "",
-                "phone": "",
-                "insurance_company": "",
-                "member_id": mbr,
-                "group_number": grp
-            }
             st.warning("New patient. Please fill your contact and insurance details.")
 
-        # Reset scheduling
-        st.session_state.available_slots = []
-        st.session_state.available_dates = []
-        st.session_state.selected_date = None
-        st.session_state.chosen_slot = None
+        reset_scheduling()
         st.rerun()
 
+    patient = st.session_state.patient
+
+    if patient and patient.is_new and st.session_state.patient_candidates:
+        st.info("We found existing records that look similar. Is one of these you?")
+        candidate = st.selectbox(
+            "Possible matches",
+            options=st.session_state.patient_candidates,
+            format_func=lambda c: (
+                f"{c['patient']['First Name']} {c['patient']['Last Name']} — "
+                f"DOB {c['patient']['Date of Birth (YYYY-MM-DD)']} (match {c['score']:.0%})"
+            ),
+            key="candidate_choice"
+        )
+        if st.button("Use selected record"):
+            use_identification(service.use_candidate(candidate["patient"]))
+            reset_scheduling()
+            st.rerun()
+
     # ---------- Step 2: Patient details ----------
-    if st.session_state.patient_core:
+    if patient:
         st.subheader("Step 2: Patient Details")
 
-        details = st.session_state.patient_details or {}
-
         col1, col2 = st.columns(2)
         with col1:
-            email_val = st.text_input("Email (patient)", value=details.get("email", ""), key="email_input")
-            insurance_val = st.text_input("Insurance Company (carrier)", value=details.get("insurance_company", ""), key="insurance_input")
+            email_val = st.text_input("Email (patient)", value=patient.email, key="email_input")
+            insurance_val = st.text_input("Insurance Company (carrier)", value=patient.insurance_company, key="insurance_input")
         with col2:
-            phone_val = st.text_input("Phone (patient)", value=details.get("phone", ""), key="phone_input")
+            phone_val = st.text_input("Phone (patient)", value=patient.phone, key="phone_input")
 
         id_col1, id_col2 = st.columns(2)
         with id_col1:
-            st.text_input("Member ID", value=details.get("member_id", ""), disabled=True, key="member_id_display")
+            st.text_input("Member ID", value=patient.member_id, disabled=True, key="member_id_display")
         with id_col2:
-            st.text_input("Group Number", value=details.get("group_number", ""), disabled=True, key="group_number_display")
+            st.text_input("Group Number", value=patient.group_number, disabled=True, key="group_number_display")
 
         if st.button("Save Details & Load Available Slots"):
             errors = validate_contact(
@@ -182,44 +151,17 @@ if mode == "Patient Portal":
                     st.error(e)
                 st.stop()
 
-            st.session_state.patient_details.update({
-                "email": email_val.strip(),
-                "phone": phone_val.strip(),
-                "insurance_company": insurance_val.strip(),
-            })
-
-            minutes_needed = st.session_state.minutes or duration_for_patient_type(not st.session_state.patient_found)
-            slots = scheduler.get_available_slots(minutes_required=minutes_needed) or []
-
-            appt_file = os.path.join("app", "data", "appointments.xlsx")
-            if os.path.exists(appt_file) and len(slots) > 0:
-                booked_df = pd.read_excel(appt_file)
-
-                if all(col in booked_df.columns for col in ["date", "time", "doctor"]):
-                    booked_keys = set(zip(booked_df["date"], booked_df["time"], booked_df["doctor"]))
-                    slots = [
-                        s for s in slots
-                        if (s["date"], s["time"], s["doctor"]) not in booked_keys
-                    ]
-
-            # Deduplicate slots
-            unique = {(s["date"], s["time"], s["doctor"]): s for s in slots}
-            slots = list(unique.values())
-
-            # 👉 Apply AI rules here
-            rules = load_rules()
-            patient_core = st.session_state.patient_core or {}
-            patient_details = st.session_state.patient_details or {}
-            patient_core["is_new"] = bool(st.session_state.is_new_patient)
-
-            slots, duration_override = apply_rules(patient_core, patient_details, slots, rules)
-            if duration_override:
-                st.session_state.minutes = duration_override
+            patient.email = email_val.strip()
+            patient.phone = phone_val.strip()
+            patient.insurance_company = insurance_val.strip()
 
+            # Rules pick the appointment length and filter the slots
+            search = service.find_slots(patient)
+            slots = search.slots
+            st.session_state.minutes = search.minutes
             st.session_state.available_slots = slots
             st.session_state.available_dates = sorted({s["date"] for s in slots})
 
-
             if not slots:
                 st.error("No available slots found.")
             else:
@@ -269,119 +211,28 @@ if mode == "Patient Portal":
             chosen = st.session_state.chosen_slot
             date, time_str, doctor = chosen["date"], chosen["time"], chosen["doctor"]
 
-            success = scheduler.book_slot(date, time_str, doctor)
-            if success:
-                core = st.session_state.patient_core
-                details = st.session_state.patient_details
-                minutes_required = st.session_state.minutes
-
-                st.success(f"✅ Appointment booked for {core['first_name']} {core['last_name']} on {date} at {time_str} with Dr. {doctor}")
-
-                # Save appointment
-                appt_file = os.path.join("app", "data", "appointments.xlsx")
-                record = {
-                    "first_name": core["first_name"],
-                    "last_name": core["last_name"],
-                    "dob": core["dob"],
-                    "email": details["email"],
-                    "phone": details["phone"],
-                    "insurance_company": details["insurance_company"],
-                    "member_id": details["member_id"],
-                    "group_number": details["group_number"],
-                    "date": date,
-                    "time": time_str,
-                    "doctor": doctor,
-                    "duration": minutes_required,
-                    "form_sent": True,
-                    "form_filled": False,
-                    "status": "Scheduled",
-                    "notes": ""
-                }
-                if os.path.exists(appt_file):
-                    df = pd.read_excel(appt_file)
-                    df = pd.concat([df, pd.DataFrame([record])], ignore_index=True)
-                else:
-                    df = pd.DataFrame([record])
-                df.to_excel(appt_file, index=False, engine="openpyxl")
-                st.info("📄 Appointment saved to appointments.xlsx")
-
-                # Save new patient if needed
-                if st.session_state.is_new_patient:
-                    patients_file = os.path.join("app", "data", "patients.csv")
-                    new_patient = {
-                        "First Name": core["first_name"],
-                        "Last Name": core["last_name"],
-                        "Date of Birth (YYYY-MM-DD)": core["dob"],
-                        "Email (patient)": details["email"],
-                        "Phone (patient)": details["phone"],
-                        "Insurance Company (carrier)": details["insurance_company"],
-                        "Member ID": details["member_id"],
-                        "Group Number": details["group_number"]
-                    }
-                    if os.path.exists(patients_file):
-                        patients_df = pd.read_csv(patients_file)
-                        patients_df = pd.concat([patients_df, pd.DataFrame([new_patient])], ignore_index=True)
-                    else:
-                        patients_df = pd.DataFrame([new_patient])
-                    patients_df.to_csv(patients_file, index=False)
+            # Stores the appointment, saves a new patient, queues email + reminders
+            result = service.book(patient, date, time_str, doctor, minutes=st.session_state.minutes)
+            if result:
+                st.success(f"✅ Appointment booked for {patient.first_name} {patient.last_name} on {date} at {time_str} with Dr. {doctor}")
+                st.info(f"📄 Appointment #{result.appointment_id} saved.")
+                if result.patient_added:
                     st.info("🆕 New patient added to patients.csv")
 
-                # ICS download
-                ics_path = create_ics_file(
-                    f"{core['first_name']} {core['last_name']}",
-                    doctor,
-                    date,
-                    time_str,
-                    minutes_required
-                )
                 st.download_button(
                     "📅 Download Calendar Invite (.ics)",
-                    open(ics_path, "rb"),
-                    file_name=os.path.basename(ics_path),
+                    result.ics,
+                    file_name=f"{patient.first_name} {patient.last_name}_{date}_{time_str.replace(':', '')}.ics",
                     mime="text/calendar"
                 )
 
-                # Email confirmatio
-
-                # Generate custom PDF for this patient
-                pdf_filename = f"intake_form_{core['last_name']}_{date}.pdf"
-                form_path = os.path.join("app", "data", pdf_filename)
-
-                c = canvas.Canvas(form_path, pagesize=letter)
-                c.setFont("Helvetica", 12)
-                c.drawString(50, 750, "Patient Intake Form")
-                c.drawString(50, 730, f"Name: {core['first_name']} {core['last_name']}")
-                c.drawString(50, 710, f"DOB: {core['dob']}")
-                c.drawString(50, 690, f"Email: {details['email']}")
-                c.drawString(50, 670, f"Phone: {details['phone']}")
-                c.drawString(50, 650, f"Insurance: {details['insurance_company']}")
-                c.drawString(50, 630, f"Member ID: {details['member_id']}")
-                c.drawString(50, 610, f"Group Number: {details['group_number']}")
-                c.drawString(50, 590, f"Appointment Date: {date}")
-                c.drawString(50, 570, f"Time: {time_str}")
-                c.drawString(50, 550, f"Doctor: Dr. {doctor}")
-                c.drawString(50, 530, f"Duration: {minutes_required} minutes")
-                c.save()
-
-                # Send personalized form in email
-                to_email = details["email"]
-                email_sent = False
-                if to_email:
-                    subject = f"Appointment Confirmation — {date} {time_str}"
-                    body = (
-                        f"Hi {core['first_name']},\n\n"
-                        f"Your appointment is confirmed on {date} at {time_str} with Dr. {doctor}.\n"
-                        f"Please find the personalized intake form attached.\n\nThanks."
-                    )
-                    email_sent = send_email(to_email, subject, body, attachment_paths=[form_path])
-
-                if email_sent:
-                    st.success("📧 Confirmation email sent to patient.")
+                if result.email_queued:
+                    st.success("📧 Confirmation email queued for the patient.")
                 else:
-                    st.warning("⚠️ Email sending failed or not configured.")
+                    st.warning("⚠️ No patient email address; confirmation not sent.")
 
             else:
-                st.error("❌ Failed to book slot. Please try another time or date.")
+                st.error(f"❌ Failed to book slot: {result.reason} Please try another time or date.")
 
 # ========================
 #  ADMIN DASHBOARD SECTION
@@ -411,7 +262,9 @@ if mode == "Admin Dashboard":
                 if not rule_text.strip():
                     st.error("Write a rule first.")
                 else:
-                    parsed, err = parse_rule_to_json(rule_text)
+                    with st.spinner("Parsing rule..."):
+                        # bounded: at most two 15 s attempts before the page answers
+                        parsed, err = parse_rule_to_json(rule_text, max_retries=2, timeout=15)
                     if err or not parsed:
                         st.error(f"AI parse error: {err}")
                     else:
@@ -423,7 +276,23 @@ if mode == "Admin Dashboard":
             if st.button("Reload Rules"):
                 st.rerun()
 
-        rules_list = load_rules()
+        # Bulk import: one rule per line, parsed concurrently
+        rules_file = st.file_uploader("Import rules file (.txt, one rule per line)", type=["txt"], key="rules_file")
+        if rules_file is not None and st.button("Parse & Import Rules"):
+            texts = read_rule_texts(rules_file)
+            with st.spinner(f"Parsing {len(texts)} rules..."):
+                results = parse_rules_bulk(texts, concurrency=8, pack_size=5)
+            parsed_ok = [(parsed, text) for text, (parsed, err) in zip(texts, results) if parsed and not err]
+            if parsed_ok:
+                save_rules(parsed_ok)
+                st.success(f"Imported {len(parsed_ok)} of {len(texts)} rules.")
+            for text, (parsed, err) in zip(texts, results):
+                if err or not parsed:
+                    st.error(f"Could not parse: {text} — {err}")
+
+        rules_list = resources.rules()
+        for finding in resources.ruleset().report():
+            st.warning(f"Rules {', '.join(map(str, finding['rules']))} ({finding['kind']}): {finding['detail']}")
         for i, e in enumerate(rules_list):
             rule = e.get("rule")
             raw = e.get("raw", "")
@@ -435,54 +304,96 @@ if mode == "Admin Dashboard":
                 st.success("Deleted.")
                 st.rerun()
             
+        st.subheader("📬 Email Outbox")
+        outbox = get_outbox()
+        st.caption(" · ".join(f"{k}: {v}" for k, v in sorted(outbox.stats().items())) or "Empty")
+        dead = outbox.dead_letters()
+        if dead:
+            st.dataframe(pd.DataFrame(dead), width="stretch")
+            if st.button("Retry failed emails"):
+                outbox.retry_dead()
+                st.rerun()
+
         if st.button("Logout"):
             st.session_state.admin_logged_in = False
             st.info("🔒 Logged out successfully.")
             st.rerun()
         else:
-            appt_file = os.path.join("app", "data", "appointments.xlsx")
+            repo = scheduler.repo
+            st.subheader("📋 Appointments")
+
+            # Filtering, sorting and paging happen in SQLite; only the visible page is loaded
+            f1, f2, f3 = st.columns(3)
+            with f1:
+                date_range = st.date_input("Date range", value=(), key="appt_dates")
+                doctor_filter = st.selectbox("Doctor", ["All"] + scheduler.doctors())
+            with f2:
+                status_filter = st.selectbox("Status", ["All"] + STATUS_FILTERS)
+                patient_filter = st.text_input("Patient name starts with")
+            with f3:
+                sort_by = st.selectbox("Sort by", list(SORT_KEYS))
+                newest_first = st.checkbox("Descending")
+                page_size = st.selectbox("Rows per page", [25, 50, 100], index=1)
+
+            filters = {
+                "date_from": date_range[0].isoformat() if len(date_range) > 0 else None,
+                "date_to": date_range[-1].isoformat() if len(date_range) > 0 else None,
+                "doctor": None if doctor_filter == "All" else doctor_filter,
+                "status": None if status_filter == "All" else status_filter,
+                "patient": patient_filter.strip() or None,
+            }
+            view_key = (tuple(filters.items()), sort_by, newest_first, page_size)
+            if st.session_state.get("appt_view") != view_key:
+                st.session_state.appt_view = view_key
+                st.session_state.appt_cursors = [None]  # cursor that starts each visited page
+
+            cursors = st.session_state.appt_cursors
+            rows, next_cursor = repo.query(**filters, sort=sort_by, descending=newest_first,
+                                           after=cursors[-1], limit=page_size)
+            df = pd.DataFrame(rows, columns=["id"] + APPOINTMENT_COLUMNS + ["created_at", "updated_at"])
+
+            st.caption(f"{repo.count(**filters)} matching · page {len(cursors)}")
+            p1, p2 = st.columns(2)
+            with p1:
+                if st.button("⬅️ Previous page", disabled=len(cursors) == 1):
+                    cursors.pop()
+                    st.rerun()
+            with p2:
+                if st.button("Next page ➡️", disabled=next_cursor is None):
+                    cursors.append(next_cursor)
+                    st.rerun()
+
+            if not df.empty:
+                st.dataframe(df, width="stretch", hide_index=True)
+
+                # Excel is produced only on demand
+                if st.button("Export appointments to Excel"):
+                    export_buf = io.BytesIO()
+                    repo.export_excel(export_buf)
+                    st.download_button(
+                        "⬇️ Download appointments.xlsx",
+                        export_buf.getvalue(),
+                        file_name="appointments.xlsx",
+                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                    )
 
-            if os.path.exists(appt_file):
-                df = pd.read_excel(appt_file)
-                st.dataframe(df, width="stretch")
-
-                idx = st.number_input(
-                    "Select appointment row index to manage (0-based)",
-                    min_value=0,
-                    max_value=max(0, len(df) - 1),
-                    step=1,
-                )
+                appt_id = st.selectbox("Select appointment to manage (id)", options=df["id"].tolist())
 
                 if st.button("Load appointment"):
-                    st.session_state.selected_idx = int(idx)
-                    st.session_state.selected_row = df.iloc[int(idx)].to_dict()
+                    st.session_state.selected_id = int(appt_id)
+                    st.session_state.selected_row = repo.get(appt_id)
                     st.write("Selected:", st.session_state.selected_row)
 
-                if "selected_idx" in st.session_state:
+                if "selected_id" in st.session_state:
                     reason = st.text_input("If cancelling, enter reason")
 
                     if st.button("Cancel Appointment"):
-                        df.at[st.session_state.selected_idx, "status"] = f"Cancelled by Doctor - {reason or 'No reason provided'}"
-                        df.to_excel(appt_file, index=False, engine="openpyxl")
-                        st.success("❌ Appointment Cancelled by Doctor (saved to file)")
-
-                        new_df = pd.read_excel(appt_file)
-                        st.dataframe(new_df, width="stretch")
+                        updated_row = service.cancel(st.session_state.selected_id, reason)
+                        st.success("❌ Appointment Cancelled by Doctor (saved)")
 
-                        updated_row = new_df.iloc[st.session_state.selected_idx].to_dict()
+                        st.dataframe(pd.DataFrame([updated_row]), width="stretch", hide_index=True)
                         st.info(f"Updated Appointment Status: {updated_row['status']}")
-
-                        # Send cancellation email
-                        patient_email = updated_row.get("email")
-                        if patient_email:
-                            subject = f"Appointment Cancelled — {updated_row['date']} {updated_row['time']}"
-                            body = (
-                                f"Hi {updated_row['first_name']},\n\n"
-                                f"Your appointment has been cancelled by the doctor.\n"
-                                f"Reason: {reason or 'Not specified'}.\n\n"
-                                "Please rebook if needed."
-                            )
-                            send_email(patient_email, subject, body)
-                            st.info("📧 Cancellation email sent to patient.")
+                        if updated_row.get("email_queued"):
+                            st.info("📧 Cancellation email queued for the patient.")
             else:
-                st.info("No appointments booked yet.")
+                st.info("No appointments match these filters.")
@@ -1,33 +1,130 @@
 import datetime
+import hashlib
 import os
+import uuid
 
-def create_ics_file(patient_name, doctor, date, time, duration, save_dir="app/data"):
-    """
-    Generate an .ics calendar invite file for the appointment.
-    """
+from agent import metrics
+
+PRODID = "-//AI Scheduler//EN"
+UID_DOMAIN = "ai-scheduler"
+UID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_DNS, UID_DOMAIN)
+
+
+def _escape(text) -> str:
+    """TEXT value escaping from RFC 5545 (backslash, ; , and newlines)."""
+    return (str(text).replace("\\", "\\\\").replace(";", "\\;")
+            .replace(",", "\\,").replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def _fold(line: str) -> str:
+    """Fold content lines longer than 75 octets."""
+    raw = line.encode("utf-8")
+    if len(raw) <= 75:
+        return line
+    parts, current = [], b""
+    for ch in line:
+        b = ch.encode("utf-8")
+        if len(current) + len(b) > (75 if not parts else 74):
+            parts.append(current.decode("utf-8"))
+            current = b""
+        current += b
+    parts.append(current.decode("utf-8"))
+    return "\r\n ".join(parts)
+
+
+def _utc_stamp(when=None) -> str:
+    when = when or datetime.datetime.now(datetime.timezone.utc)
+    if when.tzinfo is None:
+        when = when.astimezone()  # naive local time
+    return when.astimezone(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def appointment_uid(doctor, date, time, appointment_id=None) -> str:
+    """Stable UID so re-sent or re-synced invites update instead of duplicating."""
+    if appointment_id is not None:
+        return f"appt-{appointment_id}@{UID_DOMAIN}"
+    return f"{uuid.uuid5(UID_NAMESPACE, f'{doctor}|{date}|{time}')}@{UID_DOMAIN}"
+
+
+def vevent_lines(patient_name, doctor, date, time, duration, uid=None, dtstamp=None, status=None):
+    """Content lines of one VEVENT (unfolded, no line endings)."""
     dt_start = datetime.datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M")
-    dt_end = dt_start + datetime.timedelta(minutes=duration)
+    dt_end = dt_start + datetime.timedelta(minutes=int(duration or 30))
 
     # ICS datetime format: YYYYMMDDTHHMMSS
-    start_str = dt_start.strftime("%Y%m%dT%H%M%S")
-    end_str = dt_end.strftime("%Y%m%dT%H%M%S")
-
-    ics_content = f"""BEGIN:VCALENDAR
-VERSION:2.0
-PRODID:-//AI Scheduler//EN
-BEGIN:VEVENT
-SUMMARY:Doctor Appointment with {doctor}
-DTSTART:{start_str}
-DTEND:{end_str}
-DESCRIPTION:Appointment for {patient_name}
-LOCATION:Clinic
-END:VEVENT
-END:VCALENDAR
-"""
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{uid or appointment_uid(doctor, date, time)}",
+        f"DTSTAMP:{dtstamp or _utc_stamp()}",
+        f"SUMMARY:{_escape(f'Doctor Appointment with {doctor}')}",
+        f"DTSTART:{dt_start.strftime('%Y%m%dT%H%M%S')}",
+        f"DTEND:{dt_end.strftime('%Y%m%dT%H%M%S')}",
+        f"DESCRIPTION:{_escape(f'Appointment for {patient_name}')}",
+        "LOCATION:Clinic",
+    ]
+    if status:
+        lines.append(f"STATUS:{status}")
+    lines.append("END:VEVENT")
+    return lines
+
+
+def _encode(lines) -> bytes:
+    return "".join(_fold(line) + "\r\n" for line in lines).encode("utf-8")
 
+
+@metrics.timed("ics_build")
+def build_ics(patient_name, doctor, date, time, duration, appointment_id=None) -> bytes:
+    """
+    Calendar invite for one appointment, as bytes (no file is written).
+    """
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", f"PRODID:{PRODID}", "METHOD:PUBLISH"]
+    lines += vevent_lines(patient_name, doctor, date, time, duration,
+                          uid=appointment_uid(doctor, date, time, appointment_id))
+    lines.append("END:VCALENDAR")
+    return _encode(lines)
+
+
+def create_ics_file(patient_name, doctor, date, time, duration, save_dir="app/data"):
+    """
+    Generate an .ics calendar invite file for the appointment.
+    Prefer build_ics(), which returns the same content without touching disk.
+    """
     os.makedirs(save_dir, exist_ok=True)
     filename = os.path.join(save_dir, f"{patient_name}_{date}_{time.replace(':','')}.ics")
-    with open(filename, "w") as f:
-        f.write(ics_content)
+    with open(filename, "wb") as f:
+        f.write(build_ics(patient_name, doctor, date, time, duration))
 
     return filename
+
+
+def _row_stamp(row):
+    ts = row.get("updated_at") or row.get("created_at")
+    try:
+        return _utc_stamp(datetime.datetime.fromisoformat(ts))
+    except (TypeError, ValueError):
+        return _utc_stamp()
+
+
+def iter_calendar_feed(appointments, calendar_name="AI Scheduler"):
+    """
+    Stream one VCALENDAR as byte chunks, one chunk per event.
+    appointments: iterable of appointment rows (e.g. AppointmentRepository.iter_appointments()).
+    Cancelled appointments are emitted with STATUS:CANCELLED so subscribers drop them.
+    """
+    yield _encode(["BEGIN:VCALENDAR", "VERSION:2.0", f"PRODID:{PRODID}", "METHOD:PUBLISH",
+                   f"X-WR-CALNAME:{_escape(calendar_name)}"])
+    for row in appointments:
+        cancelled = str(row.get("status") or "").startswith("Cancelled")
+        yield _encode(vevent_lines(
+            f"{row.get('first_name') or ''} {row.get('last_name') or ''}".strip(),
+            row["doctor"], row["date"], row["time"], row.get("duration"),
+            uid=appointment_uid(row["doctor"], row["date"], row["time"], row.get("id")),
+            dtstamp=_row_stamp(row),
+            status="CANCELLED" if cancelled else "CONFIRMED",
+        ))
+    yield _encode(["END:VCALENDAR"])
+
+
+def feed_etag(version) -> str:
+    """Strong ETag from a feed version tuple (see AppointmentRepository.feed_version)."""
+    return '"' + hashlib.sha1(repr(tuple(version)).encode("utf-8")).hexdigest() + '"'
@@ -0,0 +1,151 @@
+"""
+Intake form PDFs rendered in memory.
+
+The form is a single letter-size page. Everything that doesn't change
+between patients (document objects, font, title and field labels) is
+serialized once and cached; a patient's form only adds the value text,
+the content-stream length and the cross-reference table, so rendering is
+a few string joins and never touches disk.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date as date_cls, timedelta
+from functools import lru_cache
+
+from agent import metrics
+
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792  # letter, in points
+FONT_SIZE = 12
+LABEL_X, VALUE_X = 50, 170
+TITLE = "Patient Intake Form"
+TITLE_Y = 750
+
+# (label, field key); rows are drawn top to bottom, 20pt apart
+FIELDS = [
+    ("Name:", "name"),
+    ("DOB:", "dob"),
+    ("Email:", "email"),
+    ("Phone:", "phone"),
+    ("Insurance:", "insurance_company"),
+    ("Member ID:", "member_id"),
+    ("Group Number:", "group_number"),
+    ("Appointment Date:", "date"),
+    ("Time:", "time"),
+    ("Doctor:", "doctor"),
+    ("Duration:", "duration"),
+]
+FIRST_ROW_Y, ROW_STEP = 730, 20
+
+# below this many forms a process pool costs more than it saves
+MIN_PARALLEL = 5000
+
+
+def _pdf_string(text) -> bytes:
+    """PDF literal string in WinAnsi (Helvetica's encoding); unmappable chars become '?'."""
+    raw = str(text).encode("cp1252", errors="replace")
+    return b"(" + raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def _text_op(x, y, text) -> bytes:
+    return b"BT /F1 %d Tf %d %d Td %s Tj ET\n" % (FONT_SIZE, x, y, _pdf_string(text))
+
+
+@lru_cache(maxsize=1)
+def _template():
+    """
+    Static part of the document: (header + objects 1-4, their xref offsets,
+    content-stream prefix with the title and labels). Built once per process.
+    """
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+        b"/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>" % (PAGE_WIDTH, PAGE_HEIGHT),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    head = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for num, body in enumerate(objects, start=1):
+        offsets.append(len(head))
+        head += b"%d 0 obj\n" % num + body + b"\nendobj\n"
+
+    layout = [_text_op(LABEL_X, TITLE_Y, TITLE)]
+    for row, (label, _) in enumerate(FIELDS):
+        layout.append(_text_op(LABEL_X, FIRST_ROW_Y - row * ROW_STEP, label))
+    return bytes(head), offsets, b"".join(layout)
+
+
+@metrics.timed("intake_pdf_render")
+def render_intake_form(values: dict) -> bytes:
+    """
+    One filled intake form as PDF bytes.
+    values: field key -> text (see FIELDS); missing keys render blank.
+    """
+    head, offsets, layout = _template()
+    ops = [layout]
+    for row, (_, key) in enumerate(FIELDS):
+        value = values.get(key)
+        if value not in (None, ""):
+            ops.append(_text_op(VALUE_X, FIRST_ROW_Y - row * ROW_STEP, value))
+    stream = b"".join(ops)
+
+    contents_at = len(head)
+    contents = b"5 0 obj\n<< /Length %d >>\nstream\n%s\nendstream\nendobj\n" % (len(stream), stream)
+    xref_at = contents_at + len(contents)
+    xref = [b"xref\n0 6\n0000000000 65535 f \n"]
+    xref += [b"%010d 00000 n \n" % off for off in offsets + [contents_at]]
+    trailer = b"trailer\n<< /Size 6 /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % xref_at
+    return b"".join([head, contents] + xref + [trailer])
+
+
+def intake_values(patient: dict, date, time, doctor, duration) -> dict:
+    """Form values for a booking; patient uses the appointment column names (first_name, dob, ...)."""
+    return {
+        "name": f"{patient.get('first_name') or ''} {patient.get('last_name') or ''}".strip(),
+        "dob": patient.get("dob"),
+        "email": patient.get("email"),
+        "phone": patient.get("phone"),
+        "insurance_company": patient.get("insurance_company"),
+        "member_id": patient.get("member_id"),
+        "group_number": patient.get("group_number"),
+        "date": date,
+        "time": time,
+        "doctor": f"Dr. {doctor}" if doctor else "",
+        "duration": f"{duration} minutes" if duration else "",
+    }
+
+
+def intake_filename(last_name, date) -> str:
+    return f"intake_form_{last_name}_{date}.pdf"
+
+
+def _render_row(row):
+    values = intake_values(row, row.get("date"), row.get("time"), row.get("doctor"), row.get("duration"))
+    return row.get("id"), render_intake_form(values)
+
+
+def render_intake_forms_bulk(appointments, workers: int = None, chunksize: int = 256):
+    """
+    Render forms for many appointment rows; returns [(appointment id, pdf bytes)]
+    in input order. Large batches are spread over a process pool (each worker
+    builds the template once); small ones render inline.
+    """
+    rows = list(appointments)
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(rows) < MIN_PARALLEL:
+        return [_render_row(r) for r in rows]
+    chunksize = max(1, min(chunksize, len(rows) // workers or 1))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_render_row, rows, chunksize=chunksize))
+
+
+def render_forms_for_date(repo, day: str = None, workers: int = None):
+    """
+    Intake forms for every active appointment on `day` (default: tomorrow).
+    Returns [(appointment row, pdf bytes)].
+    """
+    day = day or (date_cls.today() + timedelta(days=1)).isoformat()
+    rows = [r for r in repo.iter_appointments(date=day)
+            if not str(r.get("status") or "").startswith("Cancelled")]
+    rendered = render_intake_forms_bulk(rows, workers=workers)
+    return [(row, pdf) for row, (_, pdf) in zip(rows, rendered)]
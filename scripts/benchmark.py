@@ -0,0 +1,223 @@
+# Micro-benchmarks for the scheduling hot paths; results are appended to benchmarks/results.jsonl
+# and compared with the previous run at the same scale.
+# Run: python scripts/benchmark.py --scale small
+#      python scripts/benchmark.py --scale large --repeat 2000
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "app"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from agent.appointments import AppointmentRepository  # noqa: E402
+from agent.patient_db import PatientDB  # noqa: E402
+from agent.rules import apply_rules  # noqa: E402
+from agent.scheduler import Scheduler  # noqa: E402
+from generate_mock_data import generate  # noqa: E402
+from utils.calendar import build_ics  # noqa: E402
+from utils.intake_pdf import intake_values, render_intake_form  # noqa: E402
+
+SCALES = {
+    "small": dict(patients=10_000, doctors=10, days=30, appointments=2_000),
+    "medium": dict(patients=200_000, doctors=50, days=180, appointments=50_000),
+    "large": dict(patients=1_000_000, doctors=200, days=365, appointments=500_000),
+}
+RESULTS_PATH = os.path.join(ROOT, "benchmarks", "results.jsonl")
+DATA_ROOT = os.path.join(ROOT, "benchmarks", "data")
+REGRESSION_THRESHOLD = 0.20  # flag cases whose median got >20% slower
+MIN_SAMPLES_TO_FLAG = 30      # one-shot timings (startup, cold load) are reported, not judged
+ROUNDS = 3
+
+
+def timed(fn, calls, rounds=ROUNDS):
+    """
+    Run fn(*args) for each args tuple, `rounds` times over; returns the
+    per-call seconds of the fastest round (least disturbed by other load).
+    """
+    calls = list(calls)
+    best = None
+    for _ in range(rounds):
+        out = []
+        for args in calls:
+            t = time.perf_counter()
+            fn(*args)
+            out.append(time.perf_counter() - t)
+        if best is None or statistics.median(out) < statistics.median(best):
+            best = out
+    return best
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return {
+        "n": len(samples),
+        "median_us": round(statistics.median(samples) * 1e6, 2),
+        "p95_us": round(p95 * 1e6, 2),
+        "mean_us": round(statistics.fmean(samples) * 1e6, 2),
+    }
+
+
+def sample_rules(doctors):
+    """A mixed rule set of the shapes the admin page produces."""
+    rules = [
+        {"rule": {"condition": {"patient_type": "new"}, "action": {"duration": 60}}},
+        {"rule": {"condition": {"patient_type": "returning"}, "action": {"duration": 30}}},
+        {"rule": {"condition": {"age_gte": 65}, "action": {"prefer_doctor": doctors[0]}}},
+        {"rule": {"condition": {"insurance_company": "Aetna"}, "action": {"block_doctor": doctors[-1]}}},
+        {"rule": {"condition": {"insurance_company": "Kaiser"}, "action": {"assign_doctor": doctors[1 % len(doctors)]}}},
+    ]
+    for i, d in enumerate(doctors[:15]):
+        rules.append({"rule": {"condition": {"last_name": f"Name{i}"}, "action": {"block_doctor": d}}})
+    return rules
+
+
+def run(data_dir, repeat, seed=0):
+    rng = random.Random(seed)
+    results = {}
+
+    def record(name, samples):
+        results[name] = summarize(samples)
+        print(f"  {name:<34} median {results[name]['median_us']:>11.2f} us   p95 {results[name]['p95_us']:>11.2f} us")
+
+    # ---- patients ----
+    t = time.perf_counter()
+    db = PatientDB(os.path.join(data_dir, "patients.csv"))
+    db.find_patient("x", "y", "2000-01-01")  # builds the index
+    record("patient_db.cold_load", [time.perf_counter() - t])
+    rows = db.load_patients().sample(min(repeat, len(db.load_patients())), random_state=seed)
+    hits = [(r["First Name"], r["Last Name"], r["Date of Birth (YYYY-MM-DD)"]) for _, r in rows.iterrows()]
+    record("patient_db.find_patient.hit", timed(db.find_patient, hits))
+    record("patient_db.find_patient.miss", timed(db.find_patient, [(f"Nobody{i}", "Nowhere", "1900-01-01")
+                                                                   for i in range(repeat)]))
+
+    # ---- scheduler (on a scratch copy of the appointment store) ----
+    scratch = tempfile.mkdtemp(prefix="bench-")
+    try:
+        db_copy = os.path.join(scratch, "appointments.db")
+        shutil.copy(os.path.join(data_dir, "appointments.db"), db_copy)
+        t = time.perf_counter()
+        scheduler = Scheduler(os.path.join(data_dir, "doctor_schedule.xlsx"),
+                              repo=AppointmentRepository(db_copy, legacy_xlsx=None))
+        record("scheduler.startup", [time.perf_counter() - t])
+
+        dates = scheduler.dates()
+        doctors = scheduler.doctors()
+        record("scheduler.slots.day", timed(scheduler.get_available_slots,
+                                            [(30, rng.choice(dates), None) for _ in range(min(repeat, 200))]))
+        record("scheduler.slots.day_doctor", timed(scheduler.get_available_slots,
+                                                   [(30, rng.choice(dates), rng.choice(doctors))
+                                                    for _ in range(repeat)]))
+
+        free = []
+        while len(free) < min(repeat, 300):
+            day, doc = rng.choice(dates), rng.choice(doctors)
+            slots = scheduler.get_available_slots(30, day, doc)
+            if slots:
+                s = rng.choice(slots)
+                if (s["date"], s["time"], s["doctor"]) not in free:
+                    free.append((s["date"], s["time"], s["doctor"]))
+        record("scheduler.book_slot", timed(scheduler.book_slot, free, rounds=1))  # each slot books once
+
+        # ---- rules ----
+        rules = sample_rules(doctors)
+        day_slots = scheduler.get_available_slots(30, dates[len(dates) // 2])
+        patients = [({"first_name": f, "last_name": l, "dob": d, "is_new": rng.random() < 0.3},
+                     {"insurance_company": rng.choice(["Aetna", "Kaiser", "Cigna"])}) for f, l, d in hits]
+        record("rules.apply_rules", timed(apply_rules, [(c, d, day_slots, rules) for c, d in patients]))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    # ---- documents ----
+    bookings = [(f"{f} {l}", rng.choice(doctors), rng.choice(dates), "10:00", 30, i)
+                for i, (f, l, _) in enumerate(hits)]
+    record("calendar.build_ics", timed(build_ics, bookings))
+    values = [(intake_values({"first_name": f, "last_name": l, "dob": d}, "2025-09-05", "10:00", "Smith", 30),)
+              for f, l, d in hits]
+    record("intake_pdf.render", timed(render_intake_form, values))
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def previous_run(path, scale):
+    last = None
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                entry = json.loads(line)
+                if entry.get("scale") == scale:
+                    last = entry
+    return last
+
+
+def compare(previous, results):
+    print(f"\nvs {previous.get('revision')} ({previous.get('timestamp')}):")
+    regressions = 0
+    for name, cur in results.items():
+        old = previous["results"].get(name)
+        if not old or not old["median_us"] or cur["n"] < MIN_SAMPLES_TO_FLAG:
+            continue
+        change = cur["median_us"] / old["median_us"] - 1
+        flag = "  REGRESSION" if change > REGRESSION_THRESHOLD else ""
+        regressions += bool(flag)
+        print(f"  {name:<34} {change:+7.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the scheduling hot paths.")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--data-dir", help="existing data set (default: benchmarks/data/<scale>, generated if missing)")
+    parser.add_argument("--regenerate", action="store_true")
+    parser.add_argument("--repeat", type=int, default=1000, help="calls per case")
+    parser.add_argument("--results", default=RESULTS_PATH)
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args(argv)
+
+    data_dir = args.data_dir or os.path.join(DATA_ROOT, args.scale)
+    if args.regenerate or not os.path.exists(os.path.join(data_dir, "appointments.db")):
+        print(f"Generating {args.scale} data set in {data_dir} ...")
+        # fixed start date so every run sees the same data
+        generate(data_dir, start=datetime(2025, 1, 6).date(), **SCALES[args.scale])
+
+    print(f"Benchmarking ({args.scale}, {args.repeat} calls per case):")
+    results = run(data_dir, args.repeat)
+
+    previous = previous_run(args.results, args.scale)
+    regressions = compare(previous, results) if previous else 0
+    if not args.no_save:
+        os.makedirs(os.path.dirname(args.results), exist_ok=True)
+        entry = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "scale": args.scale,
+            "repeat": args.repeat,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "results": results,
+        }
+        with open(args.results, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+        print(f"\nSaved to {args.results}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
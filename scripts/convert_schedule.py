@@ -0,0 +1,36 @@
+# Convert the doctor schedule between Excel and the memory-mapped column store the app reads.
+# Run: python scripts/convert_schedule.py import app/data/doctor_schedule.xlsx   # -> app/data/schedule/
+#      python scripts/convert_schedule.py export app/data/doctor_schedule.xlsx   # <- app/data/schedule/
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from agent.schedule_store import ScheduleStore, store_dir_for  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import/export the doctor schedule as Excel.")
+    parser.add_argument("direction", choices=["import", "export"])
+    parser.add_argument("xlsx", help="workbook with columns date, time, doctor, available")
+    parser.add_argument("--store", help="column store directory (default: 'schedule' next to the workbook)")
+    args = parser.parse_args(argv)
+
+    store = ScheduleStore(args.store or store_dir_for(os.path.abspath(args.xlsx)))
+    started = time.perf_counter()
+    if args.direction == "import":
+        store.import_excel(args.xlsx)
+        print(f"Imported {len(store):,} slots from {args.xlsx} -> {store.path}")
+    else:
+        if not store.exists():
+            raise SystemExit(f"No schedule store at {store.path}")
+        store.load().export_excel(args.xlsx)
+        print(f"Exported {len(store):,} slots from {store.path} -> {args.xlsx}")
+    print(f"Done in {time.perf_counter() - started:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,2 +1,172 @@
-# Will generate patients.csv and doctor_schedule.xlsx in Step 2.
-# Run: python scripts/generate_mock_data.py
+# Generate patients.csv, the doctor schedule (column store, optionally also doctor_schedule.xlsx)
+# and (optionally) booked appointments at any scale.
+# Run: python scripts/generate_mock_data.py                      # small demo data into app/data
+#      python scripts/generate_mock_data.py --out-dir bench_data --patients 1000000 \
+#          --doctors 200 --days 365 --appointments 500000
+import argparse
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from agent.appointments import AppointmentRepository  # noqa: E402
+from agent.schedule_store import ScheduleStore  # noqa: E402
+
+EXCEL_MAX_ROWS = 1_048_575  # one row is the header
+
+FIRST_NAMES = [
+    "Megan", "Dawn", "James", "Maria", "Robert", "Linda", "Michael", "Sarah", "David", "Emily",
+    "Daniel", "Laura", "Kevin", "Anna", "Brian", "Grace", "Jason", "Olivia", "Eric", "Sophia",
+    "Priya", "Arjun", "Wei", "Yuki", "Carlos", "Lucia", "Ahmed", "Fatima", "Ivan", "Elena",
+]
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez",
+    "Martinez", "Hernandez", "Lopez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson",
+    "Martin", "Lee", "Thompson", "White", "Harris", "Clark", "Lewis", "Walker", "Hall", "Young",
+    "Andrews", "Maldonado", "Patel", "Kumar", "Chen", "Nguyen", "Kim", "Singh", "Ali", "Ivanova",
+]
+INSURERS = ["Aetna", "Kaiser", "Cigna", "UnitedHealthcare", "Blue Cross", "Humana"]
+EMAIL_DOMAINS = ["gmail.com", "yahoo.com", "outlook.com", "example.com"]
+
+
+def name_pools(size=400, seed=0):
+    """Larger first/last name pools from Faker when it is installed, else the built-in lists."""
+    try:
+        from faker import Faker
+    except ImportError:
+        return FIRST_NAMES, LAST_NAMES
+    fake = Faker()
+    fake.seed_instance(seed)
+    firsts = sorted({fake.first_name() for _ in range(size * 3)})[:size]
+    lasts = sorted({fake.last_name() for _ in range(size * 3)})[:size]
+    return firsts, lasts
+
+
+def doctor_names(n):
+    # the first two match the app's default schedule
+    base = ["Smith", "Johnson"] + [n for n in LAST_NAMES if n not in ("Smith", "Johnson")]
+    return [base[i % len(base)] + ("" if i < len(base) else f"-{i // len(base)}") for i in range(n)]
+
+
+def make_patients(n, rng, firsts, lasts):
+    first = np.asarray(firsts, dtype=object)[rng.integers(0, len(firsts), n)]
+    last = np.asarray(lasts, dtype=object)[rng.integers(0, len(lasts), n)]
+    dob = pd.Timestamp("1940-01-01") + pd.to_timedelta(rng.integers(0, 365 * 65, n), unit="D")
+    serial = pd.Series(np.arange(n)).astype(str)
+    local = pd.Series(first).str.lower() + "." + pd.Series(last).str.lower() + serial
+    return pd.DataFrame({
+        "First Name": first,
+        "Last Name": last,
+        # patients.csv keeps the DD-MM-YYYY format the existing file uses
+        "Date of Birth (YYYY-MM-DD)": dob.strftime("%d-%m-%Y"),
+        "Email (patient)": local + "@" + np.asarray(EMAIL_DOMAINS, dtype=object)[rng.integers(0, len(EMAIL_DOMAINS), n)],
+        "Phone (patient)": pd.Series(rng.integers(10**9, 10**10, n)).astype(str).radd("+1"),
+        "Insurance Company (carrier)": np.asarray(INSURERS, dtype=object)[rng.integers(0, len(INSURERS), n)],
+        "Member ID": pd.Series(rng.integers(0, 10**8, n)).map("MBR-{:08d}".format),
+        "Group Number": pd.Series(rng.integers(10000, 100000, n)).map("GRP-{}".format),
+    })
+
+
+def make_schedule(doctors, start, days, slot_minutes, day_start=9, day_end=17):
+    per_day = (day_end - day_start) * 60 // slot_minutes
+    times = [f"{(day_start * 60 + i * slot_minutes) // 60:02d}:{(day_start * 60 + i * slot_minutes) % 60:02d}"
+             for i in range(per_day)]
+    dates = [(start + timedelta(days=d)).isoformat() for d in range(days)]
+    idx = pd.MultiIndex.from_product([dates, doctors, times], names=["date", "doctor", "time"])
+    df = idx.to_frame(index=False)[["date", "time", "doctor"]]
+    df["available"] = True
+    return df
+
+
+def make_appointments(n, rng, schedule, patients, slot_minutes):
+    """n bookings on distinct schedule slots, each for a random patient (one slot long)."""
+    n = min(n, len(schedule))
+    slots = schedule.iloc[np.sort(rng.choice(len(schedule), n, replace=False))]
+    who = patients.iloc[rng.integers(0, len(patients), n)]
+    dob = pd.to_datetime(who["Date of Birth (YYYY-MM-DD)"], format="%d-%m-%Y").dt.strftime("%Y-%m-%d")
+    return pd.DataFrame({
+        "first_name": who["First Name"].values,
+        "last_name": who["Last Name"].values,
+        "dob": dob.values,
+        "email": who["Email (patient)"].values,
+        "phone": who["Phone (patient)"].values,
+        "insurance_company": who["Insurance Company (carrier)"].values,
+        "member_id": who["Member ID"].values,
+        "group_number": who["Group Number"].values,
+        "date": slots["date"].values,
+        "time": slots["time"].values,
+        "doctor": slots["doctor"].values,
+        "duration": slot_minutes,
+        "form_sent": 1,
+        "form_filled": 0,
+        "status": "Scheduled",
+        "notes": "",
+    })
+
+
+def generate(out_dir, patients=500, doctors=2, days=7, appointments=0, slot_minutes=60,
+             start=None, seed=42, quiet=False, xlsx=False):
+    """Write the data set into out_dir; returns the paths written."""
+    log = (lambda *a: None) if quiet else print
+    rng = np.random.default_rng(seed)
+    start = start or date.today()
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {
+        "patients": os.path.join(out_dir, "patients.csv"),
+        "schedule": os.path.join(out_dir, "schedule"),
+        "schedule_xlsx": os.path.join(out_dir, "doctor_schedule.xlsx"),
+        "appointments": os.path.join(out_dir, "appointments.db"),
+    }
+
+    t = time.perf_counter()
+    firsts, lasts = name_pools(seed=seed)
+    people = make_patients(patients, rng, firsts, lasts)
+    people.to_csv(paths["patients"], index=False)
+    log(f"{len(people):,} patients -> {paths['patients']} ({time.perf_counter() - t:.1f}s)")
+
+    t = time.perf_counter()
+    schedule = make_schedule(doctor_names(doctors), start, days, slot_minutes)
+    ScheduleStore(paths["schedule"]).from_dataframe(schedule)
+    log(f"{len(schedule):,} schedule slots -> {paths['schedule']} ({time.perf_counter() - t:.1f}s)")
+    if xlsx:
+        if len(schedule) > EXCEL_MAX_ROWS:
+            raise SystemExit(f"{len(schedule):,} schedule rows exceed Excel's {EXCEL_MAX_ROWS:,}-row limit; "
+                             f"use fewer doctors/days or longer --slot-minutes")
+        schedule.to_excel(paths["schedule_xlsx"], index=False)
+        log(f"  and -> {paths['schedule_xlsx']}")
+
+    if appointments:
+        t = time.perf_counter()
+        if os.path.exists(paths["appointments"]):
+            os.remove(paths["appointments"])
+        booked = make_appointments(appointments, rng, schedule, people, slot_minutes)
+        repo = AppointmentRepository(paths["appointments"], legacy_xlsx=None)
+        repo.import_records(booked.to_dict(orient="records"))
+        log(f"{len(booked):,} appointments -> {paths['appointments']} ({time.perf_counter() - t:.1f}s)")
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate mock patients, schedule and appointments.")
+    parser.add_argument("--out-dir", default=os.path.join("app", "data"))
+    parser.add_argument("--patients", type=int, default=500)
+    parser.add_argument("--doctors", type=int, default=2)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--appointments", type=int, default=0, help="bookings to store in appointments.db")
+    parser.add_argument("--slot-minutes", type=int, default=60)
+    parser.add_argument("--start", type=date.fromisoformat, help="first schedule day (default: today)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--xlsx", action="store_true", help="also write doctor_schedule.xlsx")
+    args = parser.parse_args(argv)
+    generate(args.out_dir, args.patients, args.doctors, args.days, args.appointments,
+             args.slot_minutes, args.start, args.seed, xlsx=args.xlsx)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
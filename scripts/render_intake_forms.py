@@ -0,0 +1,34 @@
+# Render intake forms for one day's appointments (default: tomorrow) into a single zip.
+# Run: python scripts/render_intake_forms.py --out app/data/intake_forms.zip [--date YYYY-MM-DD] [--workers N]
+import argparse
+import os
+import sys
+import time
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from agent.appointments import AppointmentRepository  # noqa: E402
+from utils.intake_pdf import intake_filename, render_forms_for_date  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a day's intake forms in bulk.")
+    parser.add_argument("--date", help="appointment date (default: tomorrow)")
+    parser.add_argument("--out", required=True, help="zip archive to write")
+    parser.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    forms = render_forms_for_date(AppointmentRepository(), day=args.date, workers=args.workers)
+    # forms stay in memory; the archive is the only file written
+    with zipfile.ZipFile(args.out, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for row, pdf in forms:
+            name = f"{row['id']}_" + intake_filename(row.get("last_name") or "patient", row["date"])
+            zf.writestr(name, pdf)
+    print(f"Rendered {len(forms)} intake forms in {time.perf_counter() - started:.2f}s -> {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
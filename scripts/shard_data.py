@@ -0,0 +1,45 @@
+# Split app/data (schedule + appointments.db) into per-shard directories for the sharded backend.
+# Run: python scripts/shard_data.py --shards 4
+#      python scripts/shard_data.py --shards 2 --pin "Dr. Smith=0" --pin "Dr. Lee=1"
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from agent.sharding import CONFIG_FILE, SHARDS_DIR, ShardConfig, partition  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Partition the schedule and appointments by doctor.")
+    parser.add_argument("--shards", type=int, required=True)
+    parser.add_argument("--data-dir", default=os.path.dirname(SHARDS_DIR))
+    parser.add_argument("--out-dir", default=SHARDS_DIR)
+    parser.add_argument("--pin", action="append", default=[], metavar="DOCTOR=SHARD",
+                        help="put a doctor on a given shard (e.g. one clinic per shard); others hash")
+    parser.add_argument("--force", action="store_true", help="overwrite an existing shard layout")
+    args = parser.parse_args(argv)
+
+    if os.path.exists(os.path.join(args.out_dir, CONFIG_FILE)) and not args.force:
+        raise SystemExit(f"{args.out_dir} already holds shards; pass --force to re-split")
+    pins = {}
+    for pin in args.pin:
+        doctor, _, k = pin.rpartition("=")
+        if not doctor or not k.strip().lstrip("-").isdigit():
+            parser.error(f"--pin expects DOCTOR=SHARD, got {pin!r}")
+        pins[doctor] = int(k)
+    try:
+        config = ShardConfig(args.shards, pins)
+    except ValueError as e:
+        parser.error(str(e))
+    started = time.perf_counter()
+    summary = partition(args.data_dir, args.out_dir, config)
+    for k, (doctors, appointments) in summary.items():
+        print(f"shard-{k:02d}: {len(doctors)} doctors, {appointments} appointments")
+    print(f"Done in {time.perf_counter() - started:.2f}s -> {args.out_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,31 @@
+# Tests import the app the way its scripts do: with app/ on sys.path.
+import os
+import sys
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+import pytest  # noqa: E402
+
+from agent.appointments import AppointmentRepository  # noqa: E402
+from agent.availability_templates import default_templates  # noqa: E402
+from agent.scheduler import Scheduler  # noqa: E402
+
+DAY = "2030-01-07"  # a Monday; default templates offer Smith and Johnson 09:00-17:00 in hour slots
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """A data directory with recurring availability and an empty appointments DB."""
+    default_templates(str(tmp_path / "availability.json"))
+    return tmp_path
+
+
+@pytest.fixture
+def make_scheduler(data_dir):
+    """Schedulers over the same files, each with its own repository, as separate processes would have."""
+    def make():
+        repo = AppointmentRepository(str(data_dir / "appointments.db"), legacy_xlsx=None)
+        return Scheduler(str(data_dir / "doctor_schedule.xlsx"), repo=repo)
+    return make
@@ -0,0 +1,81 @@
+import http.client
+import json
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from booking_api import make_handler
+
+
+class BrokenService:
+    """Fails every identify() with an error the API doesn't expect."""
+
+    def identify(self, first_name, last_name, dob):
+        raise RuntimeError("database is locked")
+
+
+@pytest.fixture
+def api():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(BrokenService()))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    conn = http.client.HTTPConnection(*server.server_address, timeout=5)
+    yield conn
+    conn.close()
+    server.shutdown()
+    server.server_close()
+
+
+def _post(conn, path, body):
+    data = json.dumps(body).encode()
+    conn.request("POST", path, body=data, headers={"Content-Type": "application/json"})
+    resp = conn.getresponse()
+    return resp.status, json.loads(resp.read())
+
+
+def test_unexpected_error_returns_500_and_keeps_connection(api):
+    status, payload = _post(api, "/identify", {"first_name": "A", "last_name": "B", "dob": "1990-01-01"})
+    assert status == 500
+    assert payload == {"error": "internal error"}
+    # same keep-alive socket still answers
+    status, payload = _post(api, "/identify", {"first_name": "A"})
+    assert status == 400
+    status, _ = _post(api, "/nope", {})
+    assert status == 404
+
+
+def test_appointments_pages_with_cursor(tmp_path):
+    from types import SimpleNamespace
+    from urllib.parse import quote
+
+    from agent.appointments import AppointmentRepository
+    from booking_api import handle
+
+    repo = AppointmentRepository(str(tmp_path / "appointments.db"), legacy_xlsx=None)
+    for i in range(5):
+        repo.add({"first_name": f"P{i}", "last_name": "Smith", "date": "2030-01-07",
+                  "time": f"{9 + i:02d}:00", "doctor": "Smith", "duration": 60})
+    service = SimpleNamespace(scheduler=SimpleNamespace(repo=repo))
+
+    seen, path = [], "/appointments?limit=2&patient=%20"
+    while True:
+        status, payload = handle(service, "GET", path, {})
+        assert status == 200
+        payload = json.loads(json.dumps(payload, default=str))  # what the client receives
+        seen += [r["first_name"] for r in payload["appointments"]]
+        if payload["next_cursor"] is None:
+            break
+        path = "/appointments?limit=2&patient=%20&after=" + quote(json.dumps(payload["next_cursor"]))
+    assert seen == [f"P{i}" for i in range(5)]
+    assert repo.count(patient="   ") == 5
+    assert repo.count(patient=" p3 ") == 1
+
+
+def test_requests_are_logged_as_json(api, caplog, capsys):
+    with caplog.at_level("INFO", logger="ai_scheduler"):
+        _post(api, "/nowhere", {})
+    events = [json.loads(r.getMessage()) for r in caplog.records]
+    request = next(e for e in events if e["event"] == "api_request")
+    assert (request["method"], request["path"], request["status"]) == ("POST", "/nowhere", 404)
+    assert capsys.readouterr().out == ""
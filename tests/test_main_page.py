@@ -0,0 +1,68 @@
+# Smoke test of the Streamlit page: identify -> details -> slots -> book, then the admin view.
+# The page reads and writes app/data, so it runs on a copy of app/ in a fresh interpreter.
+import os
+import shutil
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from conftest import APP_DIR
+
+pytest.importorskip("streamlit")
+pytest.importorskip("dotenv")
+
+DRIVER = textwrap.dedent("""
+    import os, sys
+    from datetime import date, timedelta
+    app_dir = sys.argv[1]
+    sys.path.insert(0, app_dir)
+    from streamlit.testing.v1 import AppTest
+    from agent.availability_templates import default_templates, templates_path_for
+    from agent.scheduler import SCHEDULE_PATH
+
+    default_templates(templates_path_for(SCHEDULE_PATH))  # every day 9-5, so tomorrow has slots
+    at = AppTest.from_file(os.path.join(app_dir, "main.py"), default_timeout=60).run()
+    assert not at.exception, at.exception
+
+    at.text_input(key="first_name_input").input("Smoke")
+    at.text_input(key="last_name_input").input("Test")
+    at.text_input(key="dob_input").input("1990-01-01")
+    at.button[0].click().run()
+    assert not at.exception, at.exception
+    assert at.session_state.patient is not None
+    assert at.session_state.minutes
+
+    at.text_input(key="email_input").input("smoke@example.com")
+    at.text_input(key="phone_input").input("5551234567")
+    at.text_input(key="insurance_input").input("Aetna")
+    next(b for b in at.button if b.label.startswith("Save Details")).click().run()
+    assert not at.exception, at.exception
+    assert at.session_state.available_slots
+
+    at.date_input(key="calendar_date").set_value(date.today() + timedelta(days=1)).run()
+    at.button(key="book_btn").click().run()
+    assert not at.exception, at.exception
+    assert any("booked" in s.value for s in at.success), [s.value for s in at.error]
+
+    at.sidebar.radio[0].set_value("Admin Dashboard").run()
+    at.text_input[0].input(os.getenv("ADMIN_PASS", "admin123"))
+    next(b for b in at.button if b.label == "Login").click().run()
+    assert not at.exception, at.exception
+    assert at.session_state.admin_logged_in
+    print("ok")
+""")
+
+
+def test_patient_flow_and_admin_view(tmp_path):
+    app_copy = tmp_path / "app"
+    shutil.copytree(APP_DIR, app_copy, ignore=shutil.ignore_patterns(
+        "__pycache__", "*.db", "*.db-*", "*.ics", "*.pdf", "schedule", "shards", "locks", "availability.json"))
+    shutil.copy(os.path.join(APP_DIR, "assets", "intake_form.pdf"), app_copy / "assets" / "intake_form.pdf")
+    (app_copy / "data" / "rules.json").write_text("[]")  # the sample rules name doctors the schedule doesn't have
+    env = {**os.environ, "GROQ_API_KEY": "", "SMTP_HOST": "", "METRICS_PORT": "", "METRICS_FILE": ""}
+    proc = subprocess.run([sys.executable, "-c", DRIVER, str(app_copy)], cwd=tmp_path, env=env,
+                          capture_output=True, text=True, timeout=300)
+    assert proc.returncode == 0, proc.stdout + proc.stderr
+    assert proc.stdout.strip().endswith("ok")
@@ -0,0 +1,132 @@
+import json
+import smtplib
+import sqlite3
+from contextlib import contextmanager
+
+import pytest
+
+from agent.outbox import Outbox
+
+
+class FakePool:
+    """Stands in for SMTPPool; `fail` decides what each sendmail does."""
+
+    def __init__(self, fail=None):
+        self.sent = []
+        self.fail = fail
+
+    @contextmanager
+    def connection(self):
+        yield self
+
+    def sendmail(self, from_email, to, message):
+        if self.fail:
+            raise self.fail
+        self.sent.append(to[0])
+
+
+@pytest.fixture(autouse=True)
+def no_smtp(monkeypatch):
+    monkeypatch.delenv("SMTP_HOST", raising=False)
+
+
+def _outbox(tmp_path, pool=None, **kw):
+    box = Outbox(str(tmp_path / "outbox.db"), **kw)
+    box.pool = pool
+    return box
+
+
+def _status(box):
+    conn = sqlite3.connect(box.path)
+    try:
+        return dict(conn.execute("SELECT id, status FROM outbox ORDER BY id").fetchall())
+    finally:
+        conn.close()
+
+
+def test_enqueue_and_drain(tmp_path):
+    pool = FakePool()
+    box = _outbox(tmp_path, pool)
+    box.enqueue("a@example.com", "Hi", "body")
+    box.enqueue_many([{"to_email": "b@example.com", "subject": "Hi", "body": "b"}])
+    assert box.drain_once() == 2
+    assert sorted(pool.sent) == ["a@example.com", "b@example.com"]
+    assert box.stats() == {"sent": 2}
+    assert box.drain_once() == 0
+
+
+def test_live_lease_is_not_taken_over(tmp_path):
+    first = _outbox(tmp_path, FakePool())
+    first.enqueue("a@example.com", "Hi", "body")
+    assert len(first._claim_batch()) == 1
+    # another process opening the outbox must leave the message with the live worker
+    second = _outbox(tmp_path, FakePool())
+    assert second.drain_once() == 0
+    assert _status(second) == {1: "sending"}
+
+
+def test_expired_lease_is_reclaimed_and_stale_owner_ignored(tmp_path):
+    crashed = _outbox(tmp_path, FakePool(), lease_seconds=-1)  # its leases are already over
+    crashed.enqueue("a@example.com", "Hi", "body")
+    row, = crashed._claim_batch()
+    pool = FakePool()
+    taker = _outbox(tmp_path, pool)
+    assert taker.drain_once() == 1
+    assert pool.sent == ["a@example.com"]
+    # the old worker waking up can't put the row back
+    crashed._failed(row, RuntimeError("late"))
+    assert _status(taker) == {1: "sent"}
+
+
+def test_retry_backoff_then_dead_letter(tmp_path):
+    pool = FakePool(fail=smtplib.SMTPRecipientsRefused({"a@example.com": (550, b"no")}))
+    box = _outbox(tmp_path, pool, max_attempts=2, retry_base=0)
+    box.enqueue("a@example.com", "Hi", "body")
+    assert box.drain_once() == 1
+    assert box.stats() == {"pending": 1}
+    assert box.drain_once() == 1
+    assert box.stats() == {"dead": 1}
+    assert box.dead_letters()[0]["attempts"] == 2
+
+    pool.fail = None
+    assert box.retry_dead() == 1
+    assert box.drain_once() == 1
+    assert box.stats() == {"sent": 1}
+
+
+def test_connection_failure_requeues_whole_batch(tmp_path):
+    box = _outbox(tmp_path, FakePool(fail=smtplib.SMTPServerDisconnected("gone")), retry_base=60)
+    for i in range(3):
+        box.enqueue(f"p{i}@example.com", "Hi", "body")
+    assert box.drain_once() == 3
+    assert box.stats() == {"pending": 3}
+    assert box.drain_once() == 0  # backing off
+
+
+def test_migrates_outbox_without_lease_columns(tmp_path):
+    path = str(tmp_path / "outbox.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, to_email TEXT NOT NULL,
+            from_email TEXT NOT NULL, subject TEXT, message BLOB NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL, last_error TEXT, created_at TEXT, sent_at TEXT);
+        INSERT INTO outbox (to_email, from_email, subject, message, status, next_attempt_at)
+            VALUES ('a@example.com', 'x@example.com', 'Hi', X'00', 'sending', 0);
+    """)
+    conn.close()
+    pool = FakePool()
+    box = Outbox(path)
+    box.pool = pool
+    assert box.drain_once() == 1  # a send claimed before leases existed counts as expired
+    assert pool.sent == ["a@example.com"]
+
+
+def test_simulated_delivery_is_logged_as_json(tmp_path, caplog, capsys):
+    outbox = _outbox(tmp_path)
+    outbox.enqueue("a@example.com", "Hello", "Body text")
+    with caplog.at_level("INFO", logger="ai_scheduler"):
+        outbox.drain_once()
+    event = next(json.loads(r.getMessage()) for r in caplog.records if "email_simulated" in r.getMessage())
+    assert (event["to"], event["subject"], event["body"].strip()) == ("a@example.com", "Hello", "Body text")
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,99 @@
+import time
+
+import pytest
+
+from agent.reminder import ReminderScheduler, ReminderStore
+
+
+class FakeOutbox:
+    def __init__(self):
+        self.sent = []
+        self.fail = False
+
+    def enqueue_many(self, messages):
+        messages = list(messages)
+        if self.fail:
+            raise RuntimeError("outbox unavailable")
+        self.sent += [m["body"] for m in messages]
+        return len(messages)
+
+
+def _rows(now, n, start=10):
+    return [{"appointment_id": i, "due_at": now + start + i, "to_email": f"p{i}@example.com",
+             "subject": "Reminder", "body": f"r{i}"} for i in range(n)]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ReminderStore(str(tmp_path / "reminders.db"))
+
+
+def test_truncated_window_waits_for_its_last_row(store):
+    now = time.time()
+    store.add_many(_rows(now, 30))
+    rs = ReminderScheduler(store, FakeOutbox(), batch_size=1, horizon=3600)  # refills load 20 rows
+    rs._refill(now)
+    assert len(rs._heap) == 20
+    # nothing is due yet, so the service thread must have something to wait for
+    assert not rs._needs_refill(now)
+    assert rs._refill_at() > now
+    assert rs.fire_due(now) == 0
+
+
+def test_fire_due_walks_past_truncated_windows(store):
+    now = time.time()
+    store.add_many(_rows(now, 45))
+    outbox = FakeOutbox()
+    rs = ReminderScheduler(store, outbox, batch_size=1, horizon=3600)
+    rs._refill(now)
+    assert rs.fire_due(now + 20) == 11
+    assert rs.fire_due(now + 100) == 34
+    assert sorted(outbox.sent, key=lambda b: int(b[1:])) == [f"r{i}" for i in range(45)]
+    assert rs.fire_due(now + 100) == 0
+
+
+def test_reminders_added_later_and_cancelled(store):
+    now = time.time()
+    outbox = FakeOutbox()
+    rs = ReminderScheduler(store, outbox, horizon=3600)
+    rs._refill(now)
+    rs.add(_rows(now, 3))
+    rs.cancel_for(1)
+    assert rs.fire_due(now + 60) == 2
+    assert outbox.sent == ["r0", "r2"]
+
+
+def test_outbox_failure_keeps_reminders(store):
+    now = time.time()
+    outbox = FakeOutbox()
+    rs = ReminderScheduler(store, outbox, horizon=3600)
+    rs._refill(now)
+    rs.add(_rows(now, 2))
+    outbox.fail = True
+    with pytest.raises(RuntimeError):
+        rs.fire_due(now + 60)
+    outbox.fail = False
+    assert rs.fire_due(now + 60) == 2
+    assert outbox.sent == ["r0", "r1"]
+
+
+def test_claim_without_enqueue_expires_and_fires_elsewhere(store):
+    now = time.time()
+    ids = [rid for _, rid in store.add_many(_rows(now, 2, start=-5))]
+    assert len(store.claim(ids, lease=-1)) == 2  # a process claimed them, then died
+    outbox = FakeOutbox()
+    rs = ReminderScheduler(store, outbox, horizon=3600)
+    assert rs.fire_due(now) == 2
+    assert outbox.sent == ["r0", "r1"]
+    assert store.claim(ids) == []  # fired for good
+
+
+def test_cancel_reaches_claimed_reminders(store):
+    now = time.time()
+    store.add_many(_rows(now, 2, start=-5))
+    claimed = store.claim([1, 2], lease=-1)  # sender died mid-claim: the lease is already over
+    assert len(claimed) == 2
+    assert store.cancel_for(0) == 1
+    store.mark_fired([1])  # a late confirmation from the dead sender changes nothing
+    assert [rid for _, rid in store.pending_before(now + 60, limit=10)] == [2]
+    assert [r["id"] for r in store.claim([1, 2])] == [2]
@@ -0,0 +1,119 @@
+import json
+import threading
+import time
+
+import pytest
+
+from agent import groq_client
+from agent.rule_cache import RuleParseCache
+from agent.rule_grammar import parse_rule_locally
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("New patients should always be booked for 60 minutes.",
+     {"condition": {"patient_type": "new"}, "action": {"duration": 60}}),
+    ("New patients over 65 must be booked for 60 minutes with Dr. Smith",
+     {"condition": {"patient_type": "new", "age_gt": 65}, "action": {"assign_doctor": "Dr. Smith", "duration": 60}}),
+    ("Patients with BlueCross insurance should never see Dr. Johnson",
+     {"condition": {"insurance_company": "BlueCross"}, "action": {"block_doctor": "Dr. Johnson"}}),
+    ("Patients with BlueCross insurance shouldn't see Dr. Johnson",
+     {"condition": {"insurance_company": "BlueCross"}, "action": {"block_doctor": "Dr. Johnson"}}),
+    ("New patients with Aetna insurance must see Dr. Lee",
+     {"condition": {"patient_type": "new", "insurance_company": "Aetna"}, "action": {"assign_doctor": "Dr. Lee"}}),
+    ("Patients over 65 should preferably see Dr. Lee",
+     {"condition": {"age_gt": 65}, "action": {"prefer_doctor": "Dr. Lee"}}),
+    ("Patients whose last name is Doe must see Dr. Smith",
+     {"condition": {"last_name": "Doe"}, "action": {"assign_doctor": "Dr. Smith"}}),
+    ("Patients under 18 should be booked for half an hour",
+     {"condition": {"age_lt": 18}, "action": {"duration": 30}}),
+])
+def test_parses_sentences_it_reads_in_full(text, expected):
+    assert parse_rule_locally(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    # qualifiers the grammar has no field for
+    "New patients must be scheduled only with Dr. Smith in the morning.",
+    "Returning patients should only be scheduled with Dr. Johnson in the afternoon.",
+    "New patients must not see Dr. Smith on Mondays",
+    "New patients see Dr. Smith except on Fridays",
+    "New patients with Aetna insurance need 60 minutes unless they are over 70",
+    # negations that do not attach to the doctor
+    "New patients who are not over 65 see Dr. Smith",
+    "New patients should not be booked for 60 minutes",
+    "New patients are not booked for 30 minutes with Dr. Smith",
+    # two conditions of one kind, two doctors
+    "Patients over 18 and under 65 get 30 minutes",
+    "Returning patients should see Dr. Smith or Dr. Jones",
+    # no condition / no action
+    "Always book Dr. Smith",
+    "New patients are welcome",
+    "",
+])
+def test_falls_back_on_anything_partly_understood(text):
+    assert parse_rule_locally(text) is None
+
+
+@pytest.fixture
+def llm(tmp_path, monkeypatch):
+    """A fake LLM and a fresh parse cache; returns the list of prompts sent."""
+    prompts = []
+
+    def complete(prompt, timeout=None, max_tokens=512):
+        prompts.append(prompt)
+        return json.dumps({"condition": {"patient_type": "new"}, "action": {"assign_doctor": "Dr. Smith",
+                                                                            "time_of_day": "morning"}})
+
+    monkeypatch.setattr(groq_client, "client", object())
+    monkeypatch.setattr(groq_client, "_complete", complete)
+    monkeypatch.setattr(groq_client, "_cache", RuleParseCache(str(tmp_path / "cache.db")))
+    return prompts
+
+
+def test_local_parses_are_not_cached(llm):
+    text = "New patients should always be booked for 60 minutes."
+    assert groq_client.parse_rule_to_json(text) == ({"condition": {"patient_type": "new"},
+                                                     "action": {"duration": 60}}, None)
+    assert groq_client.get_rule_cache().get(text) is None
+    assert llm == []
+
+
+def test_partial_phrasings_reach_the_llm_and_only_its_answer_is_cached(llm):
+    text = "New patients must be scheduled only with Dr. Smith in the morning."
+    parsed, err = groq_client.parse_rule_to_json(text)
+    assert err is None and parsed["action"]["time_of_day"] == "morning"
+    assert len(llm) == 1
+    assert groq_client.get_rule_cache().get(text) == parsed
+    # served from the cache from then on, bulk path included
+    assert groq_client.parse_rules_bulk([text]) == [(parsed, None)]
+    assert len(llm) == 1
+
+
+def test_cache_from_older_versions_is_dropped(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = RuleParseCache(path)
+    cache.put("new patients must see dr. smith in the morning", {"condition": {}, "action": {}})
+    conn = cache._connect()
+    with conn:
+        conn.execute("PRAGMA user_version = 1")
+    conn.close()
+    assert RuleParseCache(path).get("new patients must see dr. smith in the morning") is None
+
+
+def test_sync_parse_gives_up_on_a_slow_llm_without_sleeping(llm, monkeypatch):
+    release = threading.Event()
+
+    def hang(prompt, timeout=None, max_tokens=512):
+        release.wait(5)
+        return "{}"
+
+    monkeypatch.setattr(groq_client, "_complete", hang)
+    monkeypatch.setattr(time, "sleep", lambda s: pytest.fail("blocking sleep between retries"))
+    started = time.perf_counter()
+    try:
+        parsed, err = groq_client.parse_rule_to_json("New patients see Dr. Smith on Mondays",
+                                                     max_retries=2, backoff=0.01, timeout=0.2)
+    finally:
+        release.set()
+    assert parsed is None and "timed out" in err
+    assert time.perf_counter() - started < 3
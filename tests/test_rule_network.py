@@ -0,0 +1,145 @@
+import json
+import os
+import random
+import threading
+from datetime import date
+
+import pytest
+
+from agent.rule_network import SUBSTRING_SCAN_MAX, RuleNetwork
+from agent.rules import CompiledRule, RuleSet, apply_rules
+
+DOCTORS = ["Dr. Smith", "Dr. Johnson", "Dr. Lee", "Dr. Smithers"]
+INSURERS = ["BlueCross", "Aetna", "Cigna", "blue", "cross", "", "United Health"]
+
+
+def _condition(rng):
+    pool = [
+        ("patient_type", lambda: rng.choice(["new", "returning", "walk-in"])),
+        ("age_gt", lambda: rng.choice([17, 18, 40.5, 65, "65", "abc"])),
+        ("age_gte", lambda: rng.choice([18, 40, 65.5])),
+        ("age_lt", lambda: rng.choice([18, 40, 65])),
+        ("age_lte", lambda: rng.choice([17, 40, 64.5])),
+        ("insurance_company", lambda: rng.choice(INSURERS)),
+        ("last_name", lambda: rng.choice(["Doe", "o", "Smith-Jones"])),
+        ("member_id", lambda: rng.choice([7, 7.0, True, None])),
+        ("group_number", lambda: rng.choice([[1, 2], {"a": 1}])),  # unhashable: evaluated directly
+    ]
+    return {key: value() for key, value in rng.sample(pool, rng.randint(0, 3))}
+
+
+def _action(rng):
+    action = {}
+    for key in rng.sample(["assign_doctor", "block_doctor", "prefer_doctor", "duration"], rng.randint(1, 2)):
+        action[key] = rng.choice([15, 30, 60]) if key == "duration" else rng.choice(DOCTORS + ["smith", "lee"])
+    return action
+
+
+def _patient(rng):
+    today = date.today()
+    dob = rng.choice([
+        f"{today.year - rng.choice([17, 18, 40, 64, 65, 66])}-{today.month:02d}-{today.day:02d}",
+        f"{today.year - 65}-01-01", f"{today.year - 18}-12-31", "not a date", None,
+    ])
+    core = {"first_name": "P", "last_name": rng.choice(["Doe", "Smith-Jones", "Lee", "ROE"]),
+            "dob": dob, "is_new": rng.random() < 0.5}
+    details = {}
+    insurer = rng.choice(INSURERS + ["BLUECROSS of Somewhere " * 4, None, 42])
+    (details if rng.random() < 0.7 else core)["insurance_company"] = insurer
+    if rng.random() < 0.5:
+        details["member_id"] = rng.choice([7, 1, True, "7"])
+    if rng.random() < 0.3:
+        details["group_number"] = rng.choice([[1, 2], {"a": 1}, "g"])
+    return core, details
+
+
+def _slots():
+    return [{"date": "2030-01-07", "time": f"{h:02d}:00", "doctor": d.replace("Dr. ", "")}
+            for h in range(9, 12) for d in DOCTORS]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_network_matches_like_a_linear_scan(seed):
+    rng = random.Random(seed)
+    rules = [{"rule": {"condition": _condition(rng), "action": _action(rng)}} for _ in range(rng.randint(1, 40))]
+    compiled = [CompiledRule(e["rule"]) for e in rules]
+    network = RuleNetwork(compiled)
+    slots = _slots()
+    for _ in range(50):
+        core, details = _patient(rng)
+        expected = [i for i, r in enumerate(compiled) if r.matches(core, details)]
+        assert network.match_ids(core, details) == expected
+        assert apply_rules(core, details, slots, rules) == apply_rules(core, details, slots, network.match(core, details))
+
+
+def test_long_values_are_checked_needle_by_needle():
+    network = RuleNetwork([CompiledRule({"condition": {"insurance_company": "cross"}, "action": {"duration": 30}})])
+    long_value = "x" * SUBSTRING_SCAN_MAX + " BlueCross"
+    assert network.match_ids({}, {"insurance_company": long_value}) == [0]
+    assert network.match_ids({}, {"insurance_company": "x" * (SUBSTRING_SCAN_MAX + 1)}) == []
+
+
+def test_ruleset_apply_agrees_with_apply_rules(tmp_path):
+    rng = random.Random(7)
+    rules = [{"rule": {"condition": _condition(rng), "action": _action(rng)}} for _ in range(25)]
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(rules))
+    ruleset = RuleSet(str(path)).current()
+    slots = _slots()
+    for _ in range(100):
+        core, details = _patient(rng)
+        expected = apply_rules(core, details, slots, rules)
+        assert ruleset.apply(core, details, slots, slots_version="v1") == expected
+        assert ruleset.apply(core, details, slots, slots_version="v1") == expected  # memoized
+
+
+def test_rule_sets_starting_on_a_missing_file_keep_every_add(tmp_path):
+    path = str(tmp_path / "data" / "rules.json")
+    sets = [RuleSet(path) for _ in range(6)]
+
+    def worker(n):
+        sets[n].current()
+        sets[n].add([({"condition": {"last_name": f"P{n}"}, "action": {"duration": 30}}, None)])
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(len(sets))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(RuleSet(path).current().entries) == len(sets)
+    # its own lock file, not one of the booking stripes
+    assert sorted(os.listdir(tmp_path / "data")) == ["rules.json", "rules.json.lock"]
+
+
+def _kinds(*rules):
+    network = RuleNetwork([CompiledRule({"condition": c, "action": a}) for c, a in rules])
+    return sorted((f["kind"], tuple(f["rules"])) for f in network.analyze())
+
+
+def test_analyze_finds_each_kind():
+    assert _kinds(({"age_gte": 70, "age_lt": 60}, {"duration": 30})) == [("never_matches", (0,))]
+    assert _kinds(({"age_gt": "abc"}, {"duration": 30})) == [("never_matches", (0,))]
+    assert _kinds(({"patient_type": "new"}, {"duration": 30}),
+                  ({"patient_type": "new"}, {"duration": 30})) == [("duplicate", (0, 1))]
+    assert _kinds(({"patient_type": "new", "age_gt": 65}, {"duration": 60}),
+                  ({"patient_type": "new"}, {"duration": 30})) == [("shadowed", (0, 1))]
+    assert _kinds(({"patient_type": "new"}, {"duration": 60}),
+                  ({"age_gt": 65}, {"duration": 30})) == [("duration_conflict", (0, 1))]
+    assert _kinds(({"patient_type": "new"}, {"assign_doctor": "Dr. Smith"}),
+                  ({"age_gt": 65}, {"assign_doctor": "Dr. Lee"})) == [("assign_conflict", (0, 1))]
+    assert _kinds(({"patient_type": "new"}, {"assign_doctor": "Dr. Smith"}),
+                  ({"insurance_company": "Aetna"}, {"block_doctor": "Smith"})) == [("assign_blocked", (0, 1))]
+    assert _kinds(({"age_lt": 18}, {"prefer_doctor": "Dr. Lee"}),
+                  ({"age_lt": 30}, {"block_doctor": "Dr. Lee"})) == [("prefer_blocked", (0, 1))]
+
+
+def test_analyze_leaves_exclusive_rules_alone():
+    assert _kinds(({"patient_type": "new"}, {"duration": 60}),
+                  ({"patient_type": "returning"}, {"duration": 30})) == []
+    assert _kinds(({"age_lt": 18}, {"assign_doctor": "Dr. Smith"}),
+                  ({"age_gte": 18}, {"assign_doctor": "Dr. Lee"})) == []
+    assert _kinds(({"insurance_company": "Aetna"}, {"assign_doctor": "Dr. Smith"}),
+                  ({"insurance_company": "Cigna"}, {"block_doctor": "Dr. Smith"})) == []
+    # a more specific rule after a general one wins where it applies: not shadowed
+    assert _kinds(({"patient_type": "new"}, {"duration": 30}),
+                  ({"patient_type": "new", "age_gt": 65}, {"duration": 60})) == []
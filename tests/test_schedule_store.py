@@ -0,0 +1,88 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from agent import schedule_store
+from agent.schedule_store import CURRENT_FILE, ScheduleStore
+
+
+def _frame(doctors, days=("2030-01-08", "2030-01-07"), times=("10:00", "09:00")):
+    rows = [{"date": d, "time": t, "doctor": doc, "available": (i % 3) != 0}
+            for i, (doc, d, t) in enumerate((doc, d, t) for doc in doctors for d in days for t in times)]
+    return pd.DataFrame(rows)
+
+
+def _sorted(df):
+    return df.sort_values(["doctor", "date", "time"]).reset_index(drop=True)
+
+
+def test_round_trip(tmp_path):
+    df = _frame(["Smith", "Adams"])
+    ScheduleStore(str(tmp_path)).from_dataframe(df)
+    store = ScheduleStore(str(tmp_path)).load()
+    assert store.doctors == ["Adams", "Smith"]
+    pd.testing.assert_frame_equal(store.to_dataframe(), _sorted(df))
+    assert store.dates() == ["2030-01-07", "2030-01-08"]
+
+    before = store.stamp()
+    assert store.set_available("2030-01-08", "10:00", "Smith", False)
+    assert not store.set_available("2030-01-09", "10:00", "Smith", False)  # not in the schedule
+    assert store.stamp() != before
+    again = ScheduleStore(str(tmp_path)).load().to_dataframe()
+    row = again[(again.doctor == "Smith") & (again.date == "2030-01-08") & (again.time == "10:00")]
+    assert not row.available.item()
+
+
+def test_loaded_reader_keeps_its_generation(tmp_path):
+    old = ScheduleStore(str(tmp_path)).from_dataframe(_frame(["Smith", "Adams"]))
+    expected = old.to_dataframe()
+    writer = ScheduleStore(str(tmp_path))
+    for doctors in (["Chen"], ["Diaz", "Evans", "Baker"]):
+        writer.from_dataframe(_frame(doctors, days=("2031-05-01",)))
+    # the old reader's columns and doctor names still belong together
+    pd.testing.assert_frame_equal(old.to_dataframe(), expected)
+    fresh = ScheduleStore(str(tmp_path)).load()
+    assert fresh.doctors == ["Baker", "Diaz", "Evans"] and fresh.dates() == ["2031-05-01"]
+    # only the live generation and the one it replaced are kept
+    assert len([e for e in os.listdir(tmp_path) if e.startswith("gen-")]) == 2
+
+
+def test_failed_write_leaves_the_old_generation_live(tmp_path, monkeypatch):
+    ScheduleStore(str(tmp_path)).from_dataframe(_frame(["Smith"]))
+    saved = []
+    real_save = np.save
+
+    def save(f, arr):
+        if len(saved) == 2:
+            raise OSError("disk full")
+        saved.append(arr)
+        real_save(f, arr)
+
+    monkeypatch.setattr(schedule_store.np, "save", save)
+    with pytest.raises(OSError):
+        ScheduleStore(str(tmp_path)).from_dataframe(_frame(["Adams", "Baker"], days=("2031-05-01",)))
+    monkeypatch.undo()
+    store = ScheduleStore(str(tmp_path)).load()
+    pd.testing.assert_frame_equal(store.to_dataframe(), _sorted(_frame(["Smith"])))
+
+
+def test_reads_and_upgrades_the_flat_layout(tmp_path):
+    ScheduleStore(str(tmp_path)).from_dataframe(_frame(["Smith"]))
+    # rebuild the pre-generation layout: column files directly in the store directory
+    generation = (tmp_path / CURRENT_FILE).read_text()
+    for entry in os.listdir(tmp_path / generation):
+        shutil.move(str(tmp_path / generation / entry), str(tmp_path / entry))
+    (tmp_path / generation).rmdir()
+    (tmp_path / CURRENT_FILE).unlink()
+
+    store = ScheduleStore(str(tmp_path))
+    assert store.exists()
+    pd.testing.assert_frame_equal(store.load().to_dataframe(), _sorted(_frame(["Smith"])))
+    assert store.set_available("2030-01-07", "09:00", "Smith", True)
+
+    store.from_dataframe(_frame(["Adams"]))
+    assert not list(tmp_path.glob("*.npy")) and not (tmp_path / "meta.json").exists()
+    assert ScheduleStore(str(tmp_path)).load().doctors == ["Adams"]
@@ -0,0 +1,135 @@
+import threading
+
+import pytest
+
+from agent.appointments import AppointmentRepository, SlotConflict
+from conftest import DAY
+
+
+def _times(scheduler, doctor="Smith", minutes=60):
+    return [s["time"] for s in scheduler.get_available_slots(minutes, DAY, doctor)]
+
+
+def test_same_slot_from_two_repositories_books_once(make_scheduler):
+    a, b = make_scheduler(), make_scheduler()
+    first = a.book_slot(DAY, "10:00", "Smith", {"first_name": "A"}, minutes=60)
+    second = b.book_slot(DAY, "10:00", "Smith", {"first_name": "B"}, minutes=60)
+    assert first and not second
+    assert "10:00" not in _times(a) and "10:00" not in _times(b)
+
+
+def test_overlapping_claim_from_second_repository_conflicts(make_scheduler):
+    a, b = make_scheduler().repo, make_scheduler().repo
+    held = a.add({"date": DAY, "time": "10:00", "doctor": "Smith", "duration": 60})
+    with pytest.raises(SlotConflict) as e:
+        b.add({"date": DAY, "time": "10:30", "doctor": "Smith", "duration": 60})
+    assert e.value.holders == [held]
+    assert b.add({"date": DAY, "time": "11:00", "doctor": "Smith", "duration": 60})
+    assert len(b.by_doctor("Smith", DAY)) == 2  # the refused row was rolled back
+
+
+def test_concurrent_bookings_across_schedulers(make_scheduler):
+    schedulers = [make_scheduler() for _ in range(4)]
+    wins = []
+    lock = threading.Lock()
+
+    def worker(s, n):
+        for t in ("09:00", "10:00", "11:00"):
+            if s.book_slot(DAY, t, "Smith", {"first_name": f"p{n}"}, minutes=60):
+                with lock:
+                    wins.append(t)
+
+    threads = [threading.Thread(target=worker, args=(s, i)) for i, s in enumerate(schedulers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(wins) == ["09:00", "10:00", "11:00"]
+
+
+def test_booking_keeps_changes_other_processes_made_meanwhile(make_scheduler):
+    a, b = make_scheduler(), make_scheduler()
+    assert "14:00" in _times(a, "Johnson")
+    add = a.repo.add
+
+    def add_after_remote_booking(record):
+        # another process books Johnson 14:00 between a's refresh and its own write
+        assert b.book_slot(DAY, "14:00", "Johnson", {"first_name": "B"}, minutes=60)
+        return add(record)
+
+    a.repo.add = add_after_remote_booking
+    assert a.book_slot(DAY, "09:00", "Smith", {"first_name": "A"}, minutes=60)
+    a.repo.add = add
+    assert "14:00" not in _times(a, "Johnson")
+
+
+def test_cancel_elsewhere_frees_the_slot(make_scheduler):
+    a, b = make_scheduler(), make_scheduler()
+    booked = a.book_slot(DAY, "15:00", "Smith", {"first_name": "A"}, minutes=60)
+    assert "15:00" not in _times(b)
+    b.cancel_appointment(booked.appointment_id, "test")
+    assert "15:00" in _times(a)
+
+
+def test_blocks_from_two_schedulers_both_persist(make_scheduler, data_dir):
+    a, b = make_scheduler(), make_scheduler()  # both loaded the file before either block
+    assert a.block_time("Smith", f"{DAY} 09:00", f"{DAY} 10:00", "a")
+    assert b.block_time("Smith", f"{DAY} 11:00", f"{DAY} 12:00", "b")
+    assert "09:00" not in _times(b)  # b picked up a's block when it rewrote the file
+    fresh = make_scheduler()
+    assert {bl["reason"] for bl in fresh.templates.blocks} == {"a", "b"}
+    assert not {"09:00", "11:00"} & set(_times(fresh))
+    assert not list(data_dir.glob("*.tmp"))
+
+
+def test_concurrent_blocks_are_not_lost(make_scheduler):
+    schedulers = [make_scheduler() for _ in range(4)]
+
+    def worker(s, n):
+        for h in range(n, 8, 4):
+            s.block_time("Johnson", f"{DAY} {9 + h:02d}:00", f"{DAY} {9 + h:02d}:30", f"block {h}")
+
+    threads = [threading.Thread(target=worker, args=(s, n)) for n, s in enumerate(schedulers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(make_scheduler().templates.blocks) == 8
+    assert _times(make_scheduler(), "Johnson") == []
+
+
+@pytest.mark.parametrize("date, time, minutes", [
+    (DAY, "09:25", 60),   # between two offered starts
+    (DAY, "10:40", 5),
+    (DAY, "10:02", 60),   # inside the 10:00 unit, but not 10:00
+    (DAY, "18:00", 60),   # after hours
+    ("2020-01-07", "09:00", 60),  # in the past
+])
+def test_only_offered_slot_starts_can_be_booked(make_scheduler, date, time, minutes):
+    s = make_scheduler()
+    assert not s.book_slot(date, time, "Smith", {"first_name": "A"}, minutes=minutes)
+    assert s.repo.by_doctor("Smith", date) == []
+    assert {"09:00", "10:00"} <= set(_times(s))
+
+
+def test_resetting_an_uncached_day_still_bumps_the_index_version(make_scheduler):
+    s = make_scheduler()
+    s.index.invalidate()
+    version = s.index.version
+    s.index.reset_day(DAY, "Smith", [])
+    assert s.index.version > version
+
+
+def test_rows_without_a_duration_hold_a_whole_slot(data_dir, make_scheduler):
+    # imported before any schedule was loaded, as a legacy workbook is
+    repo = AppointmentRepository(str(data_dir / "appointments.db"), legacy_xlsx=None)
+    repo.import_records([{"date": DAY, "time": "10:00", "doctor": "Smith", "first_name": "Legacy",
+                         "status": "Scheduled"}])
+    legacy = repo.by_doctor("Smith", DAY)[0]["id"]
+    s = make_scheduler()
+    assert s.repo.get(legacy)["duration"] == 60
+    with pytest.raises(SlotConflict):
+        s.repo.add({"date": DAY, "time": "10:30", "doctor": "Smith", "duration": 30})
+    assert not s.book_slot(DAY, "10:00", "Smith", {"first_name": "B"}, minutes=60)
+    assert s.repo.add({"date": DAY, "time": "11:00", "doctor": "Smith"})
+    assert s.repo.by_doctor("Smith", DAY)[-1]["duration"] == 60
@@ -0,0 +1,112 @@
+import os
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+from agent import rules as rules_mod
+from agent.appointments import AppointmentRepository
+from agent.availability_templates import default_templates
+from agent.booking_service import BookingService, Patient
+from agent.scheduler import Scheduler
+from agent.sharding import ShardConfig, ShardRouter, partition
+from agent.waitlist import plan_waitlist
+from conftest import DAY
+
+DOCTORS = ("Adams", "Baker", "Chen", "Diaz", "Evans")
+
+
+def _key(slots):
+    return sorted((s["date"], s["time"], s["doctor"]) for s in slots)
+
+
+@pytest.fixture
+def cluster(tmp_path):
+    """(single-node Scheduler, ShardRouter over the same data split into 2 shards)."""
+    data = tmp_path / "data"
+    data.mkdir()
+    default_templates(str(data / "availability.json"), doctors=DOCTORS)
+    single = Scheduler(str(data / "doctor_schedule.xlsx"),
+                       repo=AppointmentRepository(str(data / "appointments.db"), legacy_xlsx=None))
+    for i, doctor in enumerate(DOCTORS):
+        single.book_slot(DAY, f"{9 + i:02d}:00", doctor, {"first_name": f"P{i}", "last_name": "Seed"})
+    partition(str(data), str(tmp_path / "shards"), ShardConfig(2))
+    router = ShardRouter(str(tmp_path / "shards"))
+    yield single, router
+    router.close()
+
+
+def test_router_answers_like_a_single_scheduler(cluster):
+    single, router = cluster
+    assert router.doctors() == single.doctors()
+    assert _key(router.get_available_slots(60, DAY)) == _key(single.get_available_slots(60, DAY))
+    assert _key(router.get_available_slots(120, DAY, "Chen")) == _key(single.get_available_slots(120, DAY, "Chen"))
+    assert router.repo.count() == single.repo.count() == len(DOCTORS)
+
+    rows, cursor, seen = [], None, []
+    while True:
+        rows, cursor = router.repo.query(sort="doctor", after=cursor, limit=2)
+        seen += rows
+        if cursor is None:
+            break
+    assert [r["doctor"] for r in seen] == sorted(DOCTORS)
+
+
+def test_shards_lock_in_their_own_directories(cluster, tmp_path):
+    _, router = cluster
+    for doctor in DOCTORS:
+        assert router.book_slot(DAY, "16:00", doctor, {"first_name": "L"}, minutes=60)
+    used = {k for k in range(router.n) if list((tmp_path / "shards" / f"shard-{k:02d}" / "locks").glob("*.lock"))}
+    assert used == {router.config.shard_for(d) for d in DOCTORS}
+
+
+@pytest.mark.parametrize("pins", [{"Adams": 2}, {"Adams": -1}, {"Adams": "x"}])
+def test_pins_must_name_an_existing_shard(pins):
+    with pytest.raises(ValueError):
+        ShardConfig(2, pins)
+
+
+def test_shard_data_rejects_bad_pins(tmp_path, capsys):
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+    import shard_data
+    for pin in ("Adams=2", "Adams=-1", "Adams"):
+        with pytest.raises(SystemExit):
+            shard_data.main(["--shards", "2", "--out-dir", str(tmp_path / "out"), "--pin", pin])
+    assert "shards are 0..1" in capsys.readouterr().err
+    assert not (tmp_path / "out").exists()
+
+
+def test_router_booking_conflict_and_cancel(cluster):
+    _, router = cluster
+    booked = router.book_slot(DAY, "15:00", "Baker", {"first_name": "X", "last_name": "Y"}, minutes=60)
+    assert booked
+    again = router.book_slot(DAY, "15:00", "Baker", {"first_name": "Z", "last_name": "Y"}, minutes=60)
+    assert not again
+    assert router.repo.get(booked.appointment_id)["first_name"] == "X"
+    assert "15:00" not in [s["time"] for s in router.get_available_slots(60, DAY, "Baker")]
+    router.cancel_appointment(booked.appointment_id, "test")
+    assert "15:00" in [s["time"] for s in router.get_available_slots(60, DAY, "Baker")]
+
+
+def test_waitlist_plans_across_shards(cluster, tmp_path, monkeypatch):
+    single, router = cluster
+    # the planner searches the open window, which starts today
+    day = (date.today() + timedelta(days=1)).isoformat()
+    router.book_slot(day, "09:00", "Adams", {"first_name": "Taken"}, minutes=60)
+    single.book_slot(day, "09:00", "Adams", {"first_name": "Taken"}, minutes=60)
+    patients = [Patient(f"W{i}", "List", "1980-01-01", is_new=bool(i % 2)) for i in range(12)]
+
+    def plan(index):
+        return plan_waitlist(index, patients, [], date_from=day, date_to=day)
+
+    sharded = plan(router.index)
+    assert len(sharded.placements) == len(patients)
+    assert sharded == plan(single.index)
+    assert ("09:00", "Adams") not in {(p.time, p.doctor) for p in sharded.placements}
+
+    rules_path = tmp_path / "rules.json"
+    rules_path.write_text("[]")
+    monkeypatch.setattr(rules_mod, "RULES_PATH", str(rules_path))
+    service = BookingService(scheduler=router)
+    result = service.schedule_waitlist(patients, date_from=day, date_to=day, dry_run=True)
+    assert result == sharded
@@ -0,0 +1,47 @@
+import threading
+from datetime import date, timedelta
+
+from agent.availability import AvailabilityIndex
+from agent.booking_service import Patient
+from agent.waitlist import plan_waitlist
+
+
+def _patients(n):
+    return [Patient(f"W{i}", "List", "1980-01-01", is_new=False) for i in range(n)]
+
+
+def test_past_dates_are_not_candidates():
+    past = (date.today() - timedelta(days=3)).isoformat()
+    future = (date.today() + timedelta(days=3)).isoformat()
+    rows = [("Smith", day, f"{h:02d}:00", True) for day in (past, future) for h in range(9, 11)]
+    index = AvailabilityIndex.build(rows)
+    plan = plan_waitlist(index, _patients(3), [])
+    assert [p.date for p in plan.placements] == [future, future]
+    assert plan.unplaced == [2]
+
+
+class _CheckedIndex:
+    """Forwards to an index and records whether the lock was held for every read."""
+
+    def __init__(self, index, lock):
+        self.index, self.lock, self.unlocked_reads = index, lock, 0
+
+    def _check(self):
+        if not self.lock.locked():
+            self.unlocked_reads += 1
+
+    def slots(self, **kwargs):
+        self._check()
+        return self.index.slots(**kwargs)
+
+    def free_bits(self, date, doctor):
+        self._check()
+        return self.index.free_bits(date, doctor)
+
+
+def test_index_is_read_under_the_lock(make_scheduler):
+    s = make_scheduler()
+    lock = threading.Lock()
+    checked = _CheckedIndex(s.index, lock)
+    plan = plan_waitlist(checked, _patients(5), [], lock=lock)
+    assert len(plan.placements) == 5 and checked.unlocked_reads == 0